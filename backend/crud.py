@@ -2,10 +2,23 @@
 
 from sqlalchemy.orm import Session, joinedload
 import models, schemas
+import reading_archive
+import reading_blocks
+import reading_partitions
+from services.sensor_cache import sensor_cache
+from services.alert_rules import alert_engine
+from services.ingest_dedupe import sequence_tracker
+from services.device_liveness import device_liveness
+from services.notification_dispatcher import notification_dispatcher
+from services.notifications import queue_alert_notification
 from datetime import datetime, timezone, timedelta
-from sqlalchemy import func
+from sqlalchemy import func, select, case, and_, or_
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError
 
+import json
 import logging
+import threading
 
 
 # System config
@@ -22,15 +35,32 @@ def get_system_config(db: Session):
 
 def update_system_config(db: Session, config_update: schemas.SystemConfigUpdate):
     config = get_system_config(db)
-    for key, value in config_update.dict(exclude_unset=True).items():
+    changes = config_update.dict(exclude_unset=True)
+    if "reading_interval" in changes and changes["reading_interval"] != config.reading_interval:
+        bump_config_version(db)
+    for key, value in changes.items():
         setattr(config, key, value)
     db.commit()
     db.refresh(config)
+    if "device_timeout" in changes and config.device_timeout:
+        device_liveness.set_timeout(config.device_timeout)
     return config
 
 
-def build_heartbeat_config(db: Session, device_id: str):
-    device = get_device_by_device_id(db, device_id)
+def bump_config_version(db: Session, device_id: str = None):
+    """Make devices re-fetch their heartbeat config; every device when device_id is None.
+
+    Call before committing any change to what build_heartbeat_config returns.
+    """
+    query = db.query(models.Device)
+    if device_id is not None:
+        query = query.filter(models.Device.device_id == device_id)
+    query.update({models.Device.config_version: func.coalesce(models.Device.config_version, 1) + 1},
+                 synchronize_session=False)
+
+
+def build_heartbeat_config(db: Session, device_id: str, device: models.Device = None):
+    device = device or get_device_by_device_id(db, device_id)
     if not device:
         return None
     sys_config = get_system_config(db)
@@ -49,6 +79,10 @@ def build_heartbeat_config(db: Session, device_id: str):
         if s.threshold:
             sc["threshold_min"] = s.threshold.min_moisture
             sc["threshold_max"] = s.threshold.max_moisture
+        if s.report_mode == models.ReportMode.on_change:
+            sc["report_mode"] = models.ReportMode.on_change.value
+            sc["report_deadband"] = s.report_deadband or models.DEFAULT_REPORT_DEADBAND
+            sc["report_max_silence"] = s.report_max_silence or models.DEFAULT_REPORT_MAX_SILENCE
         sensor_configs.append(sc)
 
     return {
@@ -56,6 +90,7 @@ def build_heartbeat_config(db: Session, device_id: str):
         "device_id": device.device_id,
         "name": device.name,
         "firmware_version": device.firmware_version,
+        "config_version": device.config_version or 1,
         "reading_interval": sys_config.reading_interval,
         "sensors": sensor_configs,
     }
@@ -110,8 +145,11 @@ def update_sensor(db: Session, sensor_id: int, sensor_update: schemas.SensorUpda
     if db_sensor:
         for key, value in sensor_update.dict(exclude_unset=True).items():
             setattr(db_sensor, key, value)
+        bump_config_version(db, db_sensor.device_id)
         db.commit()
         db.refresh(db_sensor)
+        sensor_cache.invalidate_sensor(db_sensor.id)
+        alert_engine.invalidate()
     return db_sensor
 
 
@@ -126,6 +164,7 @@ def create_sensor(db: Session, sensor: schemas.SensorCreate):
         name=sensor.name
     )
     db.add(db_sensor)
+    bump_config_version(db, db_device.device_id)
     db.commit()
     db.refresh(db_sensor)
     return db_sensor
@@ -138,67 +177,272 @@ def compute_calibrated_moisture(raw_adc: float, cal_dry: float, cal_wet: float)
     return max(0.0, min(100.0, round(pct, 1)))
 
 
+# Device clocks may run a little fast; timestamps further ahead are replaced by server time
+MAX_CLOCK_SKEW = timedelta(minutes=5)
+# Backfilled readings older than this are stored and folded into sensor_state
+# but don't raise alerts, which would only describe the past
+LIVE_READING_WINDOW = timedelta(minutes=15)
+
+
+def _reading_timestamp(timestamp, now: datetime) -> datetime:
+    if timestamp is None:
+        return now
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    else:
+        timestamp = timestamp.astimezone(timezone.utc)
+    if timestamp > now + MAX_CLOCK_SKEW:
+        return now
+    return timestamp
+
+
 def create_reading(db: Session, reading: schemas.ReadingCreate):
-    db_device = get_device_by_device_id(db, device_id=reading.device_id)
-    if not db_device:
-        raise ValueError(f"Device with device_id {reading.device_id} not found")
+    return create_readings(db, [reading])[0]
 
-    db_sensor = get_sensor_by_sensor_id(db, device_id=reading.device_id, sensor_id=reading.sensor_id)
-    if not db_sensor:
-        db_sensor = create_sensor(db, schemas.SensorCreate(device_id=reading.device_id, sensor_id=reading.sensor_id))
-
-    moisture = reading.moisture
-    if (reading.raw_adc is not None
-            and db_sensor.calibration_dry is not None
-            and db_sensor.calibration_wet is not None):
-        moisture = compute_calibrated_moisture(
-            reading.raw_adc, db_sensor.calibration_dry, db_sensor.calibration_wet
-        )
 
-    db_reading = models.Reading(
-        device_id=reading.device_id,
-        sensor_id=db_sensor.id,
-        moisture=moisture,
-        raw_adc=reading.raw_adc,
-        timestamp=datetime.now(timezone.utc)
+def device_exists(db: Session, device_id: str) -> bool:
+    return sensor_cache.has_device(db, device_id)
+
+
+def create_readings(db: Session, readings: list[schemas.ReadingCreate]):
+    """Insert a batch of readings in a single transaction.
+
+    Threshold alerts and auto-watering detection run per reading exactly as
+    they would for individual inserts; alert notifications are queued in the
+    same transaction and delivered by the notification dispatcher.
+    Sensor identity, calibration and thresholds come from the sensor cache,
+    so a warm insert only costs the INSERT itself.
+
+    Readings stamped with boot_id/seq that were already stored (a retried
+    upload) are not inserted again; the stored reading is returned in their
+    place.
+    """
+    new_alerts = []
+    new_sensor_ids = []
+    db_readings = []
+    seq_marks = {}
+    alert_undo = {}
+    try:
+        duplicates = _add_readings(db, readings, db_readings, new_alerts, new_sensor_ids, seq_marks, alert_undo)
+        db.commit()
+    except Exception:
+        # Sensors auto-created in this transaction are gone after rollback,
+        # and so are the alerts whose cooldowns started
+        for sensor_db_id in new_sensor_ids:
+            sensor_cache.invalidate_sensor(sensor_db_id)
+        alert_engine.rollback(alert_undo)
+        raise
+
+    sequence_tracker.advance(seq_marks)
+    if duplicates:
+        sequence_tracker.count_duplicates(duplicates)
+        logging.info(f"Skipped {duplicates} duplicate reading(s)")
+    if new_alerts:
+        notification_dispatcher.wake()
+
+    return db_readings
+
+
+def _add_readings(db: Session, readings, db_readings: list, new_alerts: list, new_sensor_ids: list, seq_marks: dict, alert_undo: dict) -> int:
+    jump_threshold = None
+    duplicates = 0
+    added = {}  # dedupe key -> reading added in this transaction
+    for reading in readings:
+        sensor = sensor_cache.resolve(db, reading.device_id, reading.sensor_id)
+        if sensor is None:
+            if not device_exists(db, reading.device_id):
+                raise ValueError(f"Device with device_id {reading.device_id} not found")
+            db_sensor = models.Sensor(device_id=reading.device_id, sensor_id=reading.sensor_id)
+            db.add(db_sensor)
+            db.flush()
+            new_sensor_ids.append(db_sensor.id)
+            sensor = sensor_cache.put(db_sensor)
+
+        dedupe_key = None
+        if reading.boot_id is not None and reading.seq is not None:
+            dedupe_key = (reading.device_id, reading.boot_id, reading.seq, sensor.id)
+            existing = added.get(dedupe_key)
+            if existing is None:
+                existing = sequence_tracker.find_existing(db, reading.device_id, reading.boot_id, reading.seq, sensor.id)
+            if existing is not None:
+                duplicates += 1
+                db_readings.append(existing)
+                continue
+
+        moisture = reading.moisture
+        if (reading.raw_adc is not None
+                and sensor.calibration_dry is not None
+                and sensor.calibration_wet is not None):
+            moisture = compute_calibrated_moisture(
+                reading.raw_adc, sensor.calibration_dry, sensor.calibration_wet
+            )
+
+        now = datetime.now(timezone.utc)
+        timestamp = _reading_timestamp(reading.timestamp, now)
+
+        try:
+            db_reading = reading_partitions.insert_reading(db, {
+                "device_id": reading.device_id,
+                "sensor_id": sensor.id,
+                "moisture": moisture,
+                "raw_adc": reading.raw_adc,
+                "boot_id": reading.boot_id,
+                "seq": reading.seq,
+                "timestamp": timestamp,
+                "is_demo": sensor.is_demo,
+            })
+        except IntegrityError:
+            # A concurrent retry of the same frame committed it after our
+            # dedupe check. SQLite only undid the failed statement, so the
+            # rest of the batch carries on.
+            existing = None
+            if dedupe_key is not None:
+                existing = sequence_tracker.stored_reading(db, reading.device_id, reading.boot_id, reading.seq, sensor.id)
+            if existing is None:
+                raise
+            duplicates += 1
+            db_readings.append(existing)
+            continue
+        db_readings.append(db_reading)
+        if dedupe_key is not None:
+            added[dedupe_key] = db_reading
+            boot = (reading.device_id, reading.boot_id)
+            seq_marks[boot] = max(seq_marks.get(boot, -1), reading.seq)
+
+        # Evaluate threshold and alert rules (30-min cooldown is in memory)
+        if now - timestamp <= LIVE_READING_WINDOW:
+            for alert_message in alert_engine.evaluate(db, sensor.id, moisture, timestamp, alert_undo):
+                new_alerts.append(_add_alert(db, schemas.AlertCreate(sensor_id=sensor.id, message=alert_message)))
+
+        # Auto-detect watering events against the previous reading, read
+        # from sensor_state before this reading is folded into it. Only
+        # in-order readings can be compared; a backfilled reading older than
+        # the latest one has no reliable predecessor there.
+        if sensor.auto_log_watering:
+            prev = db.execute(
+                select(_sensor_state.c.last_moisture, _sensor_state.c.last_timestamp)
+                .where(_sensor_state.c.sensor_id == sensor.id)
+            ).first()
+            prev_moisture = None
+            if prev is not None and prev.last_moisture is not None:
+                prev_ts = prev.last_timestamp.replace(tzinfo=timezone.utc) if prev.last_timestamp.tzinfo is None else prev.last_timestamp
+                if timestamp >= prev_ts:
+                    prev_moisture = prev.last_moisture
+            if prev_moisture is not None:
+                jump = moisture - prev_moisture
+                if jump_threshold is None:
+                    jump_threshold = get_system_config(db).moisture_jump_threshold
+                if jump >= jump_threshold:
+                    auto_note = f"Auto-detected: moisture rose from {prev_moisture:.1f}% to {moisture:.1f}%"
+                    auto_log = models.WateringLog(
+                        sensor_id=sensor.id,
+                        notes=auto_note,
+                        method=models.WateringMethod.auto,
+                        timestamp=timestamp
+                    )
+                    db.add(auto_log)
+
+        _update_sensor_state(db, sensor.id, moisture, reading.raw_adc, timestamp, sensor.is_demo)
+
+    return duplicates
+
+
+# Sensor state
+
+SENSOR_STATE_WINDOW = 20  # recent readings kept per sensor (sensor health looks at the last 20)
+
+_sensor_state = models.SensorState.__table__
+
+
+def _update_sensor_state(db: Session, sensor_db_id: int, moisture: float, raw_adc, timestamp: datetime, is_demo: bool):
+    """Fold one reading into sensor_state with a single upsert.
+
+    Readings older than the stored latest (e.g. a late backfill) don't move
+    the "last" columns or the recent window.
+    """
+    entry = _state_entry(timestamp, moisture, raw_adc)
+    stmt = sqlite_insert(_sensor_state).values(
+        sensor_id=sensor_db_id,
+        last_moisture=moisture,
+        last_timestamp=timestamp,
+        last_raw_adc=raw_adc,
+        last_raw_adc_timestamp=timestamp if raw_adc is not None else None,
+        recent=[entry],
+        is_demo=is_demo,
     )
-    db.add(db_reading)
-    db.commit()
-    db.refresh(db_reading)
-
-    # Check thresholds and create alerts (with 30-min cooldown)
-    if db_sensor.threshold:
-        threshold = db_sensor.threshold
-        if threshold.min_moisture is not None and moisture < threshold.min_moisture:
-            if not _alert_recently_created(db, db_sensor.id):
-                alert_message = f"Moisture level below minimum threshold: {moisture}"
-                create_alert(db, schemas.AlertCreate(sensor_id=db_sensor.id, message=alert_message))
-        if threshold.max_moisture is not None and moisture > threshold.max_moisture:
-            if not _alert_recently_created(db, db_sensor.id):
-                alert_message = f"Moisture level above maximum threshold: {moisture}"
-                create_alert(db, schemas.AlertCreate(sensor_id=db_sensor.id, message=alert_message))
-
-    # Auto-detect watering events
-    if db_sensor.auto_log_watering:
-        prev_reading = db.query(models.Reading).filter(
-            models.Reading.sensor_id == db_sensor.id,
-            models.Reading.id != db_reading.id
-        ).order_by(models.Reading.timestamp.desc()).first()
-        if prev_reading:
-            jump = moisture - prev_reading.moisture
-            sys_config = get_system_config(db)
-            if jump >= sys_config.moisture_jump_threshold:
-                auto_note = f"Auto-detected: moisture rose from {prev_reading.moisture:.1f}% to {moisture:.1f}%"
-                auto_log = models.WateringLog(
-                    sensor_id=db_sensor.id,
-                    notes=auto_note,
-                    method=models.WateringMethod.auto,
-                    timestamp=datetime.now(timezone.utc)
-                )
-                db.add(auto_log)
-                db.commit()
+    new, cur = stmt.excluded, _sensor_state.c
+    newer = or_(cur.last_timestamp.is_(None), new.last_timestamp >= cur.last_timestamp)
+    raw_newer = and_(
+        new.last_raw_adc_timestamp.isnot(None),
+        or_(cur.last_raw_adc_timestamp.is_(None), new.last_raw_adc_timestamp >= cur.last_raw_adc_timestamp),
+    )
+    appended = func.json_insert(func.coalesce(cur.recent, "[]"), "$[#]", func.json(json.dumps(entry)))
+    window = case(
+        (func.json_array_length(func.coalesce(cur.recent, "[]")) >= SENSOR_STATE_WINDOW, func.json_remove(appended, "$[0]")),
+        else_=appended,
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[cur.sensor_id],
+        set_={
+            "last_moisture": case((newer, new.last_moisture), else_=cur.last_moisture),
+            "last_timestamp": case((newer, new.last_timestamp), else_=cur.last_timestamp),
+            "last_raw_adc": case((raw_newer, new.last_raw_adc), else_=cur.last_raw_adc),
+            "last_raw_adc_timestamp": case((raw_newer, new.last_raw_adc_timestamp), else_=cur.last_raw_adc_timestamp),
+            "recent": case((newer, window), else_=cur.recent),
+        },
+    )
+    db.execute(stmt)
+
+
+def _state_entry(timestamp: datetime, moisture: float, raw_adc) -> list:
+    # Stored naive UTC, like the DateTime columns
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    return [timestamp.isoformat(), moisture, raw_adc]
 
-    return db_reading
+
+def get_sensor_state(db: Session, sensor_db_id: int, is_demo: bool = False):
+    return db.query(models.SensorState).filter(
+        models.SensorState.sensor_id == sensor_db_id,
+        models.SensorState.is_demo == is_demo,
+    ).first()
+
+
+def rebuild_sensor_state(db: Session, sensor_ids: list = None) -> int:
+    """(Re)build sensor_state rows from the readings table.
+
+    With no sensor_ids, only sensors that don't have a state row yet are
+    rebuilt (first start after upgrading, or readings inserted directly).
+    """
+    if sensor_ids is None:
+        have_state = select(_sensor_state.c.sensor_id)
+        sensor_ids = [sid for (sid,) in db.query(models.Sensor.id).filter(models.Sensor.id.not_in(have_state))]
+    else:
+        db.query(models.SensorState).filter(models.SensorState.sensor_id.in_(sensor_ids)).delete(synchronize_session=False)
+
+    rebuilt = 0
+    for sensor_db_id in sensor_ids:
+        readings = reading_partitions.select_readings(
+            db, lambda t: (t.c.sensor_id == sensor_db_id,), newest_first=True, limit=SENSOR_STATE_WINDOW)
+        if not readings:
+            continue
+        latest = readings[0]
+        latest_raw = next((r for r in readings if r.raw_adc is not None), None)
+        if latest_raw is None:
+            latest_raw = reading_partitions.first_reading(
+                db, lambda t: (t.c.sensor_id == sensor_db_id, t.c.raw_adc.isnot(None)))
+        db.add(models.SensorState(
+            sensor_id=sensor_db_id,
+            last_moisture=latest.moisture,
+            last_timestamp=latest.timestamp,
+            last_raw_adc=latest_raw.raw_adc if latest_raw else None,
+            last_raw_adc_timestamp=latest_raw.timestamp if latest_raw else None,
+            recent=[_state_entry(r.timestamp, r.moisture, r.raw_adc) for r in reversed(readings)],
+            is_demo=latest.is_demo,
+        ))
+        rebuilt += 1
+    db.commit()
+    return rebuilt
 
 
 def set_sensor_calibration(db: Session, sensor_id: int, calibration: schemas.CalibrationData):
@@ -207,49 +451,52 @@ def set_sensor_calibration(db: Session, sensor_id: int, calibration: schemas.Cal
         return None
     db_sensor.calibration_dry = calibration.calibration_dry
     db_sensor.calibration_wet = calibration.calibration_wet
+    bump_config_version(db, db_sensor.device_id)
     db.commit()
     db.refresh(db_sensor)
+    sensor_cache.invalidate_sensor(db_sensor.id)
     return db_sensor
 
 
 def get_latest_raw_reading(db: Session, sensor_db_id: int):
-    return (db.query(models.Reading)
-            .filter(models.Reading.sensor_id == sensor_db_id,
-                    models.Reading.raw_adc.isnot(None))
-            .order_by(models.Reading.timestamp.desc())
-            .first())
+    """Return (raw_adc, timestamp) of the sensor's latest reading that had a raw value."""
+    state = db.get(models.SensorState, sensor_db_id)
+    if state is None or state.last_raw_adc_timestamp is None:
+        return None
+    return state.last_raw_adc, state.last_raw_adc_timestamp
 
 
 def get_readings(db: Session, skip: int = 0, limit: int = 100, is_demo: bool = False):
-    return db.query(models.Reading).filter(models.Reading.is_demo == is_demo).offset(skip).limit(limit).all()
+    return reading_partitions.select_readings(db, lambda t: (t.c.is_demo == is_demo,), skip=skip, limit=limit)
 
 
 def get_readings_by_sensor(db: Session, device_id: str, sensor_db_id: int, start_time: datetime = None, end_time: datetime = None, skip: int = 0, limit: int = None, is_demo: bool = False):
+    """Readings oldest first; ranges reaching past raw retention come from the finest rollup tier covering them."""
     logging.info(f"Fetching readings for device_id: {device_id}, sensor_db_id: {sensor_db_id}, limit: {limit}")
-    query = db.query(models.Reading).filter(models.Reading.device_id == device_id, models.Reading.sensor_id == sensor_db_id, models.Reading.is_demo == is_demo)
-    if start_time:
-        query = query.filter(models.Reading.timestamp >= start_time)
-    if end_time:
-        query = query.filter(models.Reading.timestamp <= end_time)
-    query = query.order_by(models.Reading.timestamp.desc())
-    if limit is not None:
-        query = query.limit(limit)
-    readings = query.offset(skip).all()
+    resolution = pick_resolution(db, start_time)
+    if resolution is not None:
+        buckets = get_rollups(db, [sensor_db_id], resolution, start_time=start_time, end_time=end_time, is_demo=is_demo)[sensor_db_id]
+        newest = buckets[::-1][skip:]
+        if limit is not None:
+            newest = newest[:limit]
+        logging.info(f"Found {len(newest)} {resolution}s buckets")
+        return [
+            schemas.Reading(device_id=device_id, sensor_id=sensor_db_id, timestamp=b["bucket_start"],
+                            moisture=round(b["moisture_sum"] / b["reading_count"], 1), bucket_seconds=resolution)
+            for b in reversed(newest)
+        ]
+
+    readings = reading_partitions.select_readings(
+        db,
+        lambda t: (t.c.device_id == device_id, t.c.sensor_id == sensor_db_id, t.c.is_demo == is_demo),
+        start_time=start_time, end_time=end_time, newest_first=True, skip=skip, limit=limit,
+    )
     readings.reverse()
     logging.info(f"Found {len(readings)} readings")
     return readings
 
 
-def _alert_recently_created(db: Session, sensor_id: int, minutes: int = 30) -> bool:
-    cutoff = datetime.now(timezone.utc) - timedelta(minutes=minutes)
-    recent = db.query(models.Alert).filter(
-        models.Alert.sensor_id == sensor_id,
-        models.Alert.timestamp >= cutoff
-    ).first()
-    return recent is not None
-
-
-def create_alert(db: Session, alert: schemas.AlertCreate):
+def _add_alert(db: Session, alert: schemas.AlertCreate):
     db_alert = models.Alert(
         sensor_id=alert.sensor_id,
         message=alert.message,
@@ -257,23 +504,28 @@ def create_alert(db: Session, alert: schemas.AlertCreate):
         read=False
     )
     db.add(db_alert)
-    db.commit()
-    db.refresh(db_alert)
+    db.flush()
+    _queue_alert_notification(db, db_alert)
+    return db_alert
 
-    # Send push notification if ntfy is enabled
-    try:
-        config = get_system_config(db)
-        if config.ntfy_enabled and config.ntfy_topic:
-            from services.notifications import send_alert_notification
-            sensor = db.query(models.Sensor).options(
-                joinedload(models.Sensor.device)
-            ).filter(models.Sensor.id == alert.sensor_id).first()
-            sensor_name = sensor.name if sensor else None
-            device_name = sensor.device.name if sensor and sensor.device else None
-            send_alert_notification(config.ntfy_server_url, config.ntfy_topic, alert.message, sensor_name, device_name)
-    except Exception as e:
-        logging.error(f"Failed to send alert notification: {e}")
 
+def _queue_alert_notification(db: Session, db_alert: models.Alert):
+    # Queue a push notification if ntfy is enabled; sent after commit
+    config = get_system_config(db)
+    if config.ntfy_enabled and config.ntfy_topic:
+        sensor = db.query(models.Sensor).options(
+            joinedload(models.Sensor.device)
+        ).filter(models.Sensor.id == db_alert.sensor_id).first()
+        sensor_name = sensor.name if sensor else None
+        device_name = sensor.device.name if sensor and sensor.device else None
+        queue_alert_notification(db, config.ntfy_server_url, config.ntfy_topic, db_alert.message, sensor_name, device_name)
+
+
+def create_alert(db: Session, alert: schemas.AlertCreate):
+    db_alert = _add_alert(db, alert)
+    db.commit()
+    db.refresh(db_alert)
+    notification_dispatcher.wake()
     return db_alert
 
 
@@ -306,8 +558,13 @@ def set_threshold(db: Session, sensor_id: int, threshold_data: schemas.Threshold
             max_moisture=threshold_data.max_moisture
         )
         db.add(db_threshold)
+    db_sensor = db.query(models.Sensor).filter(models.Sensor.id == sensor_id).first()
+    if db_sensor:
+        bump_config_version(db, db_sensor.device_id)
     db.commit()
     db.refresh(db_threshold)
+    sensor_cache.invalidate_sensor(sensor_id)
+    alert_engine.invalidate()
     return db_threshold
 
 
@@ -324,58 +581,62 @@ def delete_device(db: Session, device_id: str):
         db.query(models.WateringLog).filter(models.WateringLog.sensor_id.in_(sensor_ids)).delete(synchronize_session=False)
         # Delete alerts for device's sensors
         db.query(models.Alert).filter(models.Alert.sensor_id.in_(sensor_ids)).delete(synchronize_session=False)
-        # Delete thresholds for device's sensors
+        # Delete thresholds and alert rules for device's sensors
         db.query(models.Threshold).filter(models.Threshold.sensor_id.in_(sensor_ids)).delete(synchronize_session=False)
+        db.query(models.AlertRule).filter(models.AlertRule.sensor_id.in_(sensor_ids)).delete(synchronize_session=False)
 
     # Delete heartbeat logs for device
     db.query(models.HeartbeatLog).filter(models.HeartbeatLog.device_id == device_id).delete(synchronize_session=False)
-    # Delete readings by device_id
-    db.query(models.Reading).filter(models.Reading.device_id == device_id).delete(synchronize_session=False)
+    db.query(models.DeviceUptimeInterval).filter(models.DeviceUptimeInterval.device_id == device_id).delete(synchronize_session=False)
+    # Delete readings and per-sensor state by device_id
+    reading_partitions.delete_readings(db, lambda t: (t.c.device_id == device_id,))
+    if sensor_ids:
+        db.query(models.SensorState).filter(models.SensorState.sensor_id.in_(sensor_ids)).delete(synchronize_session=False)
+        db.query(models.ReadingRollup).filter(models.ReadingRollup.sensor_id.in_(sensor_ids)).delete(synchronize_session=False)
     # Delete sensors
     db.query(models.Sensor).filter(models.Sensor.device_id == device_id).delete(synchronize_session=False)
     # Delete device
     db.delete(device)
     db.commit()
+    sensor_cache.invalidate_device(device_id)
+    sequence_tracker.forget_device(device_id)
+    device_liveness.forget(device_id)
+    alert_engine.forget_sensors(sensor_ids)
     return True
 
 
 # OTA CRUD operations
 
 def update_device_heartbeat(db: Session, device_id: str, heartbeat: schemas.DeviceHeartbeat):
+    """Record a heartbeat; last_seen goes to the liveness tracker, which flushes it in batches."""
     db_device = get_device_by_device_id(db, device_id)
     if not db_device:
         return None
-    db_device.last_seen = datetime.now(timezone.utc)
-    db_device.offline_notified = False
-    if heartbeat.firmware_version is not None:
-        db_device.firmware_version = heartbeat.firmware_version
-    if heartbeat.ip_address is not None:
-        db_device.ip_address = heartbeat.ip_address
-    if heartbeat.mac_address is not None:
-        db_device.mac_address = heartbeat.mac_address
-    db.commit()
-    db.refresh(db_device)
+    changed = False
+    for field in ("firmware_version", "ip_address", "mac_address"):
+        value = getattr(heartbeat, field)
+        if value is not None and value != getattr(db_device, field):
+            setattr(db_device, field, value)
+            changed = True
+    if changed:
+        db.commit()
+        db.refresh(db_device)
+    device_liveness.touch(device_id)
     return db_device
 
 
-def check_and_notify_offline_devices(db: Session):
-    try:
-        config = get_system_config(db)
-        if not config.ntfy_enabled or not config.ntfy_topic:
-            return
-        from services.notifications import send_device_offline_notification
-        cutoff = datetime.now(timezone.utc) - timedelta(minutes=config.device_timeout)
-        offline_devices = db.query(models.Device).filter(
-            models.Device.last_seen < cutoff,
-            models.Device.offline_notified == False
-        ).all()
-        for device in offline_devices:
-            send_device_offline_notification(config.ntfy_server_url, config.ntfy_topic, device.name, device.device_id)
-            device.offline_notified = True
-        if offline_devices:
-            db.commit()
-    except Exception as e:
-        logging.error(f"Failed to check/notify offline devices: {e}")
+def device_with_live_last_seen(db_device: models.Device) -> schemas.Device:
+    """The device as returned by the API, with last_seen from the liveness tracker.
+
+    devices.last_seen trails the tracker by up to one flush interval, and is
+    still null for a device whose first heartbeats haven't been flushed.
+    """
+    device = schemas.Device.model_validate(db_device)
+    live = device_liveness.last_seen(db_device.device_id)
+    if live is not None:
+        # Naive UTC, like the stored column
+        device.last_seen = live.astimezone(timezone.utc).replace(tzinfo=None)
+    return device
 
 
 # Zone CRUD
@@ -410,13 +671,56 @@ def delete_zone(db: Session, zone_id: int):
     db.query(models.Sensor).filter(models.Sensor.zone_id == zone_id).update(
         {models.Sensor.zone_id: None}, synchronize_session=False
     )
+    db.query(models.AlertRule).filter(models.AlertRule.zone_id == zone_id).delete(synchronize_session=False)
     db.delete(db_zone)
     db.commit()
+    alert_engine.invalidate()
     return True
 
 
 # Alert helpers
 
+def check_stale_sensors(db: Session) -> int:
+    """Fire stale_sensor rules; called periodically from a background task."""
+    alert_undo = {}
+    try:
+        new_alerts = [
+            _add_alert(db, schemas.AlertCreate(sensor_id=sensor_id, message=message))
+            for sensor_id, message in alert_engine.check_stale(db, undo=alert_undo)
+        ]
+        if not new_alerts:
+            return 0
+        db.commit()
+    except Exception:
+        alert_engine.rollback(alert_undo)
+        raise
+    notification_dispatcher.wake()
+    return len(new_alerts)
+
+
+def get_alert_rules(db: Session, is_demo: bool = False):
+    return db.query(models.AlertRule).filter(models.AlertRule.is_demo == is_demo).order_by(models.AlertRule.id).all()
+
+
+def create_alert_rule(db: Session, rule: schemas.AlertRuleCreate):
+    db_rule = models.AlertRule(**rule.dict())
+    db.add(db_rule)
+    db.commit()
+    db.refresh(db_rule)
+    alert_engine.invalidate()
+    return db_rule
+
+
+def delete_alert_rule(db: Session, rule_id: int) -> bool:
+    db_rule = db.query(models.AlertRule).filter(models.AlertRule.id == rule_id).first()
+    if not db_rule:
+        return False
+    db.delete(db_rule)
+    db.commit()
+    alert_engine.invalidate()
+    return True
+
+
 def get_unread_alert_count(db: Session, is_demo: bool = False) -> int:
     return db.query(func.count(models.Alert.id)).filter(models.Alert.read == False, models.Alert.is_demo == is_demo).scalar() or 0
 
@@ -458,7 +762,12 @@ def get_dashboard_summary(db: Session, is_demo: bool = False) -> schemas.Dashboa
     # Stats
     all_devices = db.query(models.Device).filter(models.Device.is_demo == is_demo).all()
     total_devices = len(all_devices)
-    online_devices = sum(1 for d in all_devices if d.last_seen and d.last_seen.replace(tzinfo=timezone.utc) >= online_cutoff)
+    online_devices = 0
+    for d in all_devices:
+        # The tracker is ahead of devices.last_seen by up to one flush interval
+        last_seen = device_liveness.last_seen(d.device_id) or d.last_seen
+        if last_seen and last_seen.replace(tzinfo=timezone.utc) >= online_cutoff:
+            online_devices += 1
 
     all_sensors = db.query(models.Sensor).options(
         joinedload(models.Sensor.device),
@@ -469,32 +778,27 @@ def get_dashboard_summary(db: Session, is_demo: bool = False) -> schemas.Dashboa
 
     unread_alert_count = get_unread_alert_count(db, is_demo=is_demo)
 
+    states = {
+        st.sensor_id: st
+        for st in db.query(models.SensorState).filter(models.SensorState.is_demo == is_demo)
+    }
+
+    hourly = get_rollups(db, [sensor.id for sensor in all_sensors], 3600, start_time=hour_24_ago, is_demo=is_demo)
+
     sensor_summaries = []
     sensors_needing_water = 0
 
     for sensor in all_sensors:
         # Latest reading
-        latest = db.query(models.Reading).filter(
-            models.Reading.sensor_id == sensor.id
-        ).order_by(models.Reading.timestamp.desc()).first()
-
-        current_moisture = latest.moisture if latest else None
-        last_reading_time = latest.timestamp if latest else None
+        latest = states.get(sensor.id)
+        current_moisture = latest.last_moisture if latest else None
+        last_reading_time = latest.last_timestamp if latest else None
 
         # 24h sparkline - hourly averages
-        hourly_readings = db.query(
-            func.strftime('%Y-%m-%d %H:00', models.Reading.timestamp).label('hour'),
-            func.avg(models.Reading.moisture).label('avg_moisture')
-        ).filter(
-            models.Reading.sensor_id == sensor.id,
-            models.Reading.timestamp >= hour_24_ago
-        ).group_by(
-            func.strftime('%Y-%m-%d %H:00', models.Reading.timestamp)
-        ).order_by('hour').all()
-
         sparkline = [
-            schemas.SparklinePoint(hour=row.hour, moisture=round(row.avg_moisture, 1))
-            for row in hourly_readings
+            schemas.SparklinePoint(hour=b["bucket_start"].strftime('%Y-%m-%d %H:00'),
+                                   moisture=round(b["moisture_sum"] / b["reading_count"], 1))
+            for b in hourly[sensor.id]
         ]
 
         # Trend from last 3 hours
@@ -561,12 +865,303 @@ def get_dashboard_summary(db: Session, is_demo: bool = False) -> schemas.Dashboa
 # Readings cleanup
 
 def delete_old_readings(db: Session, older_than_days: int = 90) -> int:
+    """Drop the monthly reading partitions and sealed months that are entirely older than the cutoff.
+
+    Rollups are refreshed first and kept, so charts still cover the dropped
+    months, and each month is copied to the cold archive (if enabled)
+    before it goes. Returns the number of raw readings dropped.
+    """
+    refresh_rollups(db)
     cutoff = datetime.now(timezone.utc) - timedelta(days=older_than_days)
-    count = db.query(models.Reading).filter(models.Reading.timestamp < cutoff).delete(synchronize_session=False)
+    if reading_archive.enabled():
+        for table in reading_partitions.partitions_before(db, cutoff):
+            archived = reading_archive.archive_partition(db, table)
+            logging.info(f"Archived {archived} readings from {table.name}")
+        for key in reading_partitions.sealed_keys_before(db, cutoff):
+            archived = reading_archive.archive_sealed_month(db, key)
+            logging.info(f"Archived {archived} readings from sealed month {key}")
+    count = reading_partitions.drop_partitions_before(db, cutoff)
+    db.query(models.RollupState).filter(
+        models.RollupState.id.not_in(reading_partitions.partition_keys(db) + [reading_partitions.LEGACY_KEY])
+    ).delete(synchronize_session=False)
     db.commit()
     return count
 
 
+def seal_old_readings(db: Session) -> int:
+    """Pack the monthly partitions older than READING_BLOCKS_SEAL_AFTER_DAYS into reading_blocks.
+
+    Off unless that is set. Each month is sealed in one transaction that
+    holds the write lock, after folding its last readings into the rollups,
+    so charts keep covering it. Returns the number of readings sealed.
+    """
+    if not reading_blocks.enabled():
+        return 0
+    cutoff = datetime.now(timezone.utc) - timedelta(days=reading_blocks.SEAL_AFTER_DAYS)
+    sealed = 0
+    with _rollup_lock:
+        for table in reading_partitions.partitions_before(db, cutoff):
+            key = reading_partitions.table_key(table)
+            reading_partitions.begin_write(db)
+            last_id = db.query(models.RollupState.last_reading_id).filter(models.RollupState.id == key).scalar() or 0
+            _fold_partition(db, table, last_id, commit=False)
+            count = reading_partitions.seal_partition(db, table)
+            db.query(models.RollupState).filter(models.RollupState.id == key).delete(synchronize_session=False)
+            db.commit()
+            logging.info(f"Sealed {count} readings from {table.name} into reading_blocks")
+            sealed += count
+    return sealed
+
+
+LEGACY_MOVE_BATCH_SIZE = 5000
+
+
+def migrate_legacy_readings(db: Session) -> int:
+    """Move the pre-partitioning readings table into monthly partitions (deferred startup job).
+
+    Each batch is copied into the partitions and deleted from the legacy
+    table in one transaction that holds the write lock, so ingest carries on
+    between batches, a restart picks up where it stopped, and reads (which
+    cover the legacy table until it is dropped) never see a reading twice.
+    Readings the rollups already hold (legacy id up to the legacy watermark)
+    keep counting as folded: the partitions they land in are folded up to
+    date first and their watermarks moved past them. Returns the number of
+    readings moved.
+    """
+    if not reading_partitions.has_legacy_table(db):
+        return 0
+    moved = 0
+    while True:
+        with _rollup_lock:
+            reading_partitions.begin_write(db)
+            batch = reading_partitions.legacy_batch(db, LEGACY_MOVE_BATCH_SIZE)
+            if not batch:
+                reading_partitions.drop_legacy_table(db)
+                db.query(models.RollupState).filter(
+                    models.RollupState.id == reading_partitions.LEGACY_KEY
+                ).delete(synchronize_session=False)
+                db.commit()
+                break
+            watermarks = _rollup_watermarks(db)
+            legacy_watermark = watermarks.get(reading_partitions.LEGACY_KEY, 0)
+            folded = [values for legacy_id, values in batch if legacy_id <= legacy_watermark]
+            if folded:
+                keys = {reading_partitions.month_key(values["timestamp"]) for values in folded}
+                for key in keys:
+                    _fold_partition(db, reading_partitions.ensure_partition(db, key), watermarks.get(key, 0), commit=False)
+                reading_partitions.insert_readings(db, folded, ignore_duplicates=True)
+                for key in keys:
+                    table = reading_partitions.partition_table(key)
+                    db.merge(models.RollupState(id=key, last_reading_id=db.execute(select(func.max(table.c.id))).scalar()))
+            reading_partitions.insert_readings(
+                db, [values for legacy_id, values in batch if legacy_id > legacy_watermark], ignore_duplicates=True)
+            reading_partitions.delete_legacy_through(db, batch[-1][0])
+            db.commit()
+        moved += len(batch)
+    logging.info(f"Moved {moved} legacy readings into {len(reading_partitions.partition_keys(db))} monthly partitions")
+    return moved
+
+
+# Reading rollups
+
+ROLLUP_RESOLUTIONS = (300, 3600, 86400)  # 5-minute, hourly and daily buckets, in seconds
+ROLLUP_BATCH_SIZE = 20000
+
+_reading_rollups = models.ReadingRollup.__table__
+_rollup_lock = threading.Lock()
+
+
+def _bucket_start(timestamp: datetime, seconds: int) -> datetime:
+    """Start of the UTC-aligned bucket holding timestamp, as naive UTC like the DateTime columns."""
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    epoch = int(timestamp.timestamp())
+    return datetime.fromtimestamp(epoch - epoch % seconds, timezone.utc).replace(tzinfo=None)
+
+
+def _fold_rollup(buckets: dict, sensor_id: int, is_demo: bool, timestamp: datetime, moisture: float, resolutions=ROLLUP_RESOLUTIONS):
+    if moisture is None:
+        return
+    for seconds in resolutions:
+        key = (sensor_id, seconds, _bucket_start(timestamp, seconds))
+        b = buckets.get(key)
+        if b is None:
+            buckets[key] = {
+                "sensor_id": sensor_id,
+                "bucket_seconds": seconds,
+                "bucket_start": key[2],
+                "reading_count": 1,
+                "moisture_sum": moisture,
+                "moisture_min": moisture,
+                "moisture_max": moisture,
+                "last_moisture": moisture,
+                "last_timestamp": timestamp,
+                "is_demo": bool(is_demo),
+            }
+            continue
+        b["reading_count"] += 1
+        b["moisture_sum"] += moisture
+        b["moisture_min"] = min(b["moisture_min"], moisture)
+        b["moisture_max"] = max(b["moisture_max"], moisture)
+        if timestamp >= b["last_timestamp"]:
+            b["last_moisture"] = moisture
+            b["last_timestamp"] = timestamp
+
+
+def _upsert_rollups(db: Session, buckets: list):
+    """Add partial buckets onto the stored ones (late readings land in old buckets too)."""
+    stmt = sqlite_insert(_reading_rollups)
+    new, cur = stmt.excluded, _reading_rollups.c
+    newer = or_(cur.last_timestamp.is_(None), new.last_timestamp >= cur.last_timestamp)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[cur.sensor_id, cur.bucket_seconds, cur.bucket_start],
+        set_={
+            "reading_count": cur.reading_count + new.reading_count,
+            "moisture_sum": cur.moisture_sum + new.moisture_sum,
+            "moisture_min": func.min(cur.moisture_min, new.moisture_min),
+            "moisture_max": func.max(cur.moisture_max, new.moisture_max),
+            "last_moisture": case((newer, new.last_moisture), else_=cur.last_moisture),
+            "last_timestamp": case((newer, new.last_timestamp), else_=cur.last_timestamp),
+        },
+    )
+    db.execute(stmt, buckets)
+
+
+def _rollup_watermarks(db: Session) -> dict:
+    """Highest folded reading id per partition (RollupState.id is the partition's YYYYMM)."""
+    return dict(db.query(models.RollupState.id, models.RollupState.last_reading_id).all())
+
+
+def refresh_rollups(db: Session) -> int:
+    """Fold readings past each partition's watermark (and the legacy table's, until it is moved) into reading_rollups.
+
+    Each batch's upserts and the watermark move commit together. Returns the
+    number of readings folded in.
+    """
+    with _rollup_lock:
+        watermarks = _rollup_watermarks(db)
+        return sum(
+            _fold_partition(db, table, watermarks.get(reading_partitions.table_key(table), 0))
+            for table in reading_partitions.tables(db)
+        )
+
+
+def _fold_partition(db: Session, table, last_id: int, commit: bool = True) -> int:
+    """Fold a partition's readings past last_id into reading_rollups, committing each batch unless told not to."""
+    key = reading_partitions.table_key(table)
+    folded = 0
+    while True:
+        rows = db.execute(
+            select(table.c.id, table.c.sensor_id, table.c.is_demo, table.c.timestamp, table.c.moisture)
+            .where(table.c.id > last_id)
+            .order_by(table.c.id)
+            .limit(ROLLUP_BATCH_SIZE)
+        ).all()
+        if not rows:
+            break
+        buckets = {}
+        for _, sensor_id, is_demo, timestamp, moisture in rows:
+            _fold_rollup(buckets, sensor_id, is_demo, timestamp, moisture)
+        _upsert_rollups(db, list(buckets.values()))
+        last_id = rows[-1][0]
+        db.merge(models.RollupState(id=key, last_reading_id=last_id))
+        if commit:
+            db.commit()
+        folded += len(rows)
+    return folded
+
+
+def get_rollups(db: Session, sensor_ids: list, bucket_seconds: int, start_time: datetime = None, end_time: datetime = None, is_demo: bool = False) -> dict:
+    """Rollup buckets per sensor id, oldest first.
+
+    Readings the catch-up job hasn't reached yet are folded in from the raw
+    table, so results are current to the last insert.
+    """
+    result = {sensor_id: [] for sensor_id in sensor_ids}
+    if not sensor_ids:
+        return result
+    watermarks = _rollup_watermarks(db)
+    start = _bucket_start(start_time, bucket_seconds) if start_time is not None else None
+
+    q = db.query(models.ReadingRollup).filter(
+        models.ReadingRollup.sensor_id.in_(sensor_ids),
+        models.ReadingRollup.bucket_seconds == bucket_seconds,
+        models.ReadingRollup.is_demo == is_demo,
+    )
+    if start is not None:
+        q = q.filter(models.ReadingRollup.bucket_start >= start)
+    if end_time is not None:
+        q = q.filter(models.ReadingRollup.bucket_start <= end_time)
+    buckets = {
+        (r.sensor_id, r.bucket_seconds, r.bucket_start): {
+            c: getattr(r, c) for c in ("sensor_id", "bucket_seconds", "bucket_start", "reading_count", "moisture_sum",
+                                       "moisture_min", "moisture_max", "last_moisture", "last_timestamp", "is_demo")
+        }
+        for r in q
+    }
+
+    tail = reading_partitions.select_readings(
+        db,
+        lambda t: (t.c.id > watermarks.get(reading_partitions.table_key(t), 0),
+                   t.c.sensor_id.in_(sensor_ids), t.c.is_demo == is_demo),
+        start_time=start, end_time=end_time, columns=("sensor_id", "timestamp", "moisture"),
+    )
+    for sensor_id, timestamp, moisture in tail:
+        _fold_rollup(buckets, sensor_id, is_demo, timestamp, moisture, resolutions=(bucket_seconds,))
+
+    for key in sorted(buckets):
+        result[key[0]].append(buckets[key])
+    return result
+
+
+# Tiered retention: raw readings for retention_days, 5-minute rollups for
+# rollup_5m_retention_days, hourly and daily rollups indefinitely (0 keeps a
+# tier forever)
+
+def _tier_cutoffs(db: Session) -> tuple:
+    """(raw, 5-minute) retention cutoffs as naive UTC, None for a tier that is kept."""
+    config = get_system_config(db)
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    raw = now - timedelta(days=config.retention_days) if config.retention_days else None
+    fine = now - timedelta(days=config.rollup_5m_retention_days) if config.rollup_5m_retention_days else None
+    return raw, fine
+
+
+def pick_resolution(db: Session, start_time: datetime = None):
+    """Finest tier that still holds data back to start_time: None for raw readings, else bucket seconds."""
+    if start_time is None:
+        return None
+    start = _utc(start_time).astimezone(timezone.utc).replace(tzinfo=None)
+    raw_cutoff, fine_cutoff = _tier_cutoffs(db)
+    if raw_cutoff is None or start >= raw_cutoff:
+        return None
+    if fine_cutoff is None or start >= fine_cutoff:
+        return 300
+    return 3600
+
+
+def apply_retention_tiers(db: Session) -> tuple:
+    """Downsample and prune: fold new readings into the rollups, then drop each tier past its retention.
+
+    Raw months that are kept but aged get sealed into reading_blocks, if enabled. Returns (raw readings dropped, 5-minute buckets pruned).
+    """
+    refresh_rollups(db)
+    config = get_system_config(db)
+    dropped = delete_old_readings(db, config.retention_days) if config.retention_days else 0
+    seal_old_readings(db)
+    _, fine_cutoff = _tier_cutoffs(db)
+    pruned = 0
+    if fine_cutoff is not None:
+        pruned = db.query(models.ReadingRollup).filter(
+            models.ReadingRollup.bucket_seconds == 300,
+            models.ReadingRollup.bucket_start < fine_cutoff,
+        ).delete(synchronize_session=False)
+        db.commit()
+    if dropped or pruned:
+        logging.info(f"Retention: dropped {dropped} raw readings, pruned {pruned} 5-minute buckets")
+    return dropped, pruned
+
+
 # Watering log CRUD
 
 def get_last_watering_time(db: Session, sensor_id: int):
@@ -613,26 +1208,44 @@ def delete_watering_log(db: Session, log_id: int) -> bool:
 # Aggregated readings
 
 def get_aggregated_readings(db: Session, sensor_db_id: int, period: str, start_time: datetime = None, end_time: datetime = None, is_demo: bool = False):
-    if period == "daily":
-        fmt = '%Y-%m-%d'
-    else:
-        fmt = '%Y-W%W'
-
-    query = db.query(
-        func.strftime(fmt, models.Reading.timestamp).label('period_start'),
-        func.avg(models.Reading.moisture).label('avg_moisture'),
-        func.min(models.Reading.moisture).label('min_moisture'),
-        func.max(models.Reading.moisture).label('max_moisture'),
-        func.count(models.Reading.id).label('reading_count'),
-    ).filter(models.Reading.sensor_id == sensor_db_id, models.Reading.is_demo == is_demo)
-
-    if start_time:
-        query = query.filter(models.Reading.timestamp >= start_time)
-    if end_time:
-        query = query.filter(models.Reading.timestamp <= end_time)
-
-    query = query.group_by(func.strftime(fmt, models.Reading.timestamp)).order_by('period_start')
-    return query.all()
+    """Daily or weekly (%Y-W%W) aggregates built from the daily rollups, which retention never prunes."""
+    days = get_rollups(db, [sensor_db_id], 86400, start_time=start_time, end_time=end_time, is_demo=is_demo)[sensor_db_id]
+    return _period_points(days, period)
+
+
+def get_archived_aggregates(sensor_db_id: int, period: str, start_time: datetime = None, end_time: datetime = None):
+    """Daily or weekly aggregates recomputed from the cold archive's raw readings."""
+    buckets = {}
+    for r in reading_archive.scan(sensor_db_id, start_time, end_time):
+        _fold_rollup(buckets, sensor_db_id, False, r.timestamp, r.moisture, resolutions=(86400,))
+    return _period_points([buckets[key] for key in sorted(buckets)], period)
+
+
+def _period_points(days: list, period: str) -> list:
+    """Group daily buckets (oldest first) into daily or weekly points."""
+    fmt = '%Y-%m-%d' if period == "daily" else '%Y-W%W'
+    periods = {}
+    for b in days:
+        label = b["bucket_start"].strftime(fmt)
+        p = periods.get(label)
+        if p is None:
+            periods[label] = dict(b)
+            continue
+        p["reading_count"] += b["reading_count"]
+        p["moisture_sum"] += b["moisture_sum"]
+        p["moisture_min"] = min(p["moisture_min"], b["moisture_min"])
+        p["moisture_max"] = max(p["moisture_max"], b["moisture_max"])
+
+    return [
+        schemas.AggregatedReadingPoint(
+            period_start=label,
+            avg_moisture=round(p["moisture_sum"] / p["reading_count"], 1),
+            min_moisture=round(p["moisture_min"], 1),
+            max_moisture=round(p["moisture_max"], 1),
+            reading_count=p["reading_count"],
+        )
+        for label, p in periods.items()
+    ]
 
 
 # Drying rate
@@ -642,22 +1255,16 @@ def get_drying_rate(db: Session, sensor_db_id: int, period_days: int = 7, is_dem
     start_time = now - timedelta(days=period_days)
 
     # Current moisture
-    latest = db.query(models.Reading).filter(
-        models.Reading.sensor_id == sensor_db_id,
-        models.Reading.is_demo == is_demo,
-    ).order_by(models.Reading.timestamp.desc()).first()
-    current_moisture = latest.moisture if latest else None
+    state = get_sensor_state(db, sensor_db_id, is_demo=is_demo)
+    current_moisture = state.last_moisture if state else None
 
     # Dry threshold from sensor's threshold
     threshold = db.query(models.Threshold).filter(models.Threshold.sensor_id == sensor_db_id).first()
     dry_threshold = threshold.min_moisture if threshold and threshold.min_moisture is not None else 20.0
 
     # Readings in period
-    readings = db.query(models.Reading).filter(
-        models.Reading.sensor_id == sensor_db_id,
-        models.Reading.is_demo == is_demo,
-        models.Reading.timestamp >= start_time
-    ).order_by(models.Reading.timestamp.asc()).all()
+    readings = reading_partitions.select_readings(
+        db, lambda t: (t.c.sensor_id == sensor_db_id, t.c.is_demo == is_demo), start_time=start_time)
 
     # Watering logs in period for exclusion
     watering_logs = db.query(models.WateringLog).filter(
@@ -745,24 +1352,181 @@ def create_heartbeat_log(db: Session, device_id: str, heartbeat: schemas.DeviceH
     return log
 
 
+# Raw heartbeats younger than this are kept as-is; older ones are folded into
+# DeviceUptimeInterval rows by compact_heartbeat_logs.
+HEARTBEAT_RAW_WINDOW = timedelta(hours=24)
+
+# Heartbeats further apart than this are an outage (the firmware sends one
+# every 5 minutes).
+UPTIME_GAP = timedelta(minutes=10)
+
+COMPACT_BATCH_SIZE = 5000
+
+
+def _continues(interval, timestamp: datetime, ip_address, firmware_version) -> bool:
+    """Whether a heartbeat extends interval rather than starting a new one."""
+    return (interval is not None
+            and interval.ip_address == ip_address
+            and interval.firmware_version == firmware_version
+            and timestamp - interval.end_time <= UPTIME_GAP)
+
+
+def compact_heartbeat_logs(db: Session) -> int:
+    """Fold raw heartbeats older than HEARTBEAT_RAW_WINDOW into uptime intervals.
+
+    Each device's newest interval is extended while heartbeats keep arriving
+    within UPTIME_GAP with the same IP and firmware; anything else starts a
+    new interval. Compacted rows are deleted. Returns how many were compacted.
+    """
+    cutoff = datetime.now(timezone.utc) - HEARTBEAT_RAW_WINDOW
+    log = models.HeartbeatLog
+    compacted = 0
+    open_intervals = {}  # (device_id, is_demo) -> newest interval
+
+    while True:
+        rows = (db.query(log.id, log.device_id, log.timestamp, log.ip_address, log.firmware_version, log.is_demo)
+                .filter(log.timestamp < cutoff)
+                .order_by(log.device_id, log.timestamp)
+                .limit(COMPACT_BATCH_SIZE)
+                .all())
+        if not rows:
+            break
+        for _, device_id, timestamp, ip_address, firmware_version, is_demo in rows:
+            key = (device_id, bool(is_demo))
+            if key not in open_intervals:
+                open_intervals[key] = (db.query(models.DeviceUptimeInterval)
+                                       .filter(models.DeviceUptimeInterval.device_id == device_id,
+                                               models.DeviceUptimeInterval.is_demo == bool(is_demo))
+                                       .order_by(models.DeviceUptimeInterval.end_time.desc())
+                                       .first())
+            interval = open_intervals[key]
+            if _continues(interval, timestamp, ip_address, firmware_version):
+                interval.end_time = max(interval.end_time, timestamp)
+                interval.heartbeat_count += 1
+            else:
+                interval = models.DeviceUptimeInterval(
+                    device_id=device_id,
+                    start_time=timestamp,
+                    end_time=timestamp,
+                    ip_address=ip_address,
+                    firmware_version=firmware_version,
+                    heartbeat_count=1,
+                    is_demo=bool(is_demo),
+                )
+                db.add(interval)
+                open_intervals[key] = interval
+        db.query(log).filter(log.id.in_([r[0] for r in rows])).delete(synchronize_session=False)
+        db.commit()
+        compacted += len(rows)
+
+    if compacted:
+        logging.info(f"Compacted {compacted} heartbeat logs into uptime intervals")
+    return compacted
+
+
+def _device_intervals(db: Session, device_id: str, is_demo: bool, since: datetime = None, limit: int = None) -> list:
+    """Compacted intervals plus the raw tail folded on the fly, oldest first."""
+    q = db.query(models.DeviceUptimeInterval).filter(
+        models.DeviceUptimeInterval.device_id == device_id,
+        models.DeviceUptimeInterval.is_demo == is_demo,
+    )
+    if since is not None:
+        q = q.filter(models.DeviceUptimeInterval.end_time >= since)
+    q = q.order_by(models.DeviceUptimeInterval.end_time.desc())
+    if limit is not None:
+        q = q.limit(limit)
+    intervals = [schemas.HeartbeatInterval.model_validate(i) for i in reversed(q.all())]
+
+    log = models.HeartbeatLog
+    raw = (db.query(log.timestamp, log.ip_address, log.firmware_version)
+           .filter(log.device_id == device_id, log.is_demo == is_demo)
+           .order_by(log.timestamp)
+           .all())
+    for timestamp, ip_address, firmware_version in raw:
+        last = intervals[-1] if intervals else None
+        if _continues(last, timestamp, ip_address, firmware_version):
+            last.end_time = max(last.end_time, timestamp)
+            last.heartbeat_count += 1
+        else:
+            intervals.append(schemas.HeartbeatInterval(
+                device_id=device_id,
+                start_time=timestamp,
+                end_time=timestamp,
+                ip_address=ip_address,
+                firmware_version=firmware_version,
+                heartbeat_count=1,
+            ))
+    return intervals
+
+
 def get_heartbeat_logs(db: Session, device_id: str, limit: int = 50, is_demo: bool = False):
-    return (db.query(models.HeartbeatLog)
-            .filter(models.HeartbeatLog.device_id == device_id, models.HeartbeatLog.is_demo == is_demo)
-            .order_by(models.HeartbeatLog.timestamp.desc())
-            .limit(limit)
-            .all())
+    """Heartbeat history as uptime intervals, newest first."""
+    intervals = _device_intervals(db, device_id, is_demo, limit=limit)
+    return list(reversed(intervals))[:limit]
+
+
+def _utc(ts: datetime) -> datetime:
+    return ts.replace(tzinfo=timezone.utc) if ts.tzinfo is None else ts
+
+
+def get_device_uptime(db: Session, device_id: str, days: int = 30, is_demo: bool = False) -> schemas.DeviceUptime:
+    """Uptime over the last `days`, from the device's first heartbeat in that window.
+
+    Gaps between heartbeats longer than UPTIME_GAP are outages, as is the time
+    since the last heartbeat once it exceeds UPTIME_GAP.
+    """
+    now = datetime.now(timezone.utc)
+    since = now - timedelta(days=days)
+    intervals = _device_intervals(db, device_id, is_demo, since=since)
+    if not intervals:
+        return schemas.DeviceUptime(device_id=device_id, days=days)
+
+    start = max(since, _utc(intervals[0].start_time))
+    gaps = []
+    prev_end = None
+    for interval in intervals:
+        if prev_end is not None:
+            gap = _utc(interval.start_time) - prev_end
+            if gap > UPTIME_GAP:
+                gaps.append(gap)
+        end = _utc(interval.end_time)
+        prev_end = end if prev_end is None else max(prev_end, end)
+    if now - prev_end > UPTIME_GAP:
+        gaps.append(now - prev_end)
+
+    observed = (now - start).total_seconds()
+    downtime = sum(g.total_seconds() for g in gaps)
+    return schemas.DeviceUptime(
+        device_id=device_id,
+        days=days,
+        since=start,
+        uptime_seconds=round(max(observed - downtime, 0.0)),
+        downtime_seconds=round(downtime),
+        uptime_percent=round(100.0 * (observed - downtime) / observed, 3) if observed > 0 else None,
+        outages=len(gaps),
+        longest_outage_seconds=round(max(g.total_seconds() for g in gaps)) if gaps else 0,
+    )
 
 
 # Sensor health computation
 
+def expected_report_interval(sensor: models.Sensor, reading_interval: int) -> int:
+    """Longest gap between uploads the sensor's report mode allows, in seconds.
+
+    on_change sensors stay silent while moisture is within their deadband, so
+    they are only overdue once report_max_silence has passed.
+    """
+    if sensor.report_mode == models.ReportMode.on_change:
+        return max(reading_interval, sensor.report_max_silence or models.DEFAULT_REPORT_MAX_SILENCE)
+    return reading_interval
+
+
 def compute_sensor_health(db: Session, sensor_db_id: int, expected_interval_seconds: int, is_demo: bool = False):
     now = datetime.now(timezone.utc)
 
-    readings = (db.query(models.Reading)
-                .filter(models.Reading.sensor_id == sensor_db_id, models.Reading.is_demo == is_demo)
-                .order_by(models.Reading.timestamp.desc())
-                .limit(20)
-                .all())
+    # Recent window from sensor_state, newest first: [iso timestamp, moisture, raw_adc]
+    state = get_sensor_state(db, sensor_db_id, is_demo=is_demo)
+    readings = list(reversed(state.recent or [])) if state else []
 
     total_checked = len(readings)
 
@@ -779,18 +1543,17 @@ def compute_sensor_health(db: Session, sensor_db_id: int, expected_interval_seco
             "total_readings_checked": 0,
         }
 
-    latest = readings[0]
-    latest_ts = latest.timestamp.replace(tzinfo=timezone.utc) if latest.timestamp.tzinfo is None else latest.timestamp
+    latest_ts = state.last_timestamp.replace(tzinfo=timezone.utc) if state.last_timestamp.tzinfo is None else state.last_timestamp
     age_seconds = (now - latest_ts).total_seconds()
     reading_frequency_ok = age_seconds <= (expected_interval_seconds * 3)
 
     # Check last 5 raw_adc values for stuck sensor
-    recent_adc = [r.raw_adc for r in readings[:5] if r.raw_adc is not None]
+    recent_adc = [raw_adc for _, _, raw_adc in readings[:5] if raw_adc is not None]
     stuck_at_zero = len(recent_adc) >= 5 and all(v == 0 for v in recent_adc)
     stuck_at_max = len(recent_adc) >= 5 and all(v == 4095 for v in recent_adc)
 
     # Compute variance of moisture values
-    moisture_vals = [r.moisture for r in readings if r.moisture is not None]
+    moisture_vals = [moisture for _, moisture, _ in readings if moisture is not None]
     if len(moisture_vals) >= 2:
         mean = sum(moisture_vals) / len(moisture_vals)
         variance = sum((v - mean) ** 2 for v in moisture_vals) / len(moisture_vals)
@@ -817,7 +1580,11 @@ def compute_sensor_health(db: Session, sensor_db_id: int, expected_interval_seco
 def get_compare_readings(db: Session, sensor_db_ids: list, hours: int, is_demo: bool = False):
     now = datetime.now(timezone.utc)
     start_time = now - timedelta(hours=hours)
-    aggregated = hours > 24
+    # Hourly points past a day keep the chart readable; older ranges may need a coarser tier anyway
+    resolution = pick_resolution(db, start_time)
+    if hours > 24:
+        resolution = max(resolution or 0, 3600)
+    aggregated = resolution is not None
 
     sensors_data = []
     for sid in sensor_db_ids:
@@ -829,25 +1596,12 @@ def get_compare_readings(db: Session, sensor_db_ids: list, hours: int, is_demo:
             continue
 
         if aggregated:
-            rows = db.query(
-                func.strftime('%Y-%m-%d %H:00', models.Reading.timestamp).label('hour'),
-                func.avg(models.Reading.moisture).label('avg_moisture'),
-            ).filter(
-                models.Reading.sensor_id == sid,
-                models.Reading.timestamp >= start_time,
-            ).group_by(
-                func.strftime('%Y-%m-%d %H:00', models.Reading.timestamp)
-            ).order_by('hour').all()
-
             readings = [
-                {"timestamp": row.hour, "moisture": round(row.avg_moisture, 1)}
-                for row in rows
+                {"timestamp": b["bucket_start"].strftime('%Y-%m-%d %H:%M'), "moisture": round(b["moisture_sum"] / b["reading_count"], 1)}
+                for b in get_rollups(db, [sid], resolution, start_time=start_time, is_demo=is_demo)[sid]
             ]
         else:
-            raw = db.query(models.Reading).filter(
-                models.Reading.sensor_id == sid,
-                models.Reading.timestamp >= start_time,
-            ).order_by(models.Reading.timestamp.asc()).all()
+            raw = reading_partitions.select_readings(db, lambda t: (t.c.sensor_id == sid,), start_time=start_time)
 
             readings = [
                 {"timestamp": r.timestamp.isoformat(), "moisture": r.moisture}
@@ -866,5 +1620,6 @@ def get_compare_readings(db: Session, sensor_db_ids: list, hours: int, is_demo:
         "sensor_count": len(sensors_data),
         "hours": hours,
         "aggregated": aggregated,
+        "bucket_seconds": resolution,
         "sensors": sensors_data,
     }
@@ -1,58 +1,257 @@
 # database.py
 
+import logging
 import os
+import threading
+import time
+from datetime import datetime, timezone
 from dotenv import load_dotenv
-from sqlalchemy import create_engine, text
+from sqlalchemy import create_engine, event, exc, text
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.pool import QueuePool
 
 load_dotenv()
 
 SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./backend.db")
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
-)
+# Applied to every new connection. WAL lets readers run while ingest commits
+# instead of waiting on the rollback journal's exclusive lock; NORMAL only
+# fsyncs at checkpoints, which in WAL mode can lose the last commits on power
+# loss but never corrupts the file. cache_size is per connection (negative
+# means KiB), so the pool size bounds its total; mmap pages are shared
+# through the OS page cache. WAL needs shared memory, so set
+# SQLITE_JOURNAL_MODE=DELETE if the database lives on a network filesystem.
+SQLITE_PRAGMAS = {
+    "busy_timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000")),
+    "journal_mode": os.getenv("SQLITE_JOURNAL_MODE", "WAL"),
+    "synchronous": os.getenv("SQLITE_SYNCHRONOUS", "NORMAL"),
+    "cache_size": -int(os.getenv("SQLITE_CACHE_SIZE_KB", "16384")),
+    "mmap_size": int(os.getenv("SQLITE_MMAP_SIZE_MB", "256")) * 1024 * 1024,
+    "temp_store": "MEMORY",
+}
+
+# Pooled connections keep their pragmas and page cache between requests.
+# SQLite allows one writer at a time, so extra connections only help readers.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "8"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "8"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+
+# Worker threads for database work (sync routes and run_in_threadpool calls,
+# see main.size_db_threads). Requests past this wait on the event loop rather
+# than in a thread blocked on the pool. It defaults to the pool size so that
+# the overflow connections cover sessions that are held across an await.
+DB_THREADS = int(os.getenv("DB_THREADS", str(DB_POOL_SIZE)))
+
+# Analytics (dashboard, compare, export, admin stats) reads through its own
+# read-only pool and threads (see dependencies.run_read), so long scans queue
+# among themselves instead of taking the connections and threads that device
+# ingest needs. In WAL mode these readers never block the writer.
+DB_READ_POOL_SIZE = int(os.getenv("DB_READ_POOL_SIZE", "4"))
+DB_READ_MAX_OVERFLOW = int(os.getenv("DB_READ_MAX_OVERFLOW", "0"))
+DB_READ_POOL_TIMEOUT = float(os.getenv("DB_READ_POOL_TIMEOUT", "10"))
+DB_READ_THREADS = int(os.getenv("DB_READ_THREADS", str(DB_READ_POOL_SIZE)))
+
+# journal_mode and synchronous are the writer's settings; query_only makes a
+# stray write fail instead of taking the write lock
+READ_PRAGMAS = {k: v for k, v in SQLITE_PRAGMAS.items() if k not in ("journal_mode", "synchronous")} | {"query_only": 1}
+
+
+class MeteredPool(QueuePool):
+    """QueuePool that counts checkouts, timeouts and the time spent waiting for a connection."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._metrics_lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            conn = super()._do_get()
+        except exc.TimeoutError:
+            with self._metrics_lock:
+                self.timeouts += 1
+            raise
+        waited = time.perf_counter() - started
+        with self._metrics_lock:
+            self.checkouts += 1
+            self.wait_seconds += waited
+            self.max_wait_seconds = max(self.max_wait_seconds, waited)
+        return conn
+
+
+def apply_sqlite_pragmas(dbapi_connection, pragmas: dict = SQLITE_PRAGMAS):
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+    finally:
+        cursor.close()
+
+
+def is_file_url(url: str) -> bool:
+    return ":memory:" not in url and url.rstrip("/") != "sqlite:"
+
+
+def read_only_url(url: str) -> str:
+    """The same SQLite file opened read-only (mode=ro URI)."""
+    path = os.path.abspath(make_url(url).database)
+    return f"sqlite:///file:{path}?mode=ro&uri=true"
+
+
+def create_db_engine(url: str = SQLALCHEMY_DATABASE_URL, pragmas: dict = SQLITE_PRAGMAS, pool_size: int = DB_POOL_SIZE,
+                     max_overflow: int = DB_MAX_OVERFLOW, pool_timeout: float = DB_POOL_TIMEOUT):
+    """Engine with the pragma profile and a sized, metered pool (in-memory URLs keep SQLAlchemy's default pool)."""
+    kwargs = {}
+    if is_file_url(url):
+        kwargs = dict(poolclass=MeteredPool, pool_size=pool_size, max_overflow=max_overflow, pool_timeout=pool_timeout)
+    db_engine = create_engine(url, connect_args={"check_same_thread": False}, **kwargs)
+    if pragmas:
+        event.listen(db_engine, "connect", lambda dbapi_connection, _: apply_sqlite_pragmas(dbapi_connection, pragmas))
+    return db_engine
+
+
+engine = create_db_engine()
+# An in-memory database only exists on its own connection, so it has no separate read pool
+read_engine = (create_db_engine(read_only_url(SQLALCHEMY_DATABASE_URL), READ_PRAGMAS, DB_READ_POOL_SIZE,
+                                DB_READ_MAX_OVERFLOW, DB_READ_POOL_TIMEOUT)
+               if is_file_url(SQLALCHEMY_DATABASE_URL) else engine)
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+
+
+def pool_stats(db_engine) -> dict:
+    pool = db_engine.pool
+    stats = {"pool_size": None, "checked_out": None, "overflow": None, "checkouts": None, "timeouts": None,
+             "avg_wait_ms": None, "max_wait_ms": None}
+    if isinstance(pool, QueuePool):
+        stats.update(pool_size=pool.size(), checked_out=pool.checkedout(), overflow=max(0, pool.overflow()))
+    if isinstance(pool, MeteredPool):
+        stats.update(
+            checkouts=pool.checkouts,
+            timeouts=pool.timeouts,
+            avg_wait_ms=round(pool.wait_seconds / pool.checkouts * 1000, 3) if pool.checkouts else 0.0,
+            max_wait_ms=round(pool.max_wait_seconds * 1000, 3),
+        )
+    return stats
 
 Base = declarative_base()
 
+def _partition_legacy_readings(db):
+    # The copy used to run here, holding up startup for as long as it took.
+    # It now runs in batches after the server is up (crud.migrate_legacy_readings,
+    # see main.start_background_jobs); reads cover the legacy table until then.
+    pass
+
+
+# Schema changes for databases created by older versions, in order. A
+# database's schema version is the number of these it has had, recorded in
+# schema_version; a new database gets the current schema from create_all and
+# starts at the latest version. Append only: never edit, reorder or remove
+# an entry that has shipped. An entry is SQL, or a function taking a Session
+# for data migrations.
+MIGRATIONS = [
+    "ALTER TABLE sensors ADD COLUMN calibration_dry FLOAT",
+    "ALTER TABLE sensors ADD COLUMN calibration_wet FLOAT",
+    "ALTER TABLE readings ADD COLUMN raw_adc FLOAT",
+    "ALTER TABLE sensors ADD COLUMN zone_id INTEGER REFERENCES zones(id)",
+    "ALTER TABLE sensors ADD COLUMN notes TEXT",
+    "ALTER TABLE sensors ADD COLUMN auto_log_watering BOOLEAN DEFAULT 0",
+    "ALTER TABLE system_config ADD COLUMN moisture_jump_threshold FLOAT DEFAULT 15.0",
+    "ALTER TABLE system_config ADD COLUMN ntfy_enabled BOOLEAN DEFAULT 0",
+    "ALTER TABLE system_config ADD COLUMN ntfy_server_url TEXT DEFAULT 'https://ntfy.sh'",
+    "ALTER TABLE system_config ADD COLUMN ntfy_topic TEXT",
+    "ALTER TABLE devices ADD COLUMN offline_notified BOOLEAN DEFAULT 0",
+    "ALTER TABLE system_config ADD COLUMN weather_latitude FLOAT",
+    "ALTER TABLE system_config ADD COLUMN weather_longitude FLOAT",
+    "ALTER TABLE system_config ADD COLUMN retention_days INTEGER DEFAULT 90",
+    "ALTER TABLE devices ADD COLUMN deploy_token TEXT",
+    "ALTER TABLE devices ADD COLUMN is_demo BOOLEAN DEFAULT 0",
+    "ALTER TABLE sensors ADD COLUMN is_demo BOOLEAN DEFAULT 0",
+    "ALTER TABLE readings ADD COLUMN is_demo BOOLEAN DEFAULT 0",
+    "ALTER TABLE zones ADD COLUMN is_demo BOOLEAN DEFAULT 0",
+    "ALTER TABLE thresholds ADD COLUMN is_demo BOOLEAN DEFAULT 0",
+    "ALTER TABLE alerts ADD COLUMN is_demo BOOLEAN DEFAULT 0",
+    "ALTER TABLE watering_logs ADD COLUMN is_demo BOOLEAN DEFAULT 0",
+    "ALTER TABLE heartbeat_logs ADD COLUMN is_demo BOOLEAN DEFAULT 0",
+    "CREATE INDEX IF NOT EXISTS ix_readings_sensor_timestamp ON readings (sensor_id, timestamp)",
+    "ALTER TABLE readings ADD COLUMN boot_id INTEGER",
+    "ALTER TABLE readings ADD COLUMN seq INTEGER",
+    "CREATE UNIQUE INDEX IF NOT EXISTS ux_readings_device_seq ON readings (device_id, boot_id, seq, sensor_id)",
+    "ALTER TABLE sensors ADD COLUMN report_mode VARCHAR(9) DEFAULT 'interval'",
+    "ALTER TABLE sensors ADD COLUMN report_deadband FLOAT",
+    "ALTER TABLE sensors ADD COLUMN report_max_silence INTEGER",
+    "ALTER TABLE devices ADD COLUMN config_version INTEGER DEFAULT 1",
+    "CREATE INDEX IF NOT EXISTS ix_heartbeat_logs_device_timestamp ON heartbeat_logs (device_id, timestamp)",
+    "ALTER TABLE system_config ADD COLUMN rollup_5m_retention_days INTEGER DEFAULT 365",
+    "CREATE INDEX IF NOT EXISTS ix_rollups_resolution_start ON reading_rollups (bucket_seconds, bucket_start)",
+    _partition_legacy_readings,
+]
+
+# Databases from before schema_version may have had any of the first
+# BASELINE_VERSION migrations. Those are tried once each, ignoring failures
+# (the column already exists), and the database is stamped with this version.
+BASELINE_VERSION = 34
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def _stamp(conn, version: int):
+    conn.execute(text("INSERT INTO schema_version (version, applied_at) VALUES (:version, :applied_at)"),
+                 {"version": version, "applied_at": datetime.now(timezone.utc).replace(tzinfo=None)})
+
+
+def schema_version() -> int:
+    with engine.connect() as conn:
+        return conn.execute(text("SELECT MAX(version) FROM schema_version")).scalar() or 0
+
+
 def init_db():
+    """Create missing tables; a new database is stamped with the latest schema version."""
     import models  # Import here to avoid circular imports
-    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        new = conn.execute(text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'devices'")).first() is None
+        Base.metadata.create_all(bind=conn)
+        conn.execute(text("CREATE TABLE IF NOT EXISTS schema_version (version INTEGER PRIMARY KEY, applied_at DATETIME NOT NULL)"))
+        if new:
+            _stamp(conn, SCHEMA_VERSION)
 
 
-def upgrade_db():
-    """Add new columns to existing tables (idempotent for SQLite)."""
+def upgrade_db() -> list:
+    """Apply the migrations newer than the database's schema version, each once; returns the versions applied."""
+    applied = []
     with engine.connect() as conn:
-        migrations = [
-            "ALTER TABLE sensors ADD COLUMN calibration_dry FLOAT",
-            "ALTER TABLE sensors ADD COLUMN calibration_wet FLOAT",
-            "ALTER TABLE readings ADD COLUMN raw_adc FLOAT",
-            "ALTER TABLE sensors ADD COLUMN zone_id INTEGER REFERENCES zones(id)",
-            "ALTER TABLE sensors ADD COLUMN notes TEXT",
-            "ALTER TABLE sensors ADD COLUMN auto_log_watering BOOLEAN DEFAULT 0",
-            "ALTER TABLE system_config ADD COLUMN moisture_jump_threshold FLOAT DEFAULT 15.0",
-            "ALTER TABLE system_config ADD COLUMN ntfy_enabled BOOLEAN DEFAULT 0",
-            "ALTER TABLE system_config ADD COLUMN ntfy_server_url TEXT DEFAULT 'https://ntfy.sh'",
-            "ALTER TABLE system_config ADD COLUMN ntfy_topic TEXT",
-            "ALTER TABLE devices ADD COLUMN offline_notified BOOLEAN DEFAULT 0",
-            "ALTER TABLE system_config ADD COLUMN weather_latitude FLOAT",
-            "ALTER TABLE system_config ADD COLUMN weather_longitude FLOAT",
-            "ALTER TABLE system_config ADD COLUMN retention_days INTEGER DEFAULT 90",
-            "ALTER TABLE devices ADD COLUMN deploy_token TEXT",
-            "ALTER TABLE devices ADD COLUMN is_demo BOOLEAN DEFAULT 0",
-            "ALTER TABLE sensors ADD COLUMN is_demo BOOLEAN DEFAULT 0",
-            "ALTER TABLE readings ADD COLUMN is_demo BOOLEAN DEFAULT 0",
-            "ALTER TABLE zones ADD COLUMN is_demo BOOLEAN DEFAULT 0",
-            "ALTER TABLE thresholds ADD COLUMN is_demo BOOLEAN DEFAULT 0",
-            "ALTER TABLE alerts ADD COLUMN is_demo BOOLEAN DEFAULT 0",
-            "ALTER TABLE watering_logs ADD COLUMN is_demo BOOLEAN DEFAULT 0",
-            "ALTER TABLE heartbeat_logs ADD COLUMN is_demo BOOLEAN DEFAULT 0",
-        ]
-        for sql in migrations:
-            try:
-                conn.execute(text(sql))
-                conn.commit()
-            except Exception:
-                conn.rollback()
+        version = conn.execute(text("SELECT MAX(version) FROM schema_version")).scalar()
+        if version is None:
+            for sql in MIGRATIONS[:BASELINE_VERSION]:
+                try:
+                    conn.execute(text(sql))
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+            _stamp(conn, BASELINE_VERSION)
+            conn.commit()
+            version = BASELINE_VERSION
+            applied.append(BASELINE_VERSION)
+
+    for number in range(version + 1, SCHEMA_VERSION + 1):
+        migration = MIGRATIONS[number - 1]
+        if callable(migration):
+            # Data migrations commit their own work, so they must be safe to rerun
+            with SessionLocal() as db:
+                migration(db)
+                db.commit()
+            with engine.begin() as conn:
+                _stamp(conn, number)
+        else:
+            with engine.begin() as conn:
+                conn.execute(text(migration))
+                _stamp(conn, number)
+        logging.info(f"Applied schema migration {number}")
+        applied.append(number)
+    return applied
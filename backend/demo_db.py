@@ -0,0 +1,90 @@
+# demo_db.py
+"""Separate in-memory database for the demo role.
+
+Demo users (UserInfo.is_demo) never touch the production file. Their
+sessions come from session(), which on first use builds the demo dataset
+(seed_demo) into an in-memory SQLite database. It uses the memdb VFS, so
+every pooled connection shares one database with normal SQLite locking.
+The demo timestamps are relative to the time of the build, so after
+DEMO_REFRESH_HOURS the next demo request builds a fresh copy and swaps it
+in; sessions still open on the old copy finish against it.
+
+The build runs the same derived-data steps as the background jobs (sensor
+state, rollups, heartbeat compaction), so demo pages read exactly as they
+did when the demo rows lived in the production database. Production
+startup does no demo work at all.
+"""
+
+import itertools
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from sqlalchemy.orm import sessionmaker
+
+import crud
+import seed_demo
+from database import Base, SQLITE_PRAGMAS, create_db_engine
+
+logger = logging.getLogger(__name__)
+
+DEMO_REFRESH_HOURS = float(os.getenv("DEMO_REFRESH_HOURS", "6"))
+DEMO_POOL_SIZE = int(os.getenv("DEMO_POOL_SIZE", "4"))
+
+# The memdb VFS has no journal or disk, so only the lock wait applies
+DEMO_PRAGMAS = {"busy_timeout": SQLITE_PRAGMAS["busy_timeout"]}
+
+_lock = threading.Lock()
+_generation = itertools.count(1)
+_current = None  # (sessionmaker, anchor connection, monotonic build time)
+
+
+def _build():
+    name = f"/plant_water_demo_{next(_generation)}"
+    # The database lives as long as some connection has it open; the anchor
+    # keeps it alive while the pool opens and closes its own connections
+    anchor = sqlite3.connect(f"file:{name}?vfs=memdb", uri=True, check_same_thread=False)
+    db_engine = create_db_engine(f"sqlite:///file:{name}?vfs=memdb&uri=true", DEMO_PRAGMAS,
+                                 pool_size=DEMO_POOL_SIZE, max_overflow=DEMO_POOL_SIZE)
+    Base.metadata.create_all(bind=db_engine)
+    Session = sessionmaker(autocommit=False, autoflush=False, bind=db_engine)
+
+    started = time.perf_counter()
+    db = Session()
+    try:
+        crud.get_system_config(db)
+        seed_demo.seed(db)
+        db.commit()
+        crud.rebuild_sensor_state(db)
+        crud.refresh_rollups(db)
+        crud.compact_heartbeat_logs(db)
+        db.commit()
+    except Exception:
+        db.rollback()
+        db_engine.dispose()
+        anchor.close()
+        raise
+    finally:
+        db.close()
+    logger.info(f"Demo database built in {(time.perf_counter() - started) * 1000:.0f} ms")
+    return Session, anchor, time.monotonic()
+
+
+def _sessionmaker() -> sessionmaker:
+    global _current
+    with _lock:
+        if _current is None or time.monotonic() - _current[2] > DEMO_REFRESH_HOURS * 3600:
+            old = _current
+            _current = _build()
+            if old is not None:
+                old_session, old_anchor, _ = old
+                old_session.kw["bind"].dispose()
+                old_anchor.close()
+        return _current[0]
+
+
+def session():
+    """A session on the demo database, building or refreshing it first if needed."""
+    return _sessionmaker()()
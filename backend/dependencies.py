@@ -1,6 +1,17 @@
 # dependencies.py
 
-from database import SessionLocal
+import functools
+
+import anyio
+import anyio.lowlevel
+import anyio.to_thread
+from fastapi import Depends
+
+import demo_db
+from auth import UserInfo, get_current_user, get_current_user_or_api_key
+from database import DB_READ_THREADS, ReadSessionLocal, SessionLocal
+
+_read_limiter = anyio.lowlevel.RunVar("read_limiter")
 
 
 def get_db():
@@ -9,3 +20,48 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+def _user_session(user: UserInfo):
+    db = demo_db.session() if user.is_demo else SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def get_user_db(user: UserInfo = Depends(get_current_user)):
+    """Session on the database the signed-in user sees: the demo database for the demo role."""
+    yield from _user_session(user)
+
+
+def get_user_db_or_api_key(user: UserInfo = Depends(get_current_user_or_api_key)):
+    """get_user_db for routes that also accept the deploy API key."""
+    yield from _user_session(user)
+
+
+def read_limiter() -> anyio.CapacityLimiter:
+    """Worker threads for analytics reads, separate from the default pool that ingest uses."""
+    try:
+        return _read_limiter.get()
+    except LookupError:
+        limiter = anyio.CapacityLimiter(DB_READ_THREADS)
+        _read_limiter.set(limiter)
+        return limiter
+
+
+def _with_read_session(demo, fn, *args, **kwargs):
+    db = demo_db.session() if demo else ReadSessionLocal()
+    try:
+        return fn(db, *args, **kwargs)
+    finally:
+        db.close()
+
+
+async def run_read(fn, *args, demo: bool = False, **kwargs):
+    """Run fn(db, *args, **kwargs) on a read-only session in an analytics worker thread.
+
+    With demo=True the session is on the demo database instead.
+    """
+    call = functools.partial(_with_read_session, demo, fn, *args, **kwargs)
+    return await anyio.to_thread.run_sync(call, limiter=read_limiter())
@@ -1,18 +1,32 @@
 # main.py
 
+import asyncio
+import logging
 import os
+import time
+
+# Imported first so that the startup report's clock covers the imports below
+from services.startup_report import startup_report
+
+import anyio
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from routers import auth, devices, sensors, readings, alerts, zones, dashboard, config, watering_logs, admin
-from database import init_db, upgrade_db
-import crud
+from database import DB_THREADS, init_db, schema_version, upgrade_db, SessionLocal
+import crud, seed_demo
+from services.ingest_queue import INGEST_MODE, ingest_queue
+from services.notification_dispatcher import notification_dispatcher
+from services.device_liveness import device_liveness
+
+startup_report.mark("imports")
 
 app = FastAPI()
 init_db()
-upgrade_db()
-
-from seed_demo import seed_demo_data
-seed_demo_data()
+_applied = upgrade_db()
+startup_report.mark("schema", f"version {schema_version()}, migrations applied: {_applied or 'none'}")
+with SessionLocal() as _db:
+    # Analytics sessions are read-only, so the config row must exist before they look it up
+    crud.get_system_config(_db)
 
 # Configure CORS
 cors_origins_raw = os.getenv("CORS_ORIGINS", "*")
@@ -37,25 +51,123 @@ app.include_router(config.router)
 app.include_router(watering_logs.router)
 app.include_router(admin.router)
 
+startup_report.mark("app setup")
+
 
 @app.on_event("startup")
-async def auto_cleanup_old_readings():
-    """Auto-delete readings older than retention_days on startup."""
-    import logging
-    from dependencies import get_db
-    db = next(get_db())
+async def size_db_threads():
+    """Size anyio's worker pool, which runs every DB route and run_in_threadpool call, for the database (default 40)."""
+    anyio.to_thread.current_default_thread_limiter().total_tokens = DB_THREADS
+
+
+STALE_SENSOR_CHECK_INTERVAL = 60  # seconds
+HEARTBEAT_COMPACT_INTERVAL = 3600  # seconds
+ROLLUP_REFRESH_INTERVAL = 60  # seconds
+RETENTION_INTERVAL = 3600  # seconds
+
+_background_tasks = []
+
+
+def _run_job(job):
+    db = SessionLocal()
     try:
-        config = crud.get_system_config(db)
-        if config.retention_days and config.retention_days > 0:
-            deleted = crud.delete_old_readings(db, config.retention_days)
-            if deleted > 0:
-                logging.info(f"Auto-cleanup: deleted {deleted} readings older than {config.retention_days} days")
-    except Exception as e:
-        logging.error(f"Auto-cleanup failed: {e}")
+        return job(db)
     finally:
         db.close()
 
 
+async def _run_periodically(interval: int, job):
+    """Run job(db) every interval seconds in a worker thread with its own session."""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await asyncio.to_thread(_run_job, job)
+        except Exception as e:
+            logging.error(f"Background job {job.__name__} failed: {e}")
+
+
+async def _run_deferred(*jobs):
+    """Run each job(db) once, in order, in a worker thread after startup; results go in the startup report.
+
+    One at a time, so they don't contend with each other for SQLite's write lock.
+    """
+    for job in jobs:
+        started = time.perf_counter()
+        try:
+            detail = f"result {await asyncio.to_thread(_run_job, job)}"
+        except Exception as e:
+            logging.error(f"Deferred startup job {job.__name__} failed: {e}")
+            detail = f"failed: {e}"
+        startup_report.add_deferred(job.__name__, time.perf_counter() - started, detail)
+
+
+@app.on_event("startup")
+async def start_ingest_queue():
+    if INGEST_MODE == "queue":
+        await ingest_queue.start()
+
+
+@app.on_event("startup")
+async def start_notification_dispatcher():
+    await notification_dispatcher.start()
+
+
+@app.on_event("startup")
+async def start_device_liveness():
+    db = SessionLocal()
+    try:
+        device_liveness.load(db)
+    finally:
+        db.close()
+    await device_liveness.start()
+
+
+@app.on_event("startup")
+async def start_background_jobs():
+    # Maintenance that used to hold up /ping: moving a pre-partitioning
+    # readings table into the partitions, retention (then hourly), sensor
+    # state for sensors that have none yet (upgrades), and demo rows left by
+    # versions that seeded the demo into this database
+    _background_tasks.append(asyncio.create_task(_run_deferred(
+        crud.migrate_legacy_readings, crud.apply_retention_tiers, crud.rebuild_sensor_state, seed_demo.purge_demo_data)))
+    _background_tasks.append(asyncio.create_task(_run_periodically(STALE_SENSOR_CHECK_INTERVAL, crud.check_stale_sensors)))
+    _background_tasks.append(asyncio.create_task(_run_periodically(HEARTBEAT_COMPACT_INTERVAL, crud.compact_heartbeat_logs)))
+    _background_tasks.append(asyncio.create_task(_run_periodically(ROLLUP_REFRESH_INTERVAL, crud.refresh_rollups)))
+    _background_tasks.append(asyncio.create_task(_run_periodically(RETENTION_INTERVAL, crud.apply_retention_tiers)))
+
+
+@app.on_event("startup")
+async def report_ready():
+    """Registered last: the app serves requests once this returns."""
+    startup_report.ready()
+
+
+@app.on_event("shutdown")
+async def stop_background_jobs():
+    for task in _background_tasks:
+        task.cancel()
+    await asyncio.gather(*_background_tasks, return_exceptions=True)
+    _background_tasks.clear()
+
+
+@app.on_event("shutdown")
+async def flush_ingest_queue():
+    """Flush readings still waiting in the write-behind queue."""
+    await ingest_queue.stop()
+
+
+@app.on_event("shutdown")
+async def stop_device_liveness():
+    """Write out coalesced last_seen values."""
+    await device_liveness.stop()
+
+
+@app.on_event("shutdown")
+async def stop_notification_dispatcher():
+    """Undelivered notifications stay in the outbox for the next start."""
+    await notification_dispatcher.stop()
+
+
 @app.get("/ping")
 async def ping():
     return {"message": "pong"}
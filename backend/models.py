@@ -1,7 +1,7 @@
 # models.py
 
 import enum
-from sqlalchemy import Column, Integer, String, Float, DateTime, Boolean, ForeignKey, Enum
+from sqlalchemy import Column, Integer, String, Float, DateTime, Boolean, ForeignKey, Enum, Index, JSON, LargeBinary
 from sqlalchemy.orm import relationship
 from datetime import datetime, timezone
 from database import Base
@@ -13,6 +13,15 @@ class WateringMethod(str, enum.Enum):
     rain = "rain"
 
 
+class ReportMode(str, enum.Enum):
+    interval = "interval"    # firmware uploads every reading_interval
+    on_change = "on_change"  # uploads when moisture moves past report_deadband, or after report_max_silence
+
+
+DEFAULT_REPORT_DEADBAND = 1.0      # moisture percentage points
+DEFAULT_REPORT_MAX_SILENCE = 3600  # seconds
+
+
 class Device(Base):
     __tablename__ = "devices"
 
@@ -25,6 +34,7 @@ class Device(Base):
     last_seen = Column(DateTime, nullable=True)
     offline_notified = Column(Boolean, default=False)
     deploy_token = Column(String, nullable=True)
+    config_version = Column(Integer, default=1)  # bumped whenever the heartbeat config would change
     is_demo = Column(Boolean, default=False, index=True)
 
     sensors = relationship("Sensor", back_populates="device")
@@ -44,6 +54,28 @@ class HeartbeatLog(Base):
     device = relationship("Device", back_populates="heartbeat_logs")
 
 
+class DeviceUptimeInterval(Base):
+    """A run of heartbeats with no gap over UPTIME_GAP and unchanged IP/firmware.
+
+    compact_heartbeat_logs folds heartbeat_logs rows older than
+    HEARTBEAT_RAW_WINDOW into these and deletes them.
+    """
+    __tablename__ = "device_uptime_intervals"
+
+    id = Column(Integer, primary_key=True, index=True)
+    device_id = Column(String, ForeignKey("devices.device_id"))
+    start_time = Column(DateTime)
+    end_time = Column(DateTime)
+    ip_address = Column(String, nullable=True)
+    firmware_version = Column(String, nullable=True)
+    heartbeat_count = Column(Integer, default=1)
+    is_demo = Column(Boolean, default=False, index=True)
+
+    __table_args__ = (
+        Index("ix_uptime_device_end", "device_id", "end_time"),
+    )
+
+
 class Zone(Base):
     __tablename__ = "zones"
 
@@ -68,28 +100,82 @@ class Sensor(Base):
 
     notes = Column(String, nullable=True)
     auto_log_watering = Column(Boolean, default=False)
+    report_mode = Column(Enum(ReportMode), default=ReportMode.interval)
+    report_deadband = Column(Float, nullable=True)      # on_change only, default DEFAULT_REPORT_DEADBAND
+    report_max_silence = Column(Integer, nullable=True)  # seconds, on_change only, default DEFAULT_REPORT_MAX_SILENCE
     is_demo = Column(Boolean, default=False, index=True)
 
     device = relationship("Device", back_populates="sensors")
     zone = relationship("Zone", back_populates="sensors")
-    readings = relationship("Reading", back_populates="sensor")
     threshold = relationship("Threshold", uselist=False, back_populates="sensor")
     watering_logs = relationship("WateringLog", back_populates="sensor")
 
 
-class Reading(Base):
-    __tablename__ = "readings"
+class SensorState(Base):
+    """Latest values per sensor, maintained in the same transaction as each insert."""
+    __tablename__ = "sensor_state"
 
-    id = Column(Integer, primary_key=True, index=True)
-    device_id = Column(String, ForeignKey("devices.device_id"))
-    sensor_id = Column(Integer, ForeignKey("sensors.id"))
-    timestamp = Column(DateTime, default=lambda: datetime.now(timezone.utc))
-    moisture = Column(Float)
-    raw_adc = Column(Float, nullable=True)
+    sensor_id = Column(Integer, ForeignKey("sensors.id"), primary_key=True)
+    last_moisture = Column(Float, nullable=True)
+    last_timestamp = Column(DateTime, nullable=True)
+    last_raw_adc = Column(Float, nullable=True)           # from the latest reading that had one
+    last_raw_adc_timestamp = Column(DateTime, nullable=True)
+    recent = Column(JSON, default=list)                   # [[iso timestamp, moisture, raw_adc], ...] oldest first
     is_demo = Column(Boolean, default=False, index=True)
 
-    sensor = relationship("Sensor", back_populates="readings")
-    device = relationship("Device")
+
+class ReadingRollup(Base):
+    """Per-sensor reading aggregates for one 5-minute, hourly or daily bucket.
+
+    Maintained by crud.refresh_rollups from readings past the RollupState
+    watermarks; charts read these instead of grouping raw readings.
+    """
+    __tablename__ = "reading_rollups"
+
+    sensor_id = Column(Integer, ForeignKey("sensors.id"), primary_key=True)
+    bucket_seconds = Column(Integer, primary_key=True)  # 300, 3600 or 86400
+    bucket_start = Column(DateTime, primary_key=True)   # naive UTC, aligned to bucket_seconds
+    reading_count = Column(Integer, default=0)
+    moisture_sum = Column(Float, default=0.0)
+    moisture_min = Column(Float, nullable=True)
+    moisture_max = Column(Float, nullable=True)
+    last_moisture = Column(Float, nullable=True)
+    last_timestamp = Column(DateTime, nullable=True)
+    is_demo = Column(Boolean, default=False, index=True)
+
+    __table_args__ = (
+        # Retention prunes one resolution by age
+        Index("ix_rollups_resolution_start", "bucket_seconds", "bucket_start"),
+    )
+
+
+class RollupState(Base):
+    """Per reading partition: the highest reading id already folded into reading_rollups."""
+    __tablename__ = "rollup_state"
+
+    id = Column(Integer, primary_key=True)  # the partition's YYYYMM (see reading_partitions)
+    last_reading_id = Column(Integer, default=0)
+
+
+class ReadingBlock(Base):
+    """One sensor's readings for a BLOCK_SECONDS window, bit-packed (see reading_blocks)."""
+    __tablename__ = "reading_blocks"
+
+    sensor_id = Column(Integer, primary_key=True)
+    block_start = Column(DateTime, primary_key=True)  # naive UTC, aligned to reading_blocks.BLOCK_SECONDS
+    count = Column(Integer, nullable=False)
+    first_timestamp = Column(DateTime, nullable=False)
+    last_timestamp = Column(DateTime, nullable=False)
+    data = Column(LargeBinary, nullable=False)
+
+
+class SealedReadingMonth(Base):
+    """A month whose readings partition was packed into reading_blocks and dropped."""
+    __tablename__ = "sealed_reading_months"
+
+    id = Column(Integer, primary_key=True)  # YYYYMM, like RollupState
+    reading_count = Column(Integer, default=0)
+    sealed_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
 
 
 class Threshold(Base):
@@ -117,6 +203,52 @@ class Alert(Base):
     sensor = relationship("Sensor")
 
 
+class AlertRuleType(str, enum.Enum):
+    rate_of_change = "rate_of_change"
+    zone_average = "zone_average"
+    stale_sensor = "stale_sensor"
+
+
+class AlertRule(Base):
+    """Alert rules beyond the per-sensor min/max threshold."""
+    __tablename__ = "alert_rules"
+
+    id = Column(Integer, primary_key=True, index=True)
+    rule_type = Column(Enum(AlertRuleType))
+    sensor_id = Column(Integer, ForeignKey("sensors.id"), nullable=True)  # rate_of_change, stale_sensor
+    zone_id = Column(Integer, ForeignKey("zones.id"), nullable=True)      # zone_average
+    min_moisture = Column(Float, nullable=True)
+    max_moisture = Column(Float, nullable=True)
+    max_change_per_hour = Column(Float, nullable=True)
+    window_minutes = Column(Integer, default=60)
+    stale_after_minutes = Column(Integer, nullable=True)
+    enabled = Column(Boolean, default=True)
+    is_demo = Column(Boolean, default=False, index=True)
+
+
+class NotificationStatus(str, enum.Enum):
+    pending = "pending"
+    failed = "failed"
+
+
+class NotificationOutbox(Base):
+    """ntfy messages waiting for the notification dispatcher; rows are deleted once delivered."""
+    __tablename__ = "notification_outbox"
+
+    id = Column(Integer, primary_key=True, index=True)
+    server_url = Column(String)
+    topic = Column(String)
+    title = Column(String)
+    message = Column(String)
+    priority = Column(String, default="default")
+    tags = Column(JSON, nullable=True)
+    status = Column(Enum(NotificationStatus), default=NotificationStatus.pending, index=True)
+    attempts = Column(Integer, default=0)
+    next_attempt_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), index=True)
+    last_error = Column(String, nullable=True)
+    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+
+
 class SystemConfig(Base):
     __tablename__ = "system_config"
 
@@ -129,7 +261,8 @@ class SystemConfig(Base):
     ntfy_topic = Column(String, nullable=True)
     weather_latitude = Column(Float, nullable=True)
     weather_longitude = Column(Float, nullable=True)
-    retention_days = Column(Integer, default=90)
+    retention_days = Column(Integer, default=90)                  # raw readings
+    rollup_5m_retention_days = Column(Integer, default=365)       # 5-minute aggregates; hourly and daily are kept
 
 
 class WateringLog(Base):
@@ -0,0 +1,262 @@
+# reading_archive.py
+"""Cold archive for readings past raw retention, stored as compressed columnar files.
+
+crud.delete_old_readings archives each monthly partition, or sealed month
+(see reading_blocks), here before it drops it. There is one file per sensor and month:
+
+    $READING_ARCHIVE_PATH/<sensor db id>/<YYYYMM>.pwa
+
+All integers are little-endian. Version 1:
+
+    offset  size  field
+    0       4     magic b"PWAR"
+    4       1     version (1)
+    5       1     n = length of device_id
+    6       n     device_id, UTF-8
+    6+n     4     count of readings
+    10+n    8     first timestamp, Unix milliseconds
+    18+n    8     last timestamp, Unix milliseconds
+    26+n    ...   three column blocks, each a u32 length then zlib data:
+                  timestamps - int64 millisecond deltas, oldest first
+                  moisture   - float64
+                  raw_adc    - float64, NaN when the reading had none
+
+Readings arrive at a steady interval, so the timestamp deltas compress to
+almost nothing and the moisture and raw_adc columns make up most of a file.
+Timestamps keep millisecond precision. The header is enough to list files
+without decompressing them. Demo readings are not archived.
+"""
+
+import math
+import os
+import struct
+import sys
+import zlib
+from array import array
+from datetime import datetime, timedelta, timezone
+from typing import NamedTuple, Optional
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+import reading_blocks
+import reading_partitions
+
+ARCHIVE_PATH = os.getenv("READING_ARCHIVE_PATH", "./reading_archive")
+MAGIC = b"PWAR"
+VERSION = 1
+SUFFIX = ".pwa"
+
+_PREFIX = struct.Struct("<4sBB")
+_COUNTS = struct.Struct("<Iqq")
+_BLOCK = struct.Struct("<I")
+
+
+class ArchiveError(ValueError):
+    pass
+
+
+class ArchiveHeader(NamedTuple):
+    sensor_id: int
+    month: int  # YYYYMM
+    device_id: str
+    count: int
+    first_timestamp: datetime
+    last_timestamp: datetime
+    size_bytes: int
+
+
+class ArchivedReading(NamedTuple):
+    timestamp: datetime  # naive UTC, like the readings tables
+    moisture: float
+    raw_adc: Optional[float]
+
+
+def enabled() -> bool:
+    return bool(ARCHIVE_PATH)
+
+
+def _to_ms(ts: datetime) -> int:
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=timezone.utc)
+    return round(ts.timestamp() * 1000)
+
+
+def _from_ms(ms: int) -> datetime:
+    return datetime.fromtimestamp(ms / 1000, timezone.utc).replace(tzinfo=None)
+
+
+def _le_bytes(values: array) -> bytes:
+    if sys.byteorder == "big":
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def _from_le(typecode: str, data: bytes) -> array:
+    values = array(typecode)
+    values.frombytes(data)
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values
+
+
+def file_path(sensor_id: int, month: int) -> str:
+    return os.path.join(ARCHIVE_PATH, str(sensor_id), f"{month}{SUFFIX}")
+
+
+def encode(device_id: str, readings: list) -> bytes:
+    """Encode [ArchivedReading, ...], which must be sorted oldest first."""
+    dev = device_id.encode()
+    ms = [_to_ms(r.timestamp) for r in readings]
+    deltas = array("q", (b - a for a, b in zip([0] + ms, ms)))
+    moisture = array("d", (r.moisture for r in readings))
+    raw_adc = array("d", (math.nan if r.raw_adc is None else r.raw_adc for r in readings))
+    out = [_PREFIX.pack(MAGIC, VERSION, len(dev)), dev,
+           _COUNTS.pack(len(readings), ms[0] if ms else 0, ms[-1] if ms else 0)]
+    for column in (deltas, moisture, raw_adc):
+        block = zlib.compress(_le_bytes(column), 6)
+        out += [_BLOCK.pack(len(block)), block]
+    return b"".join(out)
+
+
+def _read_header(data: bytes):
+    """Returns (device_id, count, first_ms, last_ms, offset of the first column block)."""
+    if len(data) < _PREFIX.size:
+        raise ArchiveError("truncated header")
+    magic, version, dev_len = _PREFIX.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise ArchiveError(f"not a version {VERSION} reading archive")
+    offset = _PREFIX.size + dev_len
+    if len(data) < offset + _COUNTS.size:
+        raise ArchiveError("truncated header")
+    device_id = data[_PREFIX.size:offset].decode()
+    count, first_ms, last_ms = _COUNTS.unpack_from(data, offset)
+    return device_id, count, first_ms, last_ms, offset + _COUNTS.size
+
+
+def decode(data: bytes) -> tuple:
+    """Returns (device_id, [ArchivedReading, ...])."""
+    device_id, count, _, _, offset = _read_header(data)
+    columns = []
+    for typecode in ("q", "d", "d"):
+        (length,) = _BLOCK.unpack_from(data, offset)
+        offset += _BLOCK.size
+        column = _from_le(typecode, zlib.decompress(data[offset:offset + length]))
+        if len(column) != count:
+            raise ArchiveError(f"column holds {len(column)} values, header says {count}")
+        columns.append(column)
+        offset += length
+    deltas, moisture, raw_adc = columns
+    readings, ms = [], 0
+    for delta, m, raw in zip(deltas, moisture, raw_adc):
+        ms += delta
+        readings.append(ArchivedReading(_from_ms(ms), m, None if math.isnan(raw) else raw))
+    return device_id, readings
+
+
+def read_file(sensor_id: int, month: int) -> tuple:
+    with open(file_path(sensor_id, month), "rb") as f:
+        return decode(f.read())
+
+
+def write_file(sensor_id: int, month: int, device_id: str, readings: list) -> int:
+    """Write one sensor-month, merging with readings already archived for it (re-runs, late backfills).
+
+    Returns the number of readings in the file.
+    """
+    path = file_path(sensor_id, month)
+    if os.path.exists(path):
+        _, existing = read_file(sensor_id, month)
+        merged = {(r.timestamp, r.moisture, r.raw_adc): r for r in existing}
+        merged.update(((r.timestamp, r.moisture, r.raw_adc), r) for r in readings)
+        readings = list(merged.values())
+    readings = sorted(readings, key=lambda r: r.timestamp)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(encode(device_id, readings))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    return len(readings)
+
+
+def archive_partition(db: Session, table) -> int:
+    """Copy a partition's non-demo readings into the archive, one file per sensor; returns readings written."""
+    month = reading_partitions.table_key(table)
+    sensor_ids = db.execute(
+        select(table.c.sensor_id).where(table.c.is_demo == False).distinct()
+    ).scalars().all()
+    archived = 0
+    for sensor_id in sensor_ids:
+        rows = db.execute(
+            select(table.c.device_id, table.c.timestamp, table.c.moisture, table.c.raw_adc)
+            .where(table.c.sensor_id == sensor_id, table.c.is_demo == False)
+            .order_by(table.c.timestamp)
+        ).all()
+        readings = [ArchivedReading(ts, m, raw) for _, ts, m, raw in rows if ts is not None and m is not None]
+        if readings:
+            write_file(sensor_id, month, rows[0].device_id, readings)
+            archived += len(readings)
+    return archived
+
+
+def archive_sealed_month(db: Session, key: int) -> int:
+    """Copy a sealed month's non-demo readings out of reading_blocks, one file per sensor; returns readings written."""
+    start, end = reading_partitions.month_bounds(key)
+    end -= timedelta(milliseconds=1)
+    archived = 0
+    for sensor_id, device_id, is_demo in reading_blocks.sensors(db, start, end):
+        if is_demo:
+            continue
+        readings = [ArchivedReading(p.timestamp, p.moisture, p.raw_adc)
+                    for p in reading_blocks.scan(db, sensor_id, start, end) if p.moisture is not None]
+        if readings:
+            write_file(sensor_id, key, device_id, readings)
+            archived += len(readings)
+    return archived
+
+
+def _months(sensor_id: int) -> list:
+    try:
+        names = os.listdir(os.path.join(ARCHIVE_PATH, str(sensor_id)))
+    except FileNotFoundError:
+        return []
+    return sorted(int(n[:-len(SUFFIX)]) for n in names if n.endswith(SUFFIX) and n[:-len(SUFFIX)].isdigit())
+
+
+def list_files(sensor_id: int = None) -> list:
+    """Headers of the archived sensor-months, by sensor then month."""
+    if sensor_id is not None:
+        sensor_ids = [sensor_id]
+    else:
+        try:
+            sensor_ids = sorted(int(n) for n in os.listdir(ARCHIVE_PATH) if n.isdigit())
+        except FileNotFoundError:
+            return []
+    headers = []
+    for sid in sensor_ids:
+        for month in _months(sid):
+            path = file_path(sid, month)
+            with open(path, "rb") as f:
+                head = f.read(_PREFIX.size + 255 + _COUNTS.size)
+            device_id, count, first_ms, last_ms, _ = _read_header(head)
+            headers.append(ArchiveHeader(sid, month, device_id, count, _from_ms(first_ms), _from_ms(last_ms),
+                                         os.path.getsize(path)))
+    return headers
+
+
+def scan(sensor_id: int, start_time: datetime = None, end_time: datetime = None):
+    """Yield a sensor's archived readings in [start_time, end_time], oldest first, one month file at a time."""
+    start = _from_ms(_to_ms(start_time)) if start_time is not None else None
+    end = _from_ms(_to_ms(end_time)) if end_time is not None else None
+    for month in _months(sensor_id):
+        if start is not None and month < reading_partitions.month_key(start):
+            continue
+        if end is not None and month > reading_partitions.month_key(end):
+            break
+        _, readings = read_file(sensor_id, month)
+        for r in readings:
+            if (start is None or r.timestamp >= start) and (end is None or r.timestamp <= end):
+                yield r
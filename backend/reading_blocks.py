@@ -0,0 +1,359 @@
+# reading_blocks.py
+"""Optional block storage for readings: Gorilla-style compressed time series.
+
+Each block holds one sensor's readings for a fixed BLOCK_SECONDS window.
+The block is stored as a single BLOB row in reading_blocks, keyed by
+(sensor_id, block_start). Within a block the points are bit-packed in time
+order, as in Facebook's Gorilla TSDB:
+
+    first point   timestamp (64 bits, Unix ms), moisture and raw_adc (64-bit floats)
+    each next     timestamp as delta-of-delta:
+                      '0'                    same delta as the previous point
+                      '10'   + 7 bits        dod in [-63, 64]
+                      '110'  + 9 bits        dod in [-255, 256]
+                      '1110' + 12 bits       dod in [-2047, 2048]
+                      '1111' + 64 bits       anything else
+                  moisture, then raw_adc, XORed with the previous value:
+                      '0'                    identical value
+                      '10'   + meaningful    bits inside the previous leading/trailing-zero window
+                      '11'   + 5 bits leading zeros + 6 bits length - 1 + meaningful bits
+
+A missing raw_adc is stored as NaN. Timestamps keep millisecond precision.
+Blocks decode lazily: scan() only reads the blocks that overlap the
+requested range, one at a time, and stops once it passes the end.
+
+Nothing in the ingest path writes here. The partitioned readings tables
+remain the store for live data, because reading ids, dedupe and the rollup
+watermarks all depend on one row per reading. With
+READING_BLOCKS_SEAL_AFTER_DAYS set, crud.seal_old_readings packs each
+monthly partition older than that into blocks and drops it; the month is
+then listed in sealed_reading_months and reading_partitions reads it back
+through scan(). Sealed readings keep their timestamp (to the millisecond),
+moisture and raw_adc; the id, boot_id and seq are not kept. Both tables are
+part of the schema (models.ReadingBlock, models.SealedReadingMonth), so the
+read-only pool can scan them. utils/bench_block_storage.py compares this
+engine with the partitions.
+"""
+
+import math
+import os
+import struct
+from datetime import datetime, timezone
+from typing import NamedTuple, Optional
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+import models
+
+BLOCK_SECONDS = 2 * 3600
+# Monthly partitions wholly older than this many days get sealed into blocks; 0 disables
+SEAL_AFTER_DAYS = int(os.getenv("READING_BLOCKS_SEAL_AFTER_DAYS", "0"))
+
+reading_blocks = models.ReadingBlock.__table__
+sealed_months = models.SealedReadingMonth.__table__
+
+_FLOAT = struct.Struct("<d")
+_BITS = struct.Struct("<Q")
+_NAN_BITS = _BITS.unpack(_FLOAT.pack(math.nan))[0]
+_MASK64 = (1 << 64) - 1
+# (prefix, prefix length, value bits) for delta-of-delta ranges that fit in value bits
+_DOD_CLASSES = ((0b10, 2, 7), (0b110, 3, 9), (0b1110, 4, 12))
+
+
+class BlockPoint(NamedTuple):
+    timestamp: datetime  # naive UTC, like the readings tables
+    moisture: float
+    raw_adc: Optional[float]
+
+
+class BitWriter:
+    def __init__(self):
+        self._buf = bytearray()
+        self._acc = 0
+        self._n = 0
+
+    def write(self, value: int, bits: int):
+        self._acc = (self._acc << bits) | (value & ((1 << bits) - 1))
+        self._n += bits
+        while self._n >= 8:
+            self._n -= 8
+            self._buf.append((self._acc >> self._n) & 0xFF)
+        self._acc &= (1 << self._n) - 1
+
+    def getvalue(self) -> bytes:
+        if self._n:
+            return bytes(self._buf) + bytes([(self._acc << (8 - self._n)) & 0xFF])
+        return bytes(self._buf)
+
+
+class BitReader:
+    def __init__(self, data: bytes):
+        self._data = bytes(data) + bytes(8)  # lets read() refill a whole word past the end
+        self._pos = 0
+        self._acc = 0
+        self._n = 0
+
+    def read(self, bits: int) -> int:
+        # Refilling 64 bits at a time keeps this to one branch for most reads
+        if self._n < bits:
+            self._acc = (self._acc << 64) | int.from_bytes(self._data[self._pos:self._pos + 8], "big")
+            self._pos += 8
+            self._n += 64
+        self._n -= bits
+        value = self._acc >> self._n
+        self._acc &= (1 << self._n) - 1
+        return value
+
+
+def _to_ms(ts: datetime) -> int:
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=timezone.utc)
+    return round(ts.timestamp() * 1000)
+
+
+def _from_ms(ms: int) -> datetime:
+    return datetime.fromtimestamp(ms / 1000, timezone.utc).replace(tzinfo=None)
+
+
+def _float_bits(value: Optional[float]) -> int:
+    return _NAN_BITS if value is None or math.isnan(value) else _BITS.unpack(_FLOAT.pack(value))[0]
+
+
+def _bits_float(bits: int) -> Optional[float]:
+    value = _FLOAT.unpack(_BITS.pack(bits))[0]
+    return None if math.isnan(value) else value
+
+
+class _XorEncoder:
+    def __init__(self, w: BitWriter, first: int):
+        self._w = w
+        self._prev = first
+        self._lead = None
+        self._trail = None
+        w.write(first, 64)
+
+    def add(self, bits: int):
+        xor = bits ^ self._prev
+        self._prev = bits
+        w = self._w
+        if xor == 0:
+            w.write(0, 1)
+            return
+        lead = min(64 - xor.bit_length(), 31)
+        trail = (xor & -xor).bit_length() - 1
+        if self._lead is not None and lead >= self._lead and trail >= self._trail:
+            w.write(0b10, 2)
+            w.write(xor >> self._trail, 64 - self._lead - self._trail)
+            return
+        meaningful = 64 - lead - trail
+        w.write(0b11, 2)
+        w.write(lead, 5)
+        w.write(meaningful - 1, 6)
+        w.write(xor >> trail, meaningful)
+        self._lead, self._trail = lead, trail
+
+
+class _XorDecoder:
+    def __init__(self, r: BitReader):
+        self._r = r
+        self._prev = r.read(64)
+        self._lead = 0
+        self._trail = 0
+
+    @property
+    def first(self) -> int:
+        return self._prev
+
+    def next(self) -> int:
+        r = self._r
+        if r.read(1) == 0:
+            return self._prev
+        if r.read(1) == 1:
+            self._lead = r.read(5)
+            meaningful = r.read(6) + 1
+            self._trail = 64 - self._lead - meaningful
+        self._prev ^= r.read(64 - self._lead - self._trail) << self._trail
+        return self._prev
+
+
+def encode_block(points: list) -> bytes:
+    """Pack [BlockPoint, ...], sorted oldest first, into a block payload."""
+    w = BitWriter()
+    first = points[0]
+    prev_ms = _to_ms(first.timestamp)
+    prev_delta = 0
+    w.write(prev_ms, 64)
+    moisture = _XorEncoder(w, _float_bits(first.moisture))
+    raw_adc = _XorEncoder(w, _float_bits(first.raw_adc))
+    for p in points[1:]:
+        ms = _to_ms(p.timestamp)
+        delta = ms - prev_ms
+        dod = delta - prev_delta
+        prev_ms, prev_delta = ms, delta
+        if dod == 0:
+            w.write(0, 1)
+        else:
+            for prefix, prefix_bits, bits in _DOD_CLASSES:
+                half = 1 << (bits - 1)
+                if -half < dod <= half:
+                    w.write(prefix, prefix_bits)
+                    w.write(dod + half - 1, bits)
+                    break
+            else:
+                w.write(0b1111, 4)
+                w.write(dod & _MASK64, 64)
+        moisture.add(_float_bits(p.moisture))
+        raw_adc.add(_float_bits(p.raw_adc))
+    return w.getvalue()
+
+
+def decode_block(data: bytes, count: int):
+    """Yield the block's BlockPoints, oldest first."""
+    r = BitReader(data)
+    ms = r.read(64)
+    delta = 0
+    moisture = _XorDecoder(r)
+    raw_adc = _XorDecoder(r)
+    yield BlockPoint(_from_ms(ms), _bits_float(moisture.first), _bits_float(raw_adc.first))
+    for _ in range(count - 1):
+        if r.read(1):
+            for _prefix, prefix_bits, bits in _DOD_CLASSES:
+                if r.read(1) == 0:
+                    dod = r.read(bits) - (1 << (bits - 1)) + 1
+                    break
+            else:
+                dod = r.read(64)
+                if dod >= 1 << 63:
+                    dod -= 1 << 64
+            delta += dod
+        ms += delta
+        yield BlockPoint(_from_ms(ms), _bits_float(moisture.next()), _bits_float(raw_adc.next()))
+
+
+def block_start(timestamp: datetime) -> datetime:
+    ms = _to_ms(timestamp)
+    return _from_ms(ms - ms % (BLOCK_SECONDS * 1000))
+
+
+def enabled() -> bool:
+    return SEAL_AFTER_DAYS > 0
+
+
+def write_points(db: Session, sensor_id: int, points: list) -> int:
+    """Store points for one sensor, merging into blocks that already exist; returns blocks written.
+
+    Runs in the caller's transaction.
+    """
+    by_block = {}
+    for p in points:
+        by_block.setdefault(block_start(p.timestamp), []).append(p)
+    existing = {
+        row.block_start: row for row in db.execute(
+            select(reading_blocks).where(reading_blocks.c.sensor_id == sensor_id,
+                                         reading_blocks.c.block_start.in_(list(by_block)))
+        )
+    }
+    rows = []
+    for start, block in by_block.items():
+        old = existing.get(start)
+        if old is not None:
+            block = list(decode_block(old.data, old.count)) + block
+        block.sort(key=lambda p: p.timestamp)
+        rows.append({
+            "sensor_id": sensor_id,
+            "block_start": start,
+            "count": len(block),
+            "first_timestamp": block[0].timestamp,
+            "last_timestamp": block[-1].timestamp,
+            "data": encode_block(block),
+        })
+    if rows:
+        stmt = sqlite_insert(reading_blocks)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[reading_blocks.c.sensor_id, reading_blocks.c.block_start],
+            set_={c: stmt.excluded[c] for c in ("count", "first_timestamp", "last_timestamp", "data")},
+        )
+        db.execute(stmt, rows)
+    return len(rows)
+
+
+def _overlapping(start_time: datetime = None, end_time: datetime = None) -> list:
+    """Conditions for the blocks overlapping [start_time, end_time]."""
+    conds = []
+    if start_time is not None:
+        conds.append(reading_blocks.c.last_timestamp >= _from_ms(_to_ms(start_time)))
+    if end_time is not None:
+        conds.append(reading_blocks.c.block_start <= _from_ms(_to_ms(end_time)))
+    return conds
+
+
+def scan(db: Session, sensor_id: int, start_time: datetime = None, end_time: datetime = None):
+    """Yield a sensor's points in [start_time, end_time], oldest first, decoding one block at a time."""
+    start = _from_ms(_to_ms(start_time)) if start_time is not None else None
+    end = _from_ms(_to_ms(end_time)) if end_time is not None else None
+    q = select(reading_blocks.c.count, reading_blocks.c.data).where(
+        reading_blocks.c.sensor_id == sensor_id, *_overlapping(start_time, end_time))
+    for count, data in db.execute(q.order_by(reading_blocks.c.block_start)):
+        for p in decode_block(data, count):
+            if start is not None and p.timestamp < start:
+                continue
+            if end is not None and p.timestamp > end:
+                return
+            yield p
+
+
+def sensors(db: Session, start_time: datetime = None, end_time: datetime = None) -> list:
+    """(sensor_id, device_id, is_demo) of the sensors with blocks overlapping [start_time, end_time].
+
+    Blocks of sensors that no longer exist are left out.
+    """
+    with_blocks = select(reading_blocks.c.sensor_id).where(*_overlapping(start_time, end_time))
+    return db.execute(
+        select(models.Sensor.id, models.Sensor.device_id, models.Sensor.is_demo)
+        .where(models.Sensor.id.in_(with_blocks))
+        .order_by(models.Sensor.id)
+    ).all()
+
+
+def count_points(db: Session, sensor_ids: list, start_time: datetime = None, end_time: datetime = None) -> int:
+    """Points in the blocks overlapping the range, counted whole (exact when the range is block-aligned)."""
+    return db.execute(
+        select(func.sum(reading_blocks.c.count))
+        .where(reading_blocks.c.sensor_id.in_(sensor_ids), *_overlapping(start_time, end_time))
+    ).scalar() or 0
+
+
+def oldest_timestamp(db: Session):
+    return db.execute(select(func.min(reading_blocks.c.first_timestamp))).scalar()
+
+
+def delete_range(db: Session, start_time: datetime, end_time: datetime, sensor_id: int = None) -> int:
+    """Delete the blocks overlapping [start_time, end_time], of one sensor or all; returns the points deleted."""
+    conds = _overlapping(start_time, end_time)
+    if sensor_id is not None:
+        conds.append(reading_blocks.c.sensor_id == sensor_id)
+    points = db.execute(select(func.sum(reading_blocks.c.count)).where(*conds)).scalar() or 0
+    db.execute(delete(reading_blocks).where(*conds))
+    return points
+
+
+def sealed_keys(db: Session) -> list:
+    """YYYYMM keys of the sealed months, oldest first."""
+    return db.execute(select(sealed_months.c.id).order_by(sealed_months.c.id)).scalars().all()
+
+
+def mark_sealed(db: Session, key: int, count: int):
+    """Record a sealed month; resealing it (late readings recreated its partition) adds to the count."""
+    stmt = sqlite_insert(sealed_months).values(id=key, reading_count=count, sealed_at=datetime.now(timezone.utc))
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[sealed_months.c.id],
+        set_={"reading_count": sealed_months.c.reading_count + stmt.excluded.reading_count,
+              "sealed_at": stmt.excluded.sealed_at},
+    )
+    db.execute(stmt)
+
+
+def unmark_sealed(db: Session, keys: list):
+    db.execute(delete(sealed_months).where(sealed_months.c.id.in_(keys)))
@@ -0,0 +1,608 @@
+# reading_partitions.py
+"""Readings stored in one table per UTC month (readings_YYYYMM).
+
+Everything that reads or writes readings goes through this module. Range
+queries only touch the partitions that overlap the requested time range.
+Because partitions are disjoint in time, ordered queries walk them in order
+and stop as soon as they have enough rows. Retention drops whole partitions.
+A DROP TABLE is quick and frees the pages at once, unlike a DELETE spread
+across the whole file.
+
+Each partition is an AUTOINCREMENT table whose sequence starts at
+YYYYMM * PARTITION_ID_SPAN. Reading ids are therefore unique across
+partitions and never reused, and id // PARTITION_ID_SPAN names the
+partition.
+
+The partition list is read from sqlite_master once per database and then
+kept in memory, so a warm insert costs only the INSERT. Partitions created
+or dropped in a transaction are tracked in the session's info; they are
+visible to that transaction at once and reach the shared list only when it
+commits, because a rolled-back CREATE or DROP TABLE leaves the schema as it
+was. Databases are told apart by file path, so the read-only pool shares
+the list with the writer. Only this process is tracked; anything else that
+adds or drops partitions must run while the server is stopped.
+
+Months sealed into reading_blocks (see that module) are read back here too:
+select_readings, count_readings and delete_readings rebuild their rows from
+the blocks, with device_id and is_demo taken from the sensor, and apply the
+where() conditions in Python. A month can be both sealed and partitioned
+when late readings arrived after it was sealed; its rows come from both.
+
+Databases from before partitioning keep their single readings table until
+crud.migrate_legacy_readings has moved it over in batches after startup.
+Until then it is one more table every read covers, keyed LEGACY_KEY.
+"""
+
+import heapq
+import operator
+import os
+import re
+import threading
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+
+from sqlalchemy import Boolean, Column, DateTime, Float, Index, Integer, MetaData, String, Table, event, func, insert, select, text
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import operators
+from sqlalchemy.sql.elements import BinaryExpression, BindParameter, False_, Null, True_
+
+import reading_blocks
+
+PARTITION_PREFIX = "readings_"
+PARTITION_ID_SPAN = 10 ** 9
+LEGACY_TABLE = "readings"
+LEGACY_KEY = 1  # table_key() of the legacy table; its RollupState row is the legacy rollup watermark
+READING_COLUMNS = ("device_id", "sensor_id", "timestamp", "moisture", "raw_adc", "boot_id", "seq", "is_demo")
+
+_NAME_RE = re.compile(r"^readings_(\d{6})$")
+_metadata = MetaData()
+_tables = {}  # month key -> Table
+_tables_lock = threading.Lock()
+_known = {}   # database path -> set of committed partition keys
+_known_lock = threading.Lock()
+_legacy_gone = set()  # database paths known to have no legacy table
+
+
+def month_key(timestamp: datetime) -> int:
+    """YYYYMM of the UTC month holding timestamp (naive values are UTC)."""
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(timezone.utc)
+    return timestamp.year * 100 + timestamp.month
+
+
+def month_bounds(key: int) -> tuple:
+    """(start of the month, start of the next one) as naive UTC."""
+    year, month = divmod(key, 100)
+    return datetime(year, month, 1), datetime(year + month // 12, month % 12 + 1, 1)
+
+
+def key_for_id(reading_id: int) -> int:
+    return reading_id // PARTITION_ID_SPAN
+
+
+def table_key(table: Table) -> int:
+    if table.name == LEGACY_TABLE:
+        return LEGACY_KEY
+    return int(table.name[len(PARTITION_PREFIX):])
+
+
+def _columns() -> list:
+    return [
+        Column("id", Integer, primary_key=True),
+        Column("device_id", String),
+        Column("sensor_id", Integer),
+        Column("timestamp", DateTime),
+        Column("moisture", Float),
+        Column("raw_adc", Float, nullable=True),
+        Column("boot_id", Integer, nullable=True),
+        Column("seq", Integer, nullable=True),
+        Column("is_demo", Boolean, default=False),
+    ]
+
+
+def legacy_table() -> Table:
+    """The pre-partitioning readings table, for querying while it still exists."""
+    with _tables_lock:
+        table = _tables.get(LEGACY_KEY)
+        if table is None:
+            table = _tables[LEGACY_KEY] = Table(LEGACY_TABLE, _metadata, *_columns())
+        return table
+
+
+def partition_table(key: int) -> Table:
+    with _tables_lock:
+        table = _tables.get(key)
+        if table is None:
+            name = f"{PARTITION_PREFIX}{key}"
+            table = Table(
+                name, _metadata,
+                *_columns(),
+                Index(f"ix_{name}_sensor_timestamp", "sensor_id", "timestamp"),
+                # Retried uploads carry the same (boot_id, seq); NULLs (legacy readings) never collide
+                Index(f"ux_{name}_device_seq", "device_id", "boot_id", "seq", "sensor_id", unique=True),
+                sqlite_autoincrement=True,
+            )
+            _tables[key] = table
+        return table
+
+
+def _table_exists(db: Session, name: str) -> bool:
+    return db.execute(text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"), {"name": name}).first() is not None
+
+
+def _database(db: Session) -> str:
+    name = db.info.get("partition_database")
+    if name is None:
+        url = db.get_bind().url
+        name = url.database or ""
+        if name.startswith("file:"):
+            name = name[len("file:"):]
+        if name in ("", ":memory:"):
+            # Private to its engine's connection
+            name = f":memory:{id(db.get_bind())}"
+        elif not name.startswith("/"):
+            name = os.path.abspath(name)
+        db.info["partition_database"] = name
+    return name
+
+
+def _pending(db: Session) -> tuple:
+    """(created, dropped) partition keys of the session's open transaction."""
+    return db.info.setdefault("partitions_created", set()), db.info.setdefault("partitions_dropped", set())
+
+
+def _committed_keys(db: Session) -> set:
+    database = _database(db)
+    with _known_lock:
+        known = _known.get(database)
+    if known is None:
+        names = db.execute(text("SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE 'readings_%'")).scalars()
+        known = {int(m.group(1)) for m in map(_NAME_RE.match, names) if m}
+        # sqlite_master shows this transaction's own uncommitted changes
+        created, dropped = _pending(db)
+        known = (known - created) | dropped
+        with _known_lock:
+            known = _known.setdefault(database, known)
+    return known
+
+
+def _has_partition(db: Session, key: int) -> bool:
+    created, dropped = _pending(db)
+    if key in created:
+        return True
+    return key not in dropped and key in _committed_keys(db)
+
+
+def partition_keys(db: Session) -> list:
+    known = _committed_keys(db)
+    created, dropped = _pending(db)
+    with _known_lock:
+        keys = (known | created) - dropped
+    return sorted(keys)
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_partition_changes(db: Session):
+    if db.info.get("legacy_dropped"):
+        with _known_lock:
+            _legacy_gone.add(db.info.get("partition_database"))
+    created = db.info.get("partitions_created")
+    dropped = db.info.get("partitions_dropped")
+    if not created and not dropped:
+        return
+    with _known_lock:
+        known = _known.get(db.info.get("partition_database"))
+        if known is not None:
+            known |= created or set()
+            known -= dropped or set()
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _discard_partition_changes(db: Session, transaction):
+    # Runs after after_commit; on rollback the changes are simply forgotten
+    if transaction.parent is None:
+        db.info.pop("partitions_created", None)
+        db.info.pop("partitions_dropped", None)
+        db.info.pop("legacy_dropped", None)
+
+
+def partitions(db: Session, start_time: datetime = None, end_time: datetime = None, newest_first: bool = False) -> list:
+    """Partition tables overlapping [start_time, end_time], in time order."""
+    keys = _in_range(partition_keys(db), start_time, end_time)
+    if newest_first:
+        keys.reverse()
+    return [partition_table(k) for k in keys]
+
+
+def tables(db: Session) -> list:
+    """Every table holding readings: the legacy table while it exists, then the partitions."""
+    return ([legacy_table()] if has_legacy_table(db) else []) + partitions(db)
+
+
+def _in_range(keys: list, start_time: datetime = None, end_time: datetime = None) -> list:
+    if start_time is not None:
+        keys = [k for k in keys if k >= month_key(start_time)]
+    if end_time is not None:
+        keys = [k for k in keys if k <= month_key(end_time)]
+    return keys
+
+
+def _months(db: Session, start_time: datetime = None, end_time: datetime = None, newest_first: bool = False) -> list:
+    """(month key, partition table or None, sealed) for the months that can hold the range, in time order."""
+    tables = {table_key(t): t for t in partitions(db, start_time, end_time)}
+    sealed = set(_in_range(reading_blocks.sealed_keys(db), start_time, end_time))
+    keys = sorted(set(tables) | sealed, reverse=newest_first)
+    return [(k, tables.get(k), k in sealed) for k in keys]
+
+
+def _ddl_connection(db: Session, immediate: bool = False):
+    """The session's connection inside an open transaction.
+
+    pysqlite only begins a transaction before DML, so DDL issued first would
+    commit on its own and survive the caller's rollback. immediate takes the
+    write lock at once, so reads that follow see no concurrent inserts.
+    """
+    conn = db.connection()
+    if not conn.connection.dbapi_connection.in_transaction:
+        conn.exec_driver_sql("BEGIN IMMEDIATE" if immediate else "BEGIN")
+    return conn
+
+
+def begin_write(db: Session):
+    """Open the session's transaction holding SQLite's write lock (no-op if one is open)."""
+    _ddl_connection(db, immediate=True)
+
+
+def ensure_partition(db: Session, key: int) -> Table:
+    """Create the month's partition in the session's transaction if it doesn't exist."""
+    table = partition_table(key)
+    if not _has_partition(db, key):
+        conn = _ddl_connection(db)
+        if not _table_exists(db, table.name):
+            table.create(conn)
+            conn.execute(text("INSERT INTO sqlite_sequence (name, seq) VALUES (:name, :seq)"),
+                         {"name": table.name, "seq": key * PARTITION_ID_SPAN})
+        created, dropped = _pending(db)
+        created.add(key)
+        dropped.discard(key)
+    return table
+
+
+def insert_reading(db: Session, values: dict):
+    """Insert one reading into its month's partition; returns the stored row."""
+    table = ensure_partition(db, month_key(values["timestamp"]))
+    return db.execute(insert(table).values(**values).returning(*table.c)).one()
+
+
+def insert_readings(db: Session, rows: list, ignore_duplicates: bool = False) -> int:
+    """Bulk insert (executemany per partition); ids are not returned.
+
+    With ignore_duplicates, rows that hit the (device, boot, seq, sensor)
+    unique index are skipped instead of failing the batch.
+    """
+    by_key = {}
+    for row in rows:
+        by_key.setdefault(month_key(row["timestamp"]), []).append(row)
+    for key, batch in by_key.items():
+        stmt = insert(ensure_partition(db, key))
+        if ignore_duplicates:
+            stmt = stmt.prefix_with("OR IGNORE")
+        db.execute(stmt, batch)
+    return len(rows)
+
+
+def _conditions(table: Table, where, start_time: datetime, end_time: datetime) -> list:
+    conds = list(where(table)) if where is not None else []
+    if start_time is not None:
+        conds.append(table.c.timestamp >= start_time)
+    if end_time is not None:
+        conds.append(table.c.timestamp <= end_time)
+    return conds
+
+
+# Rows rebuilt from reading_blocks; what a sealed month no longer has is None
+SealedReading = namedtuple("SealedReading", ("id",) + READING_COLUMNS)
+_SENSOR_COLUMNS = ("device_id", "sensor_id", "is_demo")
+_COMPARISONS = {
+    operators.eq: operator.eq, operators.ne: operator.ne,
+    operators.gt: operator.gt, operators.ge: operator.ge,
+    operators.lt: operator.lt, operators.le: operator.le,
+}
+
+
+@lru_cache(maxsize=None)
+def _row_type(columns: tuple):
+    return namedtuple("SealedReading", columns)
+
+
+def _naive_utc(timestamp: datetime) -> datetime:
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    return timestamp
+
+
+def _predicate(cond) -> tuple:
+    """(column name, test) for one where() condition, applied to sealed rows in Python."""
+    if not isinstance(cond, BinaryExpression) or not isinstance(cond.left, Column):
+        raise TypeError(f"Can't apply {cond} to sealed readings")
+    right = cond.right
+    if isinstance(right, BindParameter):
+        value = right.effective_value
+    elif isinstance(right, (True_, False_, Null)):
+        value = None if isinstance(right, Null) else isinstance(right, True_)
+    else:
+        raise TypeError(f"Can't apply {cond} to sealed readings")
+    if isinstance(value, datetime):
+        value = _naive_utc(value)
+    op = cond.operator
+    if op is operators.in_op:
+        return cond.left.name, lambda v: v in value
+    if op is operators.not_in_op:
+        return cond.left.name, lambda v: v is not None and v not in value
+    if op is operators.is_:
+        return cond.left.name, lambda v: v is value
+    if op is operators.is_not:
+        return cond.left.name, lambda v: v is not value
+    compare = _COMPARISONS.get(op)
+    if compare is None:
+        raise TypeError(f"Can't apply {cond} to sealed readings")
+    # SQL semantics: a comparison with NULL matches nothing
+    return cond.left.name, lambda v: v is not None and value is not None and compare(v, value)
+
+
+def _sealed_span(key: int, start_time: datetime = None, end_time: datetime = None) -> tuple:
+    """The part of [start_time, end_time] inside the month, as naive UTC; start > end if none."""
+    start, end = month_bounds(key)
+    end -= timedelta(milliseconds=1)  # blocks keep milliseconds
+    if start_time is not None:
+        start = max(start, _naive_utc(start_time))
+    if end_time is not None:
+        end = min(end, _naive_utc(end_time))
+    return start, end
+
+
+def _sealed_sensors(db: Session, key: int, where, start: datetime, end: datetime) -> tuple:
+    """(sensors matching where's sensor-level conditions, the remaining per-reading tests)."""
+    tests = [_predicate(cond) for cond in (where(partition_table(key)) if where is not None else ())]
+    sensor_tests = [(name, test) for name, test in tests if name in _SENSOR_COLUMNS]
+    point_tests = [(name, test) for name, test in tests if name not in _SENSOR_COLUMNS]
+    matching = []
+    for sensor_id, device_id, is_demo in reading_blocks.sensors(db, start, end):
+        sensor = {"device_id": device_id, "sensor_id": sensor_id, "is_demo": bool(is_demo)}
+        if all(test(sensor[name]) for name, test in sensor_tests):
+            matching.append((sensor_id, device_id, bool(is_demo)))
+    return matching, point_tests
+
+
+def _sealed_rows(db: Session, key: int, where, start_time: datetime = None, end_time: datetime = None,
+                 newest_first: bool = False) -> list:
+    start, end = _sealed_span(key, start_time, end_time)
+    if start > end:
+        return []
+    sensors, point_tests = _sealed_sensors(db, key, where, start, end)
+    streams = []
+    for sensor_id, device_id, is_demo in sensors:
+        rows = (
+            SealedReading(None, device_id, sensor_id, p.timestamp, p.moisture, p.raw_adc, None, None, is_demo)
+            for p in reading_blocks.scan(db, sensor_id, start, end)
+        )
+        streams.append([r for r in rows if all(test(getattr(r, name)) for name, test in point_tests)])
+    rows = list(heapq.merge(*streams, key=operator.attrgetter("timestamp")))
+    if newest_first:
+        rows.reverse()
+    return rows
+
+
+def select_readings(db: Session, where=None, start_time: datetime = None, end_time: datetime = None,
+                    columns: tuple = None, newest_first: bool = False, skip: int = 0, limit: int = None) -> list:
+    """Readings ordered by timestamp across the partitions and sealed months that can hold them.
+
+    where(table) returns extra conditions for one partition, e.g.
+    lambda t: (t.c.sensor_id == 3,). With a limit, later months are not
+    queried once enough rows were found.
+    """
+    wanted = skip + limit if limit is not None else None
+    legacy = has_legacy_table(db)
+    # Merging with sealed or legacy rows needs whole rows, timestamp included
+    whole = columns is None or legacy
+    rows = []
+    for key, table, sealed in _months(db, start_time, end_time, newest_first):
+        whole = whole or sealed
+        month = []
+        if table is not None:
+            cols = list(table.c) if whole else [table.c[name] for name in columns]
+            order = table.c.timestamp.desc() if newest_first else table.c.timestamp
+            stmt = select(*cols).where(*_conditions(table, where, start_time, end_time)).order_by(order)
+            if wanted is not None:
+                stmt = stmt.limit(wanted - len(rows))
+            month = db.execute(stmt).all()
+        if sealed:
+            month = list(heapq.merge(month, _sealed_rows(db, key, where, start_time, end_time, newest_first),
+                                     key=operator.attrgetter("timestamp"), reverse=newest_first))
+            if wanted is not None:
+                month = month[:wanted - len(rows)]
+        rows.extend(month)
+        if wanted is not None and len(rows) >= wanted:
+            break
+    if legacy:
+        # Readings crud.migrate_legacy_readings hasn't moved yet
+        table = legacy_table()
+        order = table.c.timestamp.desc() if newest_first else table.c.timestamp
+        stmt = select(*table.c).where(*_conditions(table, where, start_time, end_time)).order_by(order)
+        if wanted is not None:
+            stmt = stmt.limit(wanted)
+        rows = list(heapq.merge(rows, db.execute(stmt).all(), key=operator.attrgetter("timestamp"), reverse=newest_first))
+        if wanted is not None:
+            rows = rows[:wanted]
+    if columns and whole:
+        row_type = _row_type(tuple(columns))
+        rows = [row_type(*(getattr(r, name) for name in columns)) for r in rows[skip:]]
+        return rows
+    return rows[skip:]
+
+
+def first_reading(db: Session, where=None, newest: bool = True):
+    rows = select_readings(db, where, newest_first=newest, limit=1)
+    return rows[0] if rows else None
+
+
+def _count_sealed(db: Session, key: int, where, start_time: datetime = None, end_time: datetime = None) -> int:
+    start, end = _sealed_span(key, start_time, end_time)
+    if start > end:
+        return 0
+    sensors, point_tests = _sealed_sensors(db, key, where, start, end)
+    if not sensors:
+        return 0
+    if not point_tests and start_time is None and end_time is None:
+        # Blocks never straddle a month, so whole blocks count exactly
+        return reading_blocks.count_points(db, [s[0] for s in sensors], start, end)
+    return len(_sealed_rows(db, key, where, start_time, end_time))
+
+
+def count_readings(db: Session, where=None, start_time: datetime = None, end_time: datetime = None) -> int:
+    count = 0
+    for key, table, sealed in _months(db, start_time, end_time):
+        if table is not None:
+            count += db.execute(
+                select(func.count()).select_from(table).where(*_conditions(table, where, start_time, end_time))
+            ).scalar() or 0
+        if sealed:
+            count += _count_sealed(db, key, where, start_time, end_time)
+    if has_legacy_table(db):
+        table = legacy_table()
+        count += db.execute(
+            select(func.count()).select_from(table).where(*_conditions(table, where, start_time, end_time))
+        ).scalar() or 0
+    return count
+
+
+def oldest_timestamp(db: Session):
+    candidates = [reading_blocks.oldest_timestamp(db)]
+    if has_legacy_table(db):
+        candidates.append(db.execute(select(func.min(legacy_table().c.timestamp))).scalar())
+    for table in partitions(db):
+        candidates.append(db.execute(select(func.min(table.c.timestamp))).scalar())
+        if candidates[-1] is not None:
+            break
+    return min((c for c in candidates if c is not None), default=None)
+
+
+def delete_readings(db: Session, where) -> int:
+    """Delete matching readings from every partition and sealed month (device deletion, demo purge)."""
+    deleted = 0
+    if has_legacy_table(db):
+        deleted += db.execute(legacy_table().delete().where(*where(legacy_table()))).rowcount or 0
+    for key, table, sealed in _months(db):
+        if table is not None:
+            deleted += db.execute(table.delete().where(*where(table))).rowcount or 0
+        if not sealed:
+            continue
+        start, end = _sealed_span(key)
+        sensors, point_tests = _sealed_sensors(db, key, where, start, end)
+        for sensor_id, _, _ in sensors:
+            if point_tests:
+                kept = [p for p in reading_blocks.scan(db, sensor_id, start, end)
+                        if not all(test(getattr(p, name, None)) for name, test in point_tests)]
+                deleted -= len(kept)
+                deleted += reading_blocks.delete_range(db, start, end, sensor_id)
+                reading_blocks.write_points(db, sensor_id, kept)
+            else:
+                deleted += reading_blocks.delete_range(db, start, end, sensor_id)
+    return deleted
+
+
+def partitions_before(db: Session, cutoff: datetime) -> list:
+    """Partitions whose whole month is older than cutoff, oldest first."""
+    keep_from = month_key(cutoff)
+    return [table for table in partitions(db) if table_key(table) < keep_from]
+
+
+def _drop_partition(db: Session, table: Table):
+    table.drop(_ddl_connection(db))
+    created, removed = _pending(db)
+    created.discard(table_key(table))
+    removed.add(table_key(table))
+
+
+def sealed_keys_before(db: Session, cutoff: datetime) -> list:
+    """Sealed months wholly older than cutoff, oldest first."""
+    keep_from = month_key(cutoff)
+    return [key for key in reading_blocks.sealed_keys(db) if key < keep_from]
+
+
+def drop_partitions_before(db: Session, cutoff: datetime) -> int:
+    """Drop every partition and sealed month wholly older than cutoff; returns the rows dropped.
+
+    The month holding cutoff is kept whole, so readings outlive the cutoff
+    by up to a month.
+    """
+    dropped = 0
+    for table in partitions_before(db, cutoff):
+        dropped += db.execute(select(func.count()).select_from(table)).scalar() or 0
+        _drop_partition(db, table)
+    sealed = sealed_keys_before(db, cutoff)
+    for key in sealed:
+        dropped += reading_blocks.delete_range(db, *_sealed_span(key))
+    reading_blocks.unmark_sealed(db, sealed)
+    return dropped
+
+
+def seal_partition(db: Session, table: Table) -> int:
+    """Pack a partition's readings into reading_blocks and drop it; returns the readings sealed.
+
+    Runs in the caller's transaction. Readings of a month sealed before
+    (late arrivals) merge into its blocks.
+    """
+    sealed = 0
+    for sensor_id in db.execute(select(table.c.sensor_id).distinct()).scalars().all():
+        points = [
+            reading_blocks.BlockPoint(*row) for row in db.execute(
+                select(table.c.timestamp, table.c.moisture, table.c.raw_adc)
+                .where(table.c.sensor_id == sensor_id, table.c.timestamp.isnot(None))
+                .order_by(table.c.timestamp)
+            )
+        ]
+        if points:
+            reading_blocks.write_points(db, sensor_id, points)
+            sealed += len(points)
+    reading_blocks.mark_sealed(db, table_key(table), sealed)
+    _drop_partition(db, table)
+    return sealed
+
+
+def has_legacy_table(db: Session) -> bool:
+    if db.info.get("legacy_dropped"):
+        return False
+    database = _database(db)
+    with _known_lock:
+        if database in _legacy_gone:
+            return False
+    if _table_exists(db, LEGACY_TABLE):
+        return True
+    # Only the migration drops it, and it never comes back
+    with _known_lock:
+        _legacy_gone.add(database)
+    return False
+
+
+def legacy_batch(db: Session, batch_size: int) -> list:
+    """The batch_size lowest-id legacy readings as (legacy id, partition row values)."""
+    table = legacy_table()
+    rows = db.execute(select(*table.c).order_by(table.c.id).limit(batch_size)).all()
+    return [
+        (row.id, {name: getattr(row, name) for name in READING_COLUMNS}
+                 | {"timestamp": row.timestamp or datetime.now(timezone.utc)})
+        for row in rows
+    ]
+
+
+def delete_legacy_through(db: Session, last_id: int):
+    table = legacy_table()
+    db.execute(table.delete().where(table.c.id <= last_id))
+
+
+def drop_legacy_table(db: Session):
+    """Drop the emptied legacy table in the session's transaction; reads stop covering it once that commits."""
+    legacy_table().drop(_ddl_connection(db))
+    db.info["legacy_dropped"] = True
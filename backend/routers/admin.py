@@ -1,16 +1,25 @@
+import csv
+import io
 import os
-import sqlite3
-import tempfile
 from datetime import datetime, timezone, timedelta
+from typing import List, Optional
 
-from fastapi import APIRouter, Depends
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from sqlalchemy import func
 
-import models, schemas, crud
-from dependencies import get_db
+import anyio.to_thread
+
+import models, schemas, crud, reading_archive, reading_partitions
+from database import engine, read_engine, pool_stats
+from dependencies import get_db, read_limiter, run_read
 from auth import require_admin
+from services.ingest_queue import ingest_queue
+from services.notification_dispatcher import notification_dispatcher
+from services.device_liveness import device_liveness
+from services.startup_report import startup_report
+from services.backup import BackupBusy, BackupChainError, backup_service
 
 router = APIRouter(
     prefix="/admin",
@@ -27,38 +36,44 @@ DB_PATH = _get_db_path()
 
 
 @router.get("/backup")
-async def download_backup():
-    """Download a safe copy of the SQLite database using the online backup API."""
-    backup_fd, backup_path = tempfile.mkstemp(suffix=".db")
-    os.close(backup_fd)
+def download_backup(since: Optional[str] = Query(None, description="X-Backup-Id of the last backup, to get only the pages changed since")):
+    """Stream a gzip-compressed online backup of the database, or with since only the changed pages."""
+    if backup_service is None:
+        raise HTTPException(status_code=400, detail="Backups need a file database")
     try:
-        source = sqlite3.connect(DB_PATH)
-        dest = sqlite3.connect(backup_path)
-        source.backup(dest)
-        source.close()
-        dest.close()
-    except Exception:
-        if os.path.exists(backup_path):
-            os.unlink(backup_path)
-        raise
-
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    return FileResponse(
-        path=backup_path,
-        media_type="application/octet-stream",
-        filename=f"plant_water_array_backup_{timestamp}.db",
-        background=None,
+        stream = backup_service.start(since)
+    except (BackupBusy, BackupChainError) as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return StreamingResponse(
+        stream,
+        media_type="application/gzip",
+        headers={
+            "Content-Disposition": f'attachment; filename="{stream.filename}"',
+            "X-Backup-Id": stream.id,
+            "X-Backup-Kind": stream.kind,
+            "X-Backup-Pages": str(stream.page_count),
+        },
     )
 
 
+@router.get("/backup/progress", response_model=Optional[schemas.BackupProgress])
+async def get_backup_progress():
+    """Return the running backup's progress, or how the last one ended."""
+    return backup_service.progress() if backup_service else None
+
+
 @router.get("/stats", response_model=schemas.DatabaseStats)
-async def get_database_stats(db: Session = Depends(get_db)):
+async def get_database_stats():
     """Return database health statistics."""
-    total_readings = db.query(func.count(models.Reading.id)).scalar() or 0
+    return await run_read(_database_stats)
+
+
+def _database_stats(db: Session) -> schemas.DatabaseStats:
+    total_readings = reading_partitions.count_readings(db)
     total_watering_logs = db.query(func.count(models.WateringLog.id)).scalar() or 0
     total_alerts = db.query(func.count(models.Alert.id)).scalar() or 0
 
-    oldest_reading = db.query(func.min(models.Reading.timestamp)).scalar()
+    oldest_reading = reading_partitions.oldest_timestamp(db)
 
     # Readings per day average
     readings_per_day_avg = 0.0
@@ -69,10 +84,11 @@ async def get_database_stats(db: Session = Depends(get_db)):
         days = max(1, (datetime.now(timezone.utc) - oldest_dt).days)
         readings_per_day_avg = round(total_readings / days, 1)
 
-    # Database file size
+    # Database file size, including the WAL not yet checkpointed
     db_size = 0
-    if os.path.exists(DB_PATH):
-        db_size = os.path.getsize(DB_PATH)
+    for path in (DB_PATH, DB_PATH + "-wal"):
+        if os.path.exists(path):
+            db_size += os.path.getsize(path)
 
     def human_size(size_bytes: int) -> str:
         for unit in ["B", "KB", "MB", "GB"]:
@@ -90,3 +106,88 @@ async def get_database_stats(db: Session = Depends(get_db)):
         total_watering_logs=total_watering_logs,
         total_alerts=total_alerts,
     )
+
+
+@router.get("/ingest", response_model=schemas.IngestQueueStats)
+async def get_ingest_stats():
+    """Return write-behind ingest queue depth and group-commit latency."""
+    return ingest_queue.stats()
+
+
+@router.get("/notifications", response_model=schemas.NotificationDispatcherStats)
+def get_notification_stats(db: Session = Depends(get_db)):
+    """Return notification outbox backlog and delivery counters."""
+    return notification_dispatcher.stats(db)
+
+
+@router.get("/liveness", response_model=schemas.DeviceLivenessStats)
+async def get_liveness_stats():
+    """Return device liveness tracker counts and last_seen flush state."""
+    return device_liveness.stats()
+
+
+@router.get("/startup", response_model=schemas.StartupReport)
+async def get_startup_report():
+    """Return how long each startup step took and the deferred startup jobs that have finished."""
+    return startup_report.stats()
+
+
+@router.get("/db-pools", response_model=List[schemas.DbPoolStats])
+async def get_db_pool_stats():
+    """Return connection pool and worker thread usage for the write and analytics read pools."""
+    pools = [("write", engine, anyio.to_thread.current_default_thread_limiter())]
+    if read_engine is not engine:
+        pools.append(("read", read_engine, read_limiter()))
+    return [
+        schemas.DbPoolStats(name=name, threads_busy=limiter.borrowed_tokens, threads_total=int(limiter.total_tokens),
+                            **pool_stats(db_engine))
+        for name, db_engine, limiter in pools
+    ]
+
+
+@router.get("/archive", response_model=List[schemas.ArchiveFile])
+def list_archive(sensor_id: Optional[int] = None):
+    """List the cold archive's sensor-month files (readings past retention)."""
+    return [
+        schemas.ArchiveFile(sensor_id=h.sensor_id, month=h.month, device_id=h.device_id, reading_count=h.count,
+                            first_timestamp=h.first_timestamp, last_timestamp=h.last_timestamp, size_bytes=h.size_bytes)
+        for h in reading_archive.list_files(sensor_id)
+    ]
+
+
+@router.get("/archive/export")
+def export_archive_csv(
+    sensor_id: int = Query(..., description="Sensor DB id"),
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+):
+    """Stream a sensor's archived readings as CSV, in the same columns as /readings/export."""
+    def rows():
+        output = io.StringIO()
+        writer = csv.writer(output)
+        writer.writerow(["timestamp", "moisture", "raw_adc"])
+        for r in reading_archive.scan(sensor_id, start, end):
+            writer.writerow([r.timestamp.isoformat(), r.moisture, r.raw_adc if r.raw_adc is not None else ""])
+            if output.tell() > 64 * 1024:
+                yield output.getvalue()
+                output.seek(0)
+                output.truncate()
+        yield output.getvalue()
+
+    return StreamingResponse(
+        rows(),
+        media_type="text/csv",
+        headers={"Content-Disposition": f"attachment; filename=sensor_{sensor_id}_archive.csv"},
+    )
+
+
+@router.get("/archive/aggregated", response_model=schemas.AggregatedReadingsResponse)
+def get_archive_aggregated(
+    sensor_id: int,
+    period: str = Query("daily", pattern="^(daily|weekly)$"),
+    start_time: Optional[datetime] = None,
+    end_time: Optional[datetime] = None,
+):
+    """Daily or weekly aggregates recomputed from archived raw readings."""
+    data = crud.get_archived_aggregates(sensor_id, period, start_time=start_time, end_time=end_time)
+    return schemas.AggregatedReadingsResponse(sensor_id=sensor_id, period=period, data=data)
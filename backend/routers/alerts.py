@@ -3,7 +3,7 @@
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 import schemas, crud
-from dependencies import get_db
+from dependencies import get_db, get_user_db
 from typing import List, Optional
 from auth import UserInfo, get_current_user, require_admin
 
@@ -14,31 +14,59 @@ router = APIRouter(
 
 
 @router.get("/unread-count")
-async def get_unread_count(db: Session = Depends(get_db), user: UserInfo = Depends(get_current_user)):
+def get_unread_count(db: Session = Depends(get_user_db), user: UserInfo = Depends(get_current_user)):
     count = crud.get_unread_alert_count(db, is_demo=user.is_demo)
     return {"count": count}
 
 
 @router.put("/mark-all-read")
-async def mark_all_read(db: Session = Depends(get_db), _user: UserInfo = Depends(require_admin)):
+def mark_all_read(db: Session = Depends(get_db), _user: UserInfo = Depends(require_admin)):
     crud.mark_all_alerts_read(db)
     return {"detail": "All alerts marked as read"}
 
 
+@router.get("/rules", response_model=List[schemas.AlertRule])
+def read_alert_rules(db: Session = Depends(get_user_db), user: UserInfo = Depends(get_current_user)):
+    return crud.get_alert_rules(db, is_demo=user.is_demo)
+
+
+@router.post("/rules", response_model=schemas.AlertRule)
+def create_alert_rule(rule: schemas.AlertRuleCreate, db: Session = Depends(get_db), _user: UserInfo = Depends(require_admin)):
+    if rule.rule_type == "rate_of_change":
+        if rule.sensor_id is None or not rule.max_change_per_hour:
+            raise HTTPException(status_code=400, detail="rate_of_change rules need sensor_id and max_change_per_hour")
+    elif rule.rule_type == "zone_average":
+        if rule.zone_id is None or (rule.min_moisture is None and rule.max_moisture is None):
+            raise HTTPException(status_code=400, detail="zone_average rules need zone_id and min_moisture and/or max_moisture")
+    elif rule.rule_type == "stale_sensor":
+        if rule.sensor_id is None or not rule.stale_after_minutes:
+            raise HTTPException(status_code=400, detail="stale_sensor rules need sensor_id and stale_after_minutes")
+    else:
+        raise HTTPException(status_code=400, detail="rule_type must be one of: rate_of_change, zone_average, stale_sensor")
+    return crud.create_alert_rule(db, rule)
+
+
+@router.delete("/rules/{rule_id}")
+def delete_alert_rule(rule_id: int, db: Session = Depends(get_db), _user: UserInfo = Depends(require_admin)):
+    if not crud.delete_alert_rule(db, rule_id):
+        raise HTTPException(status_code=404, detail="Alert rule not found")
+    return {"detail": "Alert rule deleted"}
+
+
 @router.get("/", response_model=List[schemas.Alert])
-async def read_alerts(
+def read_alerts(
     sensor_id: Optional[int] = None,
     unread_only: bool = False,
     skip: int = 0,
     limit: int = 100,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_user_db),
     user: UserInfo = Depends(get_current_user),
 ):
     return crud.get_alerts_filtered(db, sensor_id=sensor_id, unread_only=unread_only, skip=skip, limit=limit, is_demo=user.is_demo)
 
 
 @router.put("/{alert_id}", response_model=schemas.Alert)
-async def mark_alert_as_read(alert_id: int, db: Session = Depends(get_db), _user: UserInfo = Depends(require_admin)):
+def mark_alert_as_read(alert_id: int, db: Session = Depends(get_db), _user: UserInfo = Depends(require_admin)):
     db_alert = crud.mark_alert_as_read(db=db, alert_id=alert_id)
     if db_alert is None:
         raise HTTPException(status_code=404, detail="Alert not found")
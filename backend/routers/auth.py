@@ -1,3 +1,5 @@
+import functools
+
 from fastapi import APIRouter, Depends, HTTPException, status
 from pydantic import BaseModel
 
@@ -14,8 +16,11 @@ from auth import (
 
 router = APIRouter(prefix="/auth", tags=["auth"])
 
-# Hash the admin password once at startup for constant-time comparison
-_ADMIN_HASH = hash_password(ADMIN_PASSWORD)
+# Hashed once, on the first login, for constant-time comparison (bcrypt
+# takes a quarter of a second, which startup doesn't need to spend)
+@functools.cache
+def _admin_hash() -> str:
+    return hash_password(ADMIN_PASSWORD)
 
 
 class LoginRequest(BaseModel):
@@ -39,7 +44,7 @@ class AccessTokenResponse(BaseModel):
 
 @router.post("/login", response_model=TokenResponse)
 async def login(body: LoginRequest):
-    if not verify_password(body.password, _ADMIN_HASH):
+    if not verify_password(body.password, _admin_hash()):
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid password")
     return TokenResponse(
         access_token=create_access_token("admin", role="admin"),
@@ -1,7 +1,6 @@
 from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
 import schemas, crud
-from dependencies import get_db
+from dependencies import run_read
 from auth import UserInfo, get_current_user
 
 router = APIRouter(
@@ -11,5 +10,5 @@ router = APIRouter(
 
 
 @router.get("/summary", response_model=schemas.DashboardSummary)
-async def get_dashboard_summary(db: Session = Depends(get_db), user: UserInfo = Depends(get_current_user)):
-    return crud.get_dashboard_summary(db, is_demo=user.is_demo)
+async def get_dashboard_summary(user: UserInfo = Depends(get_current_user)):
+    return await run_read(crud.get_dashboard_summary, is_demo=user.is_demo, demo=user.is_demo)
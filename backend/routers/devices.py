@@ -1,10 +1,10 @@
 # routers/devices.py
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
 import schemas, crud
-from dependencies import get_db
-from typing import List
+from dependencies import get_db, get_user_db, get_user_db_or_api_key
+from typing import List, Union
 import models
 import uuid
 from auth import UserInfo, get_current_user, get_current_user_or_api_key, verify_device_api_key, require_admin
@@ -16,12 +16,12 @@ router = APIRouter(
 
 
 @router.post("/", response_model=schemas.Device)
-async def create_device(device: schemas.DeviceCreate, db: Session = Depends(get_db), _user: UserInfo = Depends(require_admin)):
+def create_device(device: schemas.DeviceCreate, db: Session = Depends(get_db), _user: UserInfo = Depends(require_admin)):
     return crud.create_device(db=db, device=device)
 
 
 @router.post("/register_device", response_model=schemas.Device)
-async def register_device(device: schemas.DeviceRegister, db: Session = Depends(get_db), _device: str = Depends(verify_device_api_key)):
+def register_device(device: schemas.DeviceRegister, db: Session = Depends(get_db), _device: str = Depends(verify_device_api_key)):
     # If device_id provided, check by device_id first
     if device.device_id:
         existing_device = crud.get_device_by_device_id(db, device.device_id)
@@ -37,12 +37,12 @@ async def register_device(device: schemas.DeviceRegister, db: Session = Depends(
                 existing_device.deploy_token = device.deploy_token
             db.commit()
             db.refresh(existing_device)
-            return existing_device
+            return crud.device_with_live_last_seen(existing_device)
 
     # Check by name for backward compat
     existing_device = crud.get_device_by_name(db, device.name)
     if existing_device:
-        return existing_device
+        return crud.device_with_live_last_seen(existing_device)
 
     # Auto-generate device_id if not provided
     device_id = device.device_id or str(uuid.uuid4())
@@ -63,15 +63,15 @@ async def register_device(device: schemas.DeviceRegister, db: Session = Depends(
 
 
 @router.patch("/{device_id}", response_model=schemas.Device)
-async def update_device(device_id: str, update: schemas.DeviceUpdate, db: Session = Depends(get_db), _user: UserInfo = Depends(require_admin)):
+def update_device(device_id: str, update: schemas.DeviceUpdate, db: Session = Depends(get_db), _user: UserInfo = Depends(require_admin)):
     device = crud.update_device(db, device_id, update)
     if not device:
         raise HTTPException(status_code=404, detail="Device not found")
-    return device
+    return crud.device_with_live_last_seen(device)
 
 
 @router.delete("/{device_id}")
-async def delete_device(device_id: str, db: Session = Depends(get_db), _user: UserInfo = Depends(require_admin)):
+def delete_device(device_id: str, db: Session = Depends(get_db), _user: UserInfo = Depends(require_admin)):
     deleted = crud.delete_device(db, device_id)
     if not deleted:
         raise HTTPException(status_code=404, detail="Device not found")
@@ -79,33 +79,42 @@ async def delete_device(device_id: str, db: Session = Depends(get_db), _user: Us
 
 
 @router.get("/", response_model=List[schemas.Device])
-async def read_devices(skip: int = 0, limit: int = 100, db: Session = Depends(get_db), user: UserInfo = Depends(get_current_user_or_api_key)):
+def read_devices(skip: int = 0, limit: int = 100, db: Session = Depends(get_user_db_or_api_key), user: UserInfo = Depends(get_current_user_or_api_key)):
     devices = db.query(models.Device).filter(models.Device.is_demo == user.is_demo).offset(skip).limit(limit).all()
-    return devices
+    return [crud.device_with_live_last_seen(d) for d in devices]
 
 
 @router.get("/{device_id}", response_model=schemas.Device)
-async def get_device(device_id: str, db: Session = Depends(get_db), user: UserInfo = Depends(get_current_user)):
+def get_device(device_id: str, db: Session = Depends(get_user_db), user: UserInfo = Depends(get_current_user)):
     device = crud.get_device_by_device_id(db, device_id)
     if not device:
         raise HTTPException(status_code=404, detail="Device not found")
-    return device
+    return crud.device_with_live_last_seen(device)
 
 
-@router.get("/{device_id}/heartbeats", response_model=List[schemas.HeartbeatLogEntry])
-async def get_heartbeat_history(device_id: str, limit: int = 50, db: Session = Depends(get_db), user: UserInfo = Depends(get_current_user)):
+@router.get("/{device_id}/heartbeats", response_model=List[schemas.HeartbeatInterval])
+def get_heartbeat_history(device_id: str, limit: int = 50, db: Session = Depends(get_user_db), user: UserInfo = Depends(get_current_user)):
     device = crud.get_device_by_device_id(db, device_id)
     if not device:
         raise HTTPException(status_code=404, detail="Device not found")
     return crud.get_heartbeat_logs(db, device_id, limit=limit, is_demo=user.is_demo)
 
 
-@router.post("/{device_id}/heartbeat", response_model=schemas.HeartbeatResponse)
-async def device_heartbeat(device_id: str, heartbeat: schemas.DeviceHeartbeat, db: Session = Depends(get_db), _device: str = Depends(verify_device_api_key)):
+@router.get("/{device_id}/uptime", response_model=schemas.DeviceUptime)
+def get_device_uptime(device_id: str, days: int = Query(30, ge=1, le=365), db: Session = Depends(get_user_db), user: UserInfo = Depends(get_current_user)):
+    device = crud.get_device_by_device_id(db, device_id)
+    if not device:
+        raise HTTPException(status_code=404, detail="Device not found")
+    return crud.get_device_uptime(db, device_id, days=days, is_demo=user.is_demo)
+
+
+@router.post("/{device_id}/heartbeat", response_model=Union[schemas.HeartbeatResponse, schemas.HeartbeatUnchanged])
+def device_heartbeat(device_id: str, heartbeat: schemas.DeviceHeartbeat, db: Session = Depends(get_db), _device: str = Depends(verify_device_api_key)):
     device = crud.update_device_heartbeat(db, device_id, heartbeat)
     if not device:
         raise HTTPException(status_code=404, detail="Device not found")
     crud.create_heartbeat_log(db, device_id, heartbeat)
-    crud.check_and_notify_offline_devices(db)
-    config = crud.build_heartbeat_config(db, device_id)
-    return config
+    version = device.config_version or 1
+    if heartbeat.config_version == version:
+        return schemas.HeartbeatUnchanged(config_version=version)
+    return crud.build_heartbeat_config(db, device_id, device=device)
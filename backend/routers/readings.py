@@ -1,16 +1,18 @@
 # routers/readings.py
 
 from fastapi import APIRouter, Depends, HTTPException, Request, Query
-from fastapi.responses import StreamingResponse
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse, JSONResponse, Response
 from sqlalchemy.orm import Session
-import schemas, crud, models
-from dependencies import get_db
+import schemas, crud, models, wire_format, reading_partitions
+from dependencies import get_db, get_user_db, run_read
 from typing import List, Optional
 from datetime import datetime
 import logging
 import csv
 import io
 from auth import UserInfo, get_current_user, verify_device_api_key, require_admin
+from services.ingest_queue import INGEST_MODE, IngestQueueFull, IngestQueueStopped, ingest_queue
 
 router = APIRouter(
     tags=["readings"],
@@ -20,49 +22,106 @@ router = APIRouter(
 @router.post("/readings", response_model=schemas.Reading)
 async def create_reading(reading: schemas.ReadingCreate, db: Session = Depends(get_db), _device: str = Depends(verify_device_api_key)):
     logging.info(f"Creating reading: {reading}")
-    db_device = crud.get_device_by_device_id(db, device_id=reading.device_id)
-    if db_device is None:
+    if not await run_in_threadpool(crud.device_exists, db, reading.device_id):
         raise HTTPException(status_code=404, detail="Device not found")
 
-    return crud.create_reading(db=db, reading=reading)
+    if INGEST_MODE == "queue":
+        return await _enqueue_readings([reading])
+    return await run_in_threadpool(crud.create_reading, db=db, reading=reading)
+
+
+@router.post("/readings/batch", response_model=List[schemas.Reading])
+async def create_readings_batch(batch: schemas.ReadingBatchCreate, db: Session = Depends(get_db), _device: str = Depends(verify_device_api_key)):
+    logging.info(f"Creating {len(batch.readings)} readings in batch")
+    missing = await run_in_threadpool(_missing_devices, db, {r.device_id for r in batch.readings})
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Device not found: {', '.join(sorted(missing))}")
+
+    if INGEST_MODE == "queue":
+        return await _enqueue_readings(batch.readings)
+    return await run_in_threadpool(crud.create_readings, db=db, readings=batch.readings)
+
+
+@router.post("/readings/binary", status_code=204)
+async def create_readings_binary(request: Request, db: Session = Depends(get_db), _device: str = Depends(verify_device_api_key)):
+    """Ingest binary reading frames (see wire_format.py) from the firmware.
+
+    The body holds one frame per live upload, or many back to back when the
+    device drains its offline buffer. Answers 204 with no body (202 in queue
+    mode) so the device has nothing to parse.
+    """
+    body = await request.body()
+    try:
+        frames = wire_format.decode_frames(body)
+    except wire_format.FrameError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid reading frame: {e}")
+    readings = [r for frame in frames for r in frame.readings]
+    logging.info(f"Creating {len(readings)} readings from {len(frames)} binary frame(s) of {frames[0].device_id}")
+    missing = await run_in_threadpool(_missing_devices, db, {f.device_id for f in frames})
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Device not found: {', '.join(sorted(missing))}")
+
+    if INGEST_MODE == "queue":
+        return await _enqueue_readings(readings)
+    await run_in_threadpool(crud.create_readings, db=db, readings=readings)
+    return Response(status_code=204)
+
+
+def _missing_devices(db: Session, device_ids: set) -> set:
+    return {device_id for device_id in device_ids if not crud.device_exists(db, device_id)}
+
+
+async def _enqueue_readings(readings: List[schemas.ReadingCreate]) -> JSONResponse:
+    try:
+        await ingest_queue.put(readings)
+    except IngestQueueFull as e:
+        logging.warning(f"Rejecting {len(readings)} readings: {e}")
+        detail = "Ingest queue not running, retry later" if isinstance(e, IngestQueueStopped) else "Ingest queue full, retry later"
+        raise HTTPException(status_code=503, detail=detail, headers={"Retry-After": "5"})
+    accepted = schemas.IngestAccepted(accepted=len(readings), queue_depth=ingest_queue.stats()["depth"])
+    return JSONResponse(status_code=202, content=accepted.model_dump())
 
 
 @router.get("/readings", response_model=List[schemas.Reading])
-async def read_readings(request: Request, skip: int = 0, limit: int = 100, db: Session = Depends(get_db), user: UserInfo = Depends(get_current_user)):
+def read_readings(request: Request, skip: int = 0, limit: int = 100, db: Session = Depends(get_user_db), user: UserInfo = Depends(get_current_user)):
     logging.info(f"Received request for readings: {request.url}")
     readings = crud.get_readings(db, skip=skip, limit=limit, is_demo=user.is_demo)
     return readings
 
 
-@router.get("/readings/export")
-async def export_readings_csv(
-    sensor_id: int = Query(..., description="Sensor DB id"),
-    start: Optional[datetime] = None,
-    end: Optional[datetime] = None,
-    db: Session = Depends(get_db),
-    user: UserInfo = Depends(get_current_user),
-):
-    sensor = db.query(models.Sensor).filter(models.Sensor.id == sensor_id, models.Sensor.is_demo == user.is_demo).first()
+# Analytics routes below run on the read-only pool via run_read, so a slow
+# export or compare never holds a connection or thread that ingest needs.
+
+def _get_sensor_or_404(db: Session, sensor_id: int, is_demo: bool) -> models.Sensor:
+    sensor = db.query(models.Sensor).filter(models.Sensor.id == sensor_id, models.Sensor.is_demo == is_demo).first()
     if not sensor:
         raise HTTPException(status_code=404, detail="Sensor not found")
+    return sensor
+
 
-    query = db.query(models.Reading).filter(models.Reading.sensor_id == sensor_id, models.Reading.is_demo == user.is_demo)
-    if start:
-        query = query.filter(models.Reading.timestamp >= start)
-    if end:
-        query = query.filter(models.Reading.timestamp <= end)
-    query = query.order_by(models.Reading.timestamp.asc())
-    readings = query.all()
+def _readings_csv(db: Session, sensor_id: int, start: Optional[datetime], end: Optional[datetime], is_demo: bool) -> str:
+    _get_sensor_or_404(db, sensor_id, is_demo)
+    readings = reading_partitions.select_readings(
+        db, lambda t: (t.c.sensor_id == sensor_id, t.c.is_demo == is_demo), start_time=start, end_time=end)
 
     output = io.StringIO()
     writer = csv.writer(output)
     writer.writerow(["timestamp", "moisture", "raw_adc"])
     for r in readings:
         writer.writerow([r.timestamp.isoformat(), r.moisture, r.raw_adc if r.raw_adc is not None else ""])
-    output.seek(0)
+    return output.getvalue()
 
+
+@router.get("/readings/export")
+async def export_readings_csv(
+    sensor_id: int = Query(..., description="Sensor DB id"),
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    user: UserInfo = Depends(get_current_user),
+):
+    content = await run_read(_readings_csv, sensor_id, start, end, user.is_demo, demo=user.is_demo)
     return StreamingResponse(
-        iter([output.getvalue()]),
+        iter([content]),
         media_type="text/csv",
         headers={"Content-Disposition": f"attachment; filename=sensor_{sensor_id}_readings.csv"},
     )
@@ -72,7 +131,6 @@ async def export_readings_csv(
 async def compare_readings(
     sensor_ids: str = Query(..., description="Comma-separated sensor DB IDs"),
     hours: int = Query(168, ge=1, le=8760, description="Time range in hours (default 7d, max 1yr)"),
-    db: Session = Depends(get_db),
     user: UserInfo = Depends(get_current_user),
 ):
     try:
@@ -83,7 +141,7 @@ async def compare_readings(
         raise HTTPException(status_code=400, detail="At least 1 sensor_id required")
     if len(ids) > 10:
         raise HTTPException(status_code=400, detail="Maximum 10 sensors allowed")
-    return crud.get_compare_readings(db, sensor_db_ids=ids, hours=hours, is_demo=user.is_demo)
+    return await run_read(crud.get_compare_readings, sensor_db_ids=ids, hours=hours, is_demo=user.is_demo, demo=user.is_demo)
 
 
 @router.get("/readings/sensor/{sensor_id}/aggregated", response_model=schemas.AggregatedReadingsResponse)
@@ -92,39 +150,27 @@ async def get_aggregated_readings(
     period: str = Query("daily", pattern="^(daily|weekly)$"),
     start_time: Optional[datetime] = None,
     end_time: Optional[datetime] = None,
-    db: Session = Depends(get_db),
     user: UserInfo = Depends(get_current_user),
 ):
-    sensor = db.query(models.Sensor).filter(models.Sensor.id == sensor_id, models.Sensor.is_demo == user.is_demo).first()
-    if not sensor:
-        raise HTTPException(status_code=404, detail="Sensor not found")
+    def aggregate(db: Session):
+        _get_sensor_or_404(db, sensor_id, user.is_demo)
+        return crud.get_aggregated_readings(db, sensor_db_id=sensor_id, period=period, start_time=start_time, end_time=end_time, is_demo=user.is_demo)
 
-    rows = crud.get_aggregated_readings(db, sensor_db_id=sensor_id, period=period, start_time=start_time, end_time=end_time, is_demo=user.is_demo)
-    data = [
-        schemas.AggregatedReadingPoint(
-            period_start=row.period_start,
-            avg_moisture=round(row.avg_moisture, 1),
-            min_moisture=round(row.min_moisture, 1),
-            max_moisture=round(row.max_moisture, 1),
-            reading_count=row.reading_count,
-        )
-        for row in rows
-    ]
+    data = await run_read(aggregate, demo=user.is_demo)
     return schemas.AggregatedReadingsResponse(sensor_id=sensor_id, period=period, data=data)
 
 
 @router.get("/readings/sensor/{sensor_id}/drying-rate", response_model=schemas.DryingRateResponse)
-async def get_drying_rate(sensor_id: int, db: Session = Depends(get_db), user: UserInfo = Depends(get_current_user)):
-    sensor = db.query(models.Sensor).filter(models.Sensor.id == sensor_id, models.Sensor.is_demo == user.is_demo).first()
-    if not sensor:
-        raise HTTPException(status_code=404, detail="Sensor not found")
+async def get_drying_rate(sensor_id: int, user: UserInfo = Depends(get_current_user)):
+    def drying_rate(db: Session):
+        _get_sensor_or_404(db, sensor_id, user.is_demo)
+        return crud.get_drying_rate(db, sensor_db_id=sensor_id, is_demo=user.is_demo)
 
-    result = crud.get_drying_rate(db, sensor_db_id=sensor_id, is_demo=user.is_demo)
-    return result
+    return await run_read(drying_rate, demo=user.is_demo)
 
 
 @router.get("/readings/sensor/{sensor_id}", response_model=List[schemas.Reading])
-async def read_readings_by_sensor(request: Request, sensor_id: int, device_id: str, start_time: datetime = None, end_time: datetime = None, db: Session = Depends(get_db), user: UserInfo = Depends(get_current_user)):
+def read_readings_by_sensor(request: Request, sensor_id: int, device_id: str, start_time: datetime = None, end_time: datetime = None, db: Session = Depends(get_user_db), user: UserInfo = Depends(get_current_user)):
     logging.info(f"Received request for readings by sensor: {request.url}")
     db_sensor = crud.get_sensor_by_sensor_id(db, device_id=device_id, sensor_id=sensor_id)
     if db_sensor is None:
@@ -136,12 +182,12 @@ async def read_readings_by_sensor(request: Request, sensor_id: int, device_id: s
 
 
 @router.get("/devices/{device_id}/sensors/{sensor_id}/readings", response_model=List[schemas.Reading])
-async def read_readings_by_device_and_sensor(
+def read_readings_by_device_and_sensor(
     request: Request,
     device_id: str,
     sensor_id: int,
     limit: int = Query(None, description="Limit the number of readings returned"),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_user_db),
     user: UserInfo = Depends(get_current_user),
 ):
     logging.info(f"Received request for readings by device and sensor: {request.url}")
@@ -167,6 +213,6 @@ async def read_readings_by_device_and_sensor(
 
 
 @router.delete("/readings/cleanup")
-async def cleanup_old_readings(older_than_days: int = Query(90, ge=1), db: Session = Depends(get_db), _user: UserInfo = Depends(require_admin)):
+def cleanup_old_readings(older_than_days: int = Query(90, ge=1), db: Session = Depends(get_db), _user: UserInfo = Depends(require_admin)):
     count = crud.delete_old_readings(db, older_than_days=older_than_days)
     return {"deleted": count, "older_than_days": older_than_days}
@@ -5,6 +5,7 @@ from typing import Optional, List
 
 import crud, schemas
 from database import SessionLocal
+from dependencies import get_user_db
 from auth import UserInfo, get_current_user, require_admin
 
 router = APIRouter(prefix="/watering-logs", tags=["watering-logs"])
@@ -35,7 +36,7 @@ def get_watering_logs(
     end_time: Optional[datetime] = None,
     skip: int = 0,
     limit: int = 50,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_user_db),
     user: UserInfo = Depends(get_current_user),
 ):
     return crud.get_watering_logs_by_sensor(db, sensor_id, start_time, end_time, skip, limit, is_demo=user.is_demo)
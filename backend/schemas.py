@@ -1,6 +1,6 @@
 # schemas.py
 
-from pydantic import BaseModel, ConfigDict
+from pydantic import BaseModel, ConfigDict, Field
 from datetime import datetime
 from typing import Optional, List
 
@@ -14,14 +14,32 @@ class ReadingCreate(BaseModel):
     sensor_id: int
     moisture: float
     raw_adc: Optional[float] = None
+    # Set by firmware so retried uploads are deduplicated (see services/ingest_dedupe.py)
+    boot_id: Optional[int] = Field(None, ge=0, le=0xFFFFFFFF)
+    seq: Optional[int] = Field(None, ge=0, le=0xFFFFFFFF)
+    # When the reading was taken, for readings uploaded late from the device's
+    # offline buffer; defaults to the time the server receives it
+    timestamp: Optional[datetime] = None
+
+
+class ReadingBatchCreate(BaseModel):
+    readings: List[ReadingCreate] = Field(..., min_length=1, max_length=500)
+
+
+class IngestAccepted(BaseModel):
+    accepted: int
+    queue_depth: int
 
 
 class Reading(ReadingBase):
-    id: int
+    # Points served from an aggregate tier (ranges past raw retention) have
+    # no id; moisture is the bucket average and timestamp the bucket start
+    id: Optional[int] = None
     device_id: str
     sensor_id: int
     timestamp: datetime
     raw_adc: Optional[float] = None
+    bucket_seconds: Optional[int] = None
 
     model_config = ConfigDict(from_attributes=True)
 
@@ -59,6 +77,9 @@ class SensorUpdate(BaseModel):
     zone_id: Optional[int] = None
     notes: Optional[str] = None
     auto_log_watering: Optional[bool] = None
+    report_mode: Optional[str] = None  # interval, on_change
+    report_deadband: Optional[float] = Field(None, gt=0, le=100)
+    report_max_silence: Optional[int] = Field(None, ge=60)
 
     model_config = ConfigDict(from_attributes=True)
 
@@ -72,6 +93,9 @@ class Sensor(SensorBase):
     calibration_wet: Optional[float] = None
     notes: Optional[str] = None
     auto_log_watering: bool = False
+    report_mode: str = "interval"
+    report_deadband: Optional[float] = None
+    report_max_silence: Optional[int] = None
 
     model_config = ConfigDict(from_attributes=True)
 
@@ -130,10 +154,29 @@ class Alert(AlertBase):
     model_config = ConfigDict(from_attributes=True)
 
 
+class AlertRuleCreate(BaseModel):
+    rule_type: str  # rate_of_change, zone_average, stale_sensor
+    sensor_id: Optional[int] = None
+    zone_id: Optional[int] = None
+    min_moisture: Optional[float] = None
+    max_moisture: Optional[float] = None
+    max_change_per_hour: Optional[float] = None
+    window_minutes: int = 60
+    stale_after_minutes: Optional[int] = None
+    enabled: bool = True
+
+
+class AlertRule(AlertRuleCreate):
+    id: int
+
+    model_config = ConfigDict(from_attributes=True)
+
+
 class DeviceHeartbeat(BaseModel):
     firmware_version: Optional[str] = None
     ip_address: Optional[str] = None
     mac_address: Optional[str] = None
+    config_version: Optional[int] = None  # config the device already has, from the last heartbeat response
 
 
 # Zone schemas
@@ -206,6 +249,7 @@ class SystemConfigBase(BaseModel):
     weather_latitude: Optional[float] = None
     weather_longitude: Optional[float] = None
     retention_days: int = 90
+    rollup_5m_retention_days: int = 365
 
 
 class SystemConfigUpdate(BaseModel):
@@ -218,6 +262,7 @@ class SystemConfigUpdate(BaseModel):
     weather_latitude: Optional[float] = None
     weather_longitude: Optional[float] = None
     retention_days: Optional[int] = None
+    rollup_5m_retention_days: Optional[int] = None
 
 
 class SystemConfig(SystemConfigBase):
@@ -253,6 +298,9 @@ class HeartbeatSensorConfig(BaseModel):
     calibration_wet: Optional[float] = None
     threshold_min: Optional[float] = None
     threshold_max: Optional[float] = None
+    report_mode: str = "interval"
+    report_deadband: Optional[float] = None
+    report_max_silence: Optional[int] = None
 
 
 class HeartbeatResponse(BaseModel):
@@ -260,10 +308,17 @@ class HeartbeatResponse(BaseModel):
     device_id: str
     name: str
     firmware_version: Optional[str] = None
+    config_version: int
     reading_interval: int
     sensors: List[HeartbeatSensorConfig] = []
 
 
+class HeartbeatUnchanged(BaseModel):
+    """Sent instead of the full config when the device already has config_version."""
+    config_version: int
+    unchanged: bool = True
+
+
 # Aggregated readings schemas
 
 class AggregatedReadingPoint(BaseModel):
@@ -292,18 +347,42 @@ class DatabaseStats(BaseModel):
     total_alerts: int
 
 
-# Heartbeat log entry schema
+# Cold archive schemas
 
-class HeartbeatLogEntry(BaseModel):
-    id: int
+class ArchiveFile(BaseModel):
+    sensor_id: int
+    month: int  # YYYYMM
     device_id: str
-    timestamp: datetime
+    reading_count: int
+    first_timestamp: datetime
+    last_timestamp: datetime
+    size_bytes: int
+
+
+# Heartbeat history schemas
+
+class HeartbeatInterval(BaseModel):
+    device_id: str
+    start_time: datetime
+    end_time: datetime
     ip_address: Optional[str] = None
     firmware_version: Optional[str] = None
+    heartbeat_count: int = 1
 
     model_config = ConfigDict(from_attributes=True)
 
 
+class DeviceUptime(BaseModel):
+    device_id: str
+    days: int
+    since: Optional[datetime] = None  # first heartbeat in the window, or the window start
+    uptime_seconds: int = 0
+    downtime_seconds: int = 0
+    uptime_percent: Optional[float] = None  # None when the device has no heartbeats in the window
+    outages: int = 0
+    longest_outage_seconds: int = 0
+
+
 # Sensor health indicator schema
 
 class SensorHealthIndicator(BaseModel):
@@ -350,4 +429,103 @@ class CompareReadingsResponse(BaseModel):
     sensor_count: int
     hours: int
     aggregated: bool
+    bucket_seconds: Optional[int] = None
     sensors: list[SensorCompareData]
+
+
+# Ingest queue stats schema
+
+class IngestQueueStats(BaseModel):
+    mode: str
+    running: bool
+    depth: int
+    pending: int
+    capacity: int
+    batch_size: int
+    flush_interval_ms: int
+    accepted_total: int
+    flushed_total: int
+    dropped_total: int
+    rejected_total: int
+    duplicates_total: int
+    batches_total: int
+    failed_batches_total: int
+    last_batch_size: int
+    last_flush_ms: Optional[float] = None
+    avg_flush_ms: Optional[float] = None
+    max_flush_ms: Optional[float] = None
+
+
+# Notification dispatcher stats schema
+
+class NotificationDispatcherStats(BaseModel):
+    running: bool
+    pending: int
+    failed: int
+    sent_total: int
+    retried_total: int
+    failed_total: int
+    deferred_total: int
+    last_send_ms: Optional[float] = None
+    last_error: Optional[str] = None
+
+
+# Device liveness stats schema
+
+class DeviceLivenessStats(BaseModel):
+    running: bool
+    tracked: int
+    offline: int
+    pending_flush: int
+    timeout_seconds: int
+    offline_total: int
+    online_total: int
+    flushed_total: int
+    last_flush_ms: Optional[float] = None
+
+
+# Database pool stats schema
+
+class DbPoolStats(BaseModel):
+    name: str  # write, read
+    pool_size: Optional[int] = None  # None for in-memory databases, which have no QueuePool
+    checked_out: Optional[int] = None
+    overflow: Optional[int] = None
+    checkouts: Optional[int] = None
+    timeouts: Optional[int] = None
+    avg_wait_ms: Optional[float] = None
+    max_wait_ms: Optional[float] = None
+    threads_busy: int
+    threads_total: int
+
+
+# Startup report schemas
+
+class StartupStep(BaseModel):
+    name: str
+    ms: float
+    detail: Optional[str] = None
+
+
+class StartupReport(BaseModel):
+    ready_ms: Optional[float] = None  # None until the startup hooks have finished
+    phases: List[StartupStep]
+    deferred: List[StartupStep]  # maintenance run after startup, as each job finishes
+
+
+# Backup progress schema
+
+class BackupProgress(BaseModel):
+    id: str
+    kind: str  # full or incremental
+    since: Optional[str] = None
+    method: str  # snapshot (streamed from the live file) or copy (temp file fallback)
+    state: str  # running, complete, aborted or failed
+    page_size: int
+    pages_total: int
+    pages_done: int
+    pages_changed: Optional[int] = None  # incremental backups only
+    bytes_out: int
+    started_at: datetime
+    finished_at: Optional[datetime] = None
+    error: Optional[str] = None
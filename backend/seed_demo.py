@@ -1,7 +1,8 @@
-"""Seed demo data (is_demo=True) on every backend startup.
+"""Demo dataset (is_demo=True) for the demo role's database.
 
-Deletes all existing demo records, then re-creates fresh data
-with timestamps relative to now.
+demo_db builds it into a separate in-memory database, with timestamps
+relative to the time of the build. purge_demo_data removes demo rows left
+in the production database by versions that seeded it there on startup.
 """
 
 import logging
@@ -9,40 +10,44 @@ import math
 import random
 from datetime import datetime, timedelta, timezone
 
-from database import SessionLocal
 import models
+import reading_partitions
 
 logger = logging.getLogger(__name__)
 
 
-def seed_demo_data():
-    db = SessionLocal()
-    try:
-        _purge_demo(db)
-        _seed(db)
-        db.commit()
-        logger.info("Demo data seeded successfully")
-    except Exception:
-        db.rollback()
-        logger.exception("Failed to seed demo data")
-    finally:
-        db.close()
+def purge_demo_data(db) -> bool:
+    """Delete demo rows from db and commit; returns False (doing nothing) if there are none.
+
+    The old startup seed always created demo zones, so their absence means
+    there is nothing left to delete.
+    """
+    if db.query(models.Zone.id).filter(models.Zone.is_demo == True).first() is None:
+        return False
+    _purge_demo(db)
+    db.commit()
+    logger.info("Removed demo data from the database")
+    return True
 
 
 def _purge_demo(db):
     """Delete all is_demo=True rows in dependency order."""
     db.query(models.WateringLog).filter(models.WateringLog.is_demo == True).delete(synchronize_session=False)
     db.query(models.Alert).filter(models.Alert.is_demo == True).delete(synchronize_session=False)
-    db.query(models.Reading).filter(models.Reading.is_demo == True).delete(synchronize_session=False)
+    reading_partitions.delete_readings(db, lambda t: (t.c.is_demo == True,))
+    db.query(models.SensorState).filter(models.SensorState.is_demo == True).delete(synchronize_session=False)
+    db.query(models.ReadingRollup).filter(models.ReadingRollup.is_demo == True).delete(synchronize_session=False)
     db.query(models.Threshold).filter(models.Threshold.is_demo == True).delete(synchronize_session=False)
     db.query(models.HeartbeatLog).filter(models.HeartbeatLog.is_demo == True).delete(synchronize_session=False)
+    db.query(models.DeviceUptimeInterval).filter(models.DeviceUptimeInterval.is_demo == True).delete(synchronize_session=False)
     db.query(models.Sensor).filter(models.Sensor.is_demo == True).delete(synchronize_session=False)
     db.query(models.Device).filter(models.Device.is_demo == True).delete(synchronize_session=False)
     db.query(models.Zone).filter(models.Zone.is_demo == True).delete(synchronize_session=False)
     db.flush()
 
 
-def _seed(db):
+def seed(db):
+    """Add the demo dataset to db, flushed but not committed."""
     now = datetime.now(timezone.utc)
 
     # --- Zones ---
@@ -123,6 +128,7 @@ def _seed(db):
         [2.5, 5.0],       # Basil
     ]
     watering_logs_to_add = []
+    demo_readings = []
 
     for si, s in enumerate(sensor_objs):
         moisture = 70.0 + random.uniform(-5, 5)
@@ -142,14 +148,14 @@ def _seed(db):
             moisture += random.gauss(0, 0.3)
             moisture = max(5.0, min(95.0, moisture))
 
-            db.add(models.Reading(
-                device_id=s.device_id,
-                sensor_id=s.id,
-                timestamp=t,
-                moisture=round(moisture, 1),
-                raw_adc=round(3200 - (moisture / 100) * 1800 + random.gauss(0, 10), 0),
-                is_demo=True,
-            ))
+            demo_readings.append({
+                "device_id": s.device_id,
+                "sensor_id": s.id,
+                "timestamp": t,
+                "moisture": round(moisture, 1),
+                "raw_adc": round(3200 - (moisture / 100) * 1800 + random.gauss(0, 10), 0),
+                "is_demo": True,
+            })
             t += interval
 
         # Add watering logs
@@ -164,6 +170,7 @@ def _seed(db):
                 is_demo=True,
             ))
 
+    reading_partitions.insert_readings(db, demo_readings)
     db.add_all(watering_logs_to_add)
     db.flush()
 
@@ -0,0 +1,347 @@
+"""In-memory alert rule engine.
+
+Thresholds and alert rules are compiled into per-sensor rule objects on first
+use and recompiled only after crud marks them dirty. Per-sensor state (recent
+values, zone running sums, last-fired times for the 30-minute cooldown) lives
+in memory, seeded from sensor_state and recent alerts on first load, so
+evaluating a reading never queries the alerts table; the DB is only written
+when an alert actually fires. Every rule has its own cooldown, so one rule
+firing doesn't mute another on the same sensor.
+
+The engine changes its state while the caller's transaction is still open.
+Callers pass an undo dict to evaluate/check_stale and hand it to rollback()
+if the transaction fails, so a lost alert doesn't leave its rule muted.
+
+Rule types:
+    threshold       - min/max moisture from the sensor's Threshold row
+    rate_of_change  - moisture moved more than max_change_per_hour over the
+                      last window_minutes
+    zone_average    - average of the latest reading of every sensor in a zone
+                      left [min_moisture, max_moisture]
+    stale_sensor    - no reading for stale_after_minutes (checked periodically
+                      by check_stale rather than per reading); for on_change
+                      sensors at least two report_max_silence periods
+"""
+
+import threading
+from collections import deque
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+import models
+
+ALERT_COOLDOWN = timedelta(minutes=30)
+
+_MISSING = object()
+
+
+def _utc(ts: datetime) -> datetime:
+    return ts.replace(tzinfo=timezone.utc) if ts.tzinfo is None else ts
+
+
+class ThresholdRule:
+    def __init__(self, min_moisture, max_moisture):
+        self.min_moisture = min_moisture
+        self.max_moisture = max_moisture
+
+    def cooldown_key(self, sensor_id):
+        return ("threshold", sensor_id)
+
+    def evaluate(self, engine, sensor_id, moisture, ts):
+        if self.min_moisture is not None and moisture < self.min_moisture:
+            return f"Moisture level below minimum threshold: {moisture}"
+        if self.max_moisture is not None and moisture > self.max_moisture:
+            return f"Moisture level above maximum threshold: {moisture}"
+        return None
+
+
+class RateOfChangeRule:
+    def __init__(self, rule_id, max_change_per_hour, window_minutes):
+        self.rule_id = rule_id
+        self.max_change_per_hour = max_change_per_hour
+        self.window = timedelta(minutes=window_minutes or 60)
+
+    def cooldown_key(self, sensor_id):
+        return ("rate_of_change", self.rule_id)
+
+    def evaluate(self, engine, sensor_id, moisture, ts):
+        history = engine.history(sensor_id)
+        if not history:
+            return None
+        first_ts, first_moisture = history[0]
+        elapsed = (ts - first_ts).total_seconds()
+        # Need at least half a window of history for a meaningful rate
+        if elapsed < self.window.total_seconds() / 2:
+            return None
+        rate = (moisture - first_moisture) / (elapsed / 3600.0)
+        if abs(rate) > self.max_change_per_hour:
+            direction = "rose" if rate > 0 else "dropped"
+            return f"Moisture {direction} {abs(moisture - first_moisture):.1f}% in {elapsed / 60:.0f} min ({rate:+.1f}%/h)"
+        return None
+
+
+class ZoneAverageRule:
+    def __init__(self, rule_id, zone_id, min_moisture, max_moisture):
+        self.rule_id = rule_id
+        self.zone_id = zone_id
+        self.min_moisture = min_moisture
+        self.max_moisture = max_moisture
+
+    def cooldown_key(self, sensor_id):
+        return ("zone_average", self.rule_id)
+
+    def evaluate(self, engine, sensor_id, moisture, ts):
+        avg = engine.zone_average(self.zone_id)
+        if avg is None:
+            return None
+        if self.min_moisture is not None and avg < self.min_moisture:
+            return f"Zone average moisture below minimum: {avg:.1f}"
+        if self.max_moisture is not None and avg > self.max_moisture:
+            return f"Zone average moisture above maximum: {avg:.1f}"
+        return None
+
+
+class StaleSensorRule:
+    def __init__(self, rule_id, stale_after_minutes, max_silence_seconds=None):
+        self.rule_id = rule_id
+        self.stale_after = timedelta(minutes=stale_after_minutes)
+        if max_silence_seconds:
+            # A report-on-change sensor is quiet by design; only a missed
+            # forced report means it's gone
+            self.stale_after = max(self.stale_after, timedelta(seconds=2 * max_silence_seconds))
+
+    def cooldown_key(self, sensor_id):
+        return ("stale", sensor_id)
+
+
+class AlertEngine:
+    def __init__(self, cooldown: timedelta = ALERT_COOLDOWN):
+        self.cooldown = cooldown
+        self._lock = threading.RLock()
+        self._dirty = True
+        self._seeded = False
+        self._rules = {}        # sensor DB id -> tuple of per-reading rules
+        self._stale_rules = {}  # sensor DB id -> StaleSensorRule
+        self._sensor_zone = {}  # sensor DB id -> zone id
+        self._last_fired = {}   # cooldown key -> datetime
+        self._last_seen = {}    # sensor DB id -> datetime of latest reading
+        self._latest = {}       # sensor DB id -> latest moisture
+        self._zone_sum = {}
+        self._zone_count = {}
+        self._history = {}      # sensor DB id -> deque of (ts, moisture)
+        self._history_window = {}
+        self._started = datetime.now(timezone.utc)
+
+    def invalidate(self):
+        """Recompile rules before the next evaluation."""
+        self._dirty = True
+
+    def load(self, db: Session):
+        with self._lock:
+            rules = {}
+            stale_rules = {}
+            history_window = {}
+
+            for t in db.query(models.Threshold).all():
+                if t.min_moisture is not None or t.max_moisture is not None:
+                    rules.setdefault(t.sensor_id, []).append(ThresholdRule(t.min_moisture, t.max_moisture))
+
+            sensor_zone = {}
+            max_silence = {}
+            for sid, zid, mode, silence in db.query(
+                models.Sensor.id, models.Sensor.zone_id, models.Sensor.report_mode, models.Sensor.report_max_silence
+            ):
+                sensor_zone[sid] = zid
+                if mode == models.ReportMode.on_change:
+                    max_silence[sid] = silence or models.DEFAULT_REPORT_MAX_SILENCE
+            zone_sensors = {}
+            for sid, zid in sensor_zone.items():
+                if zid is not None:
+                    zone_sensors.setdefault(zid, []).append(sid)
+
+            for r in db.query(models.AlertRule).filter(models.AlertRule.enabled == True).all():
+                if r.rule_type == models.AlertRuleType.rate_of_change and r.sensor_id is not None and r.max_change_per_hour:
+                    rule = RateOfChangeRule(r.id, r.max_change_per_hour, r.window_minutes)
+                    rules.setdefault(r.sensor_id, []).append(rule)
+                    history_window[r.sensor_id] = max(history_window.get(r.sensor_id, timedelta(0)), rule.window)
+                elif r.rule_type == models.AlertRuleType.zone_average and r.zone_id is not None:
+                    rule = ZoneAverageRule(r.id, r.zone_id, r.min_moisture, r.max_moisture)
+                    for sid in zone_sensors.get(r.zone_id, []):
+                        rules.setdefault(sid, []).append(rule)
+                elif r.rule_type == models.AlertRuleType.stale_sensor and r.sensor_id is not None and r.stale_after_minutes:
+                    stale_rules[r.sensor_id] = StaleSensorRule(r.id, r.stale_after_minutes, max_silence.get(r.sensor_id))
+
+            if not self._seeded:
+                self._seed_cooldowns(db, rules)
+                self._seed_latest(db)
+                self._seeded = True
+
+            # Rebuild zone running sums for the new zone membership
+            zone_sum, zone_count = {}, {}
+            for sid, moisture in self._latest.items():
+                zid = sensor_zone.get(sid)
+                if zid is not None:
+                    zone_sum[zid] = zone_sum.get(zid, 0.0) + moisture
+                    zone_count[zid] = zone_count.get(zid, 0) + 1
+
+            self._rules = {sid: tuple(r) for sid, r in rules.items()}
+            self._stale_rules = stale_rules
+            self._sensor_zone = sensor_zone
+            self._zone_sum, self._zone_count = zone_sum, zone_count
+            self._history_window = history_window
+            self._history = {sid: h for sid, h in self._history.items() if sid in history_window}
+            self._dirty = False
+
+    def _seed_cooldowns(self, db: Session, rules: dict):
+        # Keep the cooldown across restarts: one grouped query at load time.
+        # Alerts don't record which rule fired, so a recent alert holds off
+        # every per-sensor rule of its sensor.
+        cutoff = datetime.now(timezone.utc) - self.cooldown
+        rows = db.query(models.Alert.sensor_id, func.max(models.Alert.timestamp)).filter(
+            models.Alert.timestamp >= cutoff
+        ).group_by(models.Alert.sensor_id).all()
+        for sensor_id, ts in rows:
+            for rule in rules.get(sensor_id, ()):
+                if not isinstance(rule, ZoneAverageRule):
+                    self._last_fired.setdefault(rule.cooldown_key(sensor_id), _utc(ts))
+
+    def _seed_latest(self, db: Session):
+        # Zone averages and staleness pick up where they left off
+        for sensor_id, moisture, ts in db.query(
+            models.SensorState.sensor_id, models.SensorState.last_moisture, models.SensorState.last_timestamp
+        ):
+            if moisture is not None and sensor_id not in self._latest:
+                self._latest[sensor_id] = moisture
+            if ts is not None and sensor_id not in self._last_seen:
+                self._last_seen[sensor_id] = _utc(ts)
+
+    def history(self, sensor_id: int):
+        return self._history.get(sensor_id)
+
+    def zone_average(self, zone_id: int):
+        count = self._zone_count.get(zone_id)
+        if not count:
+            return None
+        return self._zone_sum[zone_id] / count
+
+    def _save(self, undo, store: str, key):
+        """Remember self.<store>[key] before its first change in this transaction."""
+        if undo is None or (store, key) in undo:
+            return
+        value = getattr(self, store).get(key, _MISSING)
+        if isinstance(value, deque):
+            value = deque(value)
+        undo[(store, key)] = value
+
+    def rollback(self, undo: dict):
+        """Put back the state saved in undo after the caller's transaction failed."""
+        if not undo:
+            return
+        with self._lock:
+            for (store, key), value in undo.items():
+                if value is _MISSING:
+                    getattr(self, store).pop(key, None)
+                else:
+                    getattr(self, store)[key] = value
+            undo.clear()
+        # Zone sums are rebuilt from the restored latest values on reload
+        self.invalidate()
+
+    def _observe(self, sensor_id: int, moisture: float, ts: datetime, undo=None) -> bool:
+        """Fold a reading into the sensor's state; False if it is older than the latest one.
+
+        A backfilled reading that arrives after newer ones describes the past,
+        so it must not replace the latest value, the zone sums or the history
+        (which is kept in time order for pruning).
+        """
+        last_seen = self._last_seen.get(sensor_id)
+        if last_seen is not None and ts < last_seen:
+            return False
+        self._save(undo, "_latest", sensor_id)
+        self._save(undo, "_last_seen", sensor_id)
+        self._save(undo, "_history", sensor_id)
+        previous = self._latest.get(sensor_id)
+        self._latest[sensor_id] = moisture
+        zid = self._sensor_zone.get(sensor_id)
+        if zid is not None:
+            if previous is None:
+                self._zone_sum[zid] = self._zone_sum.get(zid, 0.0) + moisture
+                self._zone_count[zid] = self._zone_count.get(zid, 0) + 1
+            else:
+                self._zone_sum[zid] += moisture - previous
+        self._last_seen[sensor_id] = ts
+
+        window = self._history_window.get(sensor_id)
+        if window is not None:
+            history = self._history.setdefault(sensor_id, deque())
+            while history and ts - history[0][0] > window:
+                history.popleft()
+        return True
+
+    def _record(self, sensor_id: int, moisture: float, ts: datetime):
+        if sensor_id in self._history_window:
+            self._history[sensor_id].append((ts, moisture))
+
+    def _fire(self, key, now: datetime, undo=None) -> bool:
+        last = self._last_fired.get(key)
+        if last is not None and now - last < self.cooldown:
+            return False
+        self._save(undo, "_last_fired", key)
+        self._last_fired[key] = now
+        return True
+
+    def evaluate(self, db: Session, sensor_id: int, moisture: float, ts: datetime = None, undo: dict = None) -> list:
+        """Feed one reading through the sensor's rules.
+
+        Returns the alert messages that fired (cooldown already applied).
+        A reading older than the sensor's latest one is not evaluated.
+        State changes are recorded in undo for rollback().
+        """
+        ts = _utc(ts) if ts else datetime.now(timezone.utc)
+        if self._dirty:
+            self.load(db)
+        with self._lock:
+            if not self._observe(sensor_id, moisture, ts, undo):
+                return []
+            fired = []
+            for rule in self._rules.get(sensor_id, ()):
+                message = rule.evaluate(self, sensor_id, moisture, ts)
+                if message and self._fire(rule.cooldown_key(sensor_id), ts, undo):
+                    fired.append(message)
+            self._record(sensor_id, moisture, ts)
+            return fired
+
+    def check_stale(self, db: Session, now: datetime = None, undo: dict = None) -> list:
+        """Return (sensor_id, message) for sensors whose stale rule tripped."""
+        now = now or datetime.now(timezone.utc)
+        if self._dirty:
+            self.load(db)
+        fired = []
+        with self._lock:
+            for sensor_id, rule in self._stale_rules.items():
+                last_seen = self._last_seen.get(sensor_id, self._started)
+                age = now - last_seen
+                if age > rule.stale_after and self._fire(rule.cooldown_key(sensor_id), now, undo):
+                    fired.append((sensor_id, f"No reading received for {age.total_seconds() / 60:.0f} minutes"))
+        return fired
+
+    def forget_sensors(self, sensor_ids):
+        with self._lock:
+            for sid in sensor_ids:
+                moisture = self._latest.pop(sid, None)
+                zid = self._sensor_zone.get(sid)
+                if moisture is not None and zid is not None:
+                    self._zone_sum[zid] -= moisture
+                    self._zone_count[zid] -= 1
+                self._last_seen.pop(sid, None)
+                self._history.pop(sid, None)
+                for rule in self._rules.get(sid, ()):
+                    if not isinstance(rule, ZoneAverageRule):
+                        self._last_fired.pop(rule.cooldown_key(sid), None)
+                self._last_fired.pop(("stale", sid), None)
+        self.invalidate()
+
+
+alert_engine = AlertEngine()
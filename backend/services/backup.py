@@ -0,0 +1,349 @@
+"""Online database backups, streamed gzip-compressed straight to the client.
+
+A full backup is the database file itself, gzipped: gunzip it and it opens
+as an ordinary SQLite database. An incremental backup holds only the pages
+that changed since the previous backup, full or incremental;
+apply_incremental() (and utils/apply_backup.py) writes them over a restored
+copy.
+
+No temp copy is needed in WAL mode. Writers only append to the WAL, and a
+checkpoint never copies a frame into the database file past the snapshot
+of a reader that is still open. So a backup opens a read transaction and
+runs a passive checkpoint: if that caught the WAL all the way up, the
+database file is exactly the reader's snapshot and stays that way until
+the reader closes. The file is then read BACKUP_STEP_PAGES pages at a time
+in worker threads, as fast as the client takes the response. Ingest keeps
+committing to the WAL meanwhile; the WAL just can't be checkpointed until
+the backup ends. When a commit lands between the read and the checkpoint
+BACKUP_PIN_ATTEMPTS times in a row, or the journal mode isn't WAL, the
+backup falls back to sqlite3's backup API into a temp file, which is
+streamed the same way and deleted afterwards.
+
+Incremental backups compare an 8-byte BLAKE2b digest of every page with
+the manifest the previous backup saved ($BACKUP_MANIFEST_PATH, next to the
+database by default). Monthly reading partitions are ordinary tables, so a
+sealed month's pages stop changing and drop out of incrementals on their
+own. The manifest is only replaced once a backup has been streamed to the
+end, so an interrupted download doesn't break the chain.
+
+Incremental file, inside the gzip stream (integers little-endian):
+
+    offset  size       field
+    0       4          magic b"PWAB"
+    4       1          version (1)
+    5       16         id of the backup this one applies on top of, ASCII
+    21      16         id of this backup, ASCII
+    37      4          page size
+    41      4          page count of the database after applying
+    45      ...        records: u32 page number (from 1), then the page;
+                       a page number of 0 ends the file
+"""
+
+import gzip
+import hashlib
+import logging
+import os
+import sqlite3
+import struct
+import tempfile
+import threading
+import time
+import uuid
+import zlib
+from datetime import datetime, timezone
+
+from sqlalchemy.engine import make_url
+
+from database import SQLALCHEMY_DATABASE_URL, is_file_url
+
+logger = logging.getLogger(__name__)
+
+BACKUP_STEP_PAGES = int(os.getenv("BACKUP_STEP_PAGES", "1024"))
+BACKUP_GZIP_LEVEL = int(os.getenv("BACKUP_GZIP_LEVEL", "1"))
+BACKUP_PIN_ATTEMPTS = int(os.getenv("BACKUP_PIN_ATTEMPTS", "20"))
+BACKUP_PIN_RETRY_SECONDS = 0.05
+
+MAGIC = b"PWAB"
+MANIFEST_MAGIC = b"PWAM"
+VERSION = 1
+_HEADER = struct.Struct("<4sB16s16sII")
+_MANIFEST_HEADER = struct.Struct("<4sB16sII")
+_PAGE_NUMBER = struct.Struct("<I")
+DIGEST_SIZE = 8
+
+
+class BackupBusy(Exception):
+    pass
+
+
+class BackupChainError(Exception):
+    """since doesn't name the previous backup, so an incremental can't be built on it."""
+
+
+def _page_digest(page: bytes) -> bytes:
+    return hashlib.blake2b(page, digest_size=DIGEST_SIZE).digest()
+
+
+class _Source:
+    """The database as one consistent file of page_count pages, readable from any thread."""
+
+    def __init__(self, path: str, page_size: int, page_count: int, method: str, reader=None, temp_path: str = None):
+        self.page_size = page_size
+        self.page_count = page_count
+        self.method = method
+        self._reader = reader  # holds the snapshot open while the file is read
+        self._temp_path = temp_path
+        self._fd = os.open(path, os.O_RDONLY)
+
+    def read(self, first_page: int, count: int) -> bytes:
+        return os.pread(self._fd, count * self.page_size, (first_page - 1) * self.page_size)
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+        if self._reader is not None:
+            self._reader.close()
+            self._reader = None
+        if self._temp_path is not None:
+            os.unlink(self._temp_path)
+            self._temp_path = None
+
+
+def _pin_snapshot(db_path: str):
+    """Hold a read snapshot that the database file matches; None if that isn't possible right now."""
+    for _ in range(BACKUP_PIN_ATTEMPTS):
+        reader = sqlite3.connect(db_path, isolation_level=None, check_same_thread=False)
+        try:
+            if reader.execute("PRAGMA journal_mode").fetchone()[0].lower() != "wal":
+                reader.close()
+                return None
+            reader.execute("BEGIN")
+            reader.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()  # takes the snapshot
+            page_size = reader.execute("PRAGMA page_size").fetchone()[0]
+            page_count = reader.execute("PRAGMA page_count").fetchone()[0]
+            checkpointer = sqlite3.connect(db_path)
+            try:
+                _, wal_frames, checkpointed = checkpointer.execute("PRAGMA wal_checkpoint(PASSIVE)").fetchone()
+            finally:
+                checkpointer.close()
+        except Exception:
+            reader.close()
+            raise
+        if wal_frames == checkpointed:
+            return _Source(db_path, page_size, page_count, "snapshot", reader=reader)
+        reader.close()
+        time.sleep(BACKUP_PIN_RETRY_SECONDS)
+    return None
+
+
+def _copy_to_temp(db_path: str) -> _Source:
+    fd, temp_path = tempfile.mkstemp(suffix=".db", dir=os.path.dirname(db_path))
+    os.close(fd)
+    try:
+        source = sqlite3.connect(db_path)
+        dest = sqlite3.connect(temp_path)
+        try:
+            source.backup(dest)
+            page_size = dest.execute("PRAGMA page_size").fetchone()[0]
+            page_count = dest.execute("PRAGMA page_count").fetchone()[0]
+        finally:
+            source.close()
+            dest.close()
+        return _Source(temp_path, page_size, page_count, "copy", temp_path=temp_path)
+    except Exception:
+        os.unlink(temp_path)
+        raise
+
+
+def read_manifest(path: str):
+    """(backup id, page size, page count, digests) saved by the last complete backup, or None."""
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except FileNotFoundError:
+        return None
+    magic, version, backup_id, page_size, page_count = _MANIFEST_HEADER.unpack_from(data)
+    if magic != MANIFEST_MAGIC or version != VERSION:
+        return None
+    digests = data[_MANIFEST_HEADER.size:]
+    return backup_id.decode(), page_size, page_count, digests
+
+
+def _write_manifest(path: str, backup_id: str, page_size: int, page_count: int, digests: bytes):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(_MANIFEST_HEADER.pack(MANIFEST_MAGIC, VERSION, backup_id.encode(), page_size, page_count))
+        f.write(digests)
+    os.replace(tmp_path, path)
+
+
+class BackupStream:
+    """One backup: iterate it for the gzip bytes. Setup already ran, so id and filename are known up front."""
+
+    def __init__(self, service: "BackupService", source: _Source, since: str = None, base_digests: bytes = None):
+        self.id = uuid.uuid4().hex[:16]
+        self.kind = "incremental" if since else "full"
+        self.since = since
+        self.page_count = source.page_count
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        extension = "pwab.gz" if since else "db.gz"
+        self.filename = f"plant_water_array_backup_{timestamp}_{self.id}.{extension}"
+        self._service = service
+        self._source = source
+        self._base_digests = base_digests
+        self._closed = False
+
+    def __iter__(self):
+        return self._chunks()
+
+    def _chunks(self):
+        source = self._source
+        page_size = source.page_size
+        progress = self._service._progress
+        gz = zlib.compressobj(BACKUP_GZIP_LEVEL, zlib.DEFLATED, 31)  # wbits 31: gzip container
+        digests = bytearray()
+        base = self._base_digests
+        finished = False
+        try:
+            if self.kind == "incremental":
+                yield gz.compress(_HEADER.pack(MAGIC, VERSION, self.since.encode(), self.id.encode(), page_size, source.page_count))
+            for first in range(1, source.page_count + 1, BACKUP_STEP_PAGES):
+                count = min(BACKUP_STEP_PAGES, source.page_count - first + 1)
+                data = source.read(first, count)
+                if self.kind == "full":
+                    out = data
+                    for offset in range(0, len(data), page_size):
+                        digests += _page_digest(data[offset:offset + page_size])
+                else:
+                    parts = []
+                    for i, offset in enumerate(range(0, len(data), page_size)):
+                        page = data[offset:offset + page_size]
+                        digest = _page_digest(page)
+                        digests += digest
+                        index = (first + i - 1) * DIGEST_SIZE
+                        if base[index:index + DIGEST_SIZE] != digest:
+                            parts.append(_PAGE_NUMBER.pack(first + i))
+                            parts.append(page)
+                            progress["pages_changed"] += 1
+                    out = b"".join(parts)
+                chunk = gz.compress(out)
+                progress["pages_done"] += count
+                progress["bytes_out"] += len(chunk)
+                if chunk:
+                    yield chunk
+            tail = gz.compress(_PAGE_NUMBER.pack(0)) if self.kind == "incremental" else b""
+            tail += gz.flush()
+            progress["bytes_out"] += len(tail)
+            yield tail
+            finished = True
+            _write_manifest(self._service.manifest_path, self.id, page_size, source.page_count, bytes(digests))
+        except GeneratorExit:
+            progress["state"] = "aborted"
+            raise
+        except Exception as e:
+            progress["state"] = "failed"
+            progress["error"] = f"{type(e).__name__}: {e}"
+            logger.exception("Backup failed")
+            raise
+        finally:
+            if finished:
+                progress["state"] = "complete"
+            progress["finished_at"] = datetime.now(timezone.utc)
+            self.close()
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            self._source.close()
+            self._service._release()
+
+    def __del__(self):
+        # A response that is dropped before it starts streaming never runs _chunks
+        self.close()
+
+
+class BackupService:
+    def __init__(self, db_path: str, manifest_path: str):
+        self.db_path = db_path
+        self.manifest_path = manifest_path
+        self._lock = threading.Lock()
+        self._progress = None
+
+    def start(self, since: str = None) -> BackupStream:
+        """Pin a consistent view of the database and return the stream to send.
+
+        Raises BackupBusy if another backup is streaming and BackupChainError
+        if since isn't the id of the last complete backup.
+        """
+        if not self._lock.acquire(blocking=False):
+            raise BackupBusy("A backup is already running")
+        try:
+            base_digests = None
+            if since:
+                manifest = read_manifest(self.manifest_path)
+                if manifest is None or manifest[0] != since:
+                    last = manifest[0] if manifest else None
+                    raise BackupChainError(f"{since} is not the last complete backup ({last}); take a full backup")
+                base_digests = manifest[3]
+            source = _pin_snapshot(self.db_path) or _copy_to_temp(self.db_path)
+            if since and source.page_size != manifest[1]:
+                source.close()
+                raise BackupChainError("The page size changed since the last backup; take a full backup")
+            stream = BackupStream(self, source, since, base_digests)
+        except BaseException:
+            self._lock.release()
+            raise
+        self._progress = {
+            "id": stream.id,
+            "kind": stream.kind,
+            "since": since,
+            "method": source.method,
+            "state": "running",
+            "page_size": source.page_size,
+            "pages_total": source.page_count,
+            "pages_done": 0,
+            "pages_changed": 0 if since else None,
+            "bytes_out": 0,
+            "started_at": datetime.now(timezone.utc),
+            "finished_at": None,
+            "error": None,
+        }
+        logger.info(f"Backup {stream.id} ({stream.kind}, {source.method}) started: {source.page_count} pages")
+        return stream
+
+    def _release(self):
+        self._lock.release()
+
+    def progress(self):
+        """The running backup's progress, or the last one's result; None before the first backup."""
+        return dict(self._progress) if self._progress else None
+
+
+def apply_incremental(db_path: str, path: str, expected_base: str = None) -> str:
+    """Write an incremental backup file over a restored copy of its base; returns the new backup id."""
+    with gzip.open(path, "rb") as f:
+        magic, version, base_id, backup_id, page_size, page_count = _HEADER.unpack(f.read(_HEADER.size))
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not an incremental backup")
+        if expected_base is not None and base_id.decode() != expected_base:
+            raise ValueError(f"{path} applies on top of {base_id.decode()}, not {expected_base}")
+        with open(db_path, "r+b") as db:
+            while True:
+                (pgno,) = _PAGE_NUMBER.unpack(f.read(_PAGE_NUMBER.size))
+                if pgno == 0:
+                    break
+                db.seek((pgno - 1) * page_size)
+                db.write(f.read(page_size))
+            db.truncate(page_count * page_size)
+    return backup_id.decode()
+
+
+def _db_path():
+    if not is_file_url(SQLALCHEMY_DATABASE_URL):
+        return None
+    return os.path.abspath(make_url(SQLALCHEMY_DATABASE_URL).database)
+
+
+_path = _db_path()
+backup_service = BackupService(_path, os.getenv("BACKUP_MANIFEST_PATH", f"{_path}.backup-manifest")) if _path else None
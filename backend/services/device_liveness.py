@@ -0,0 +1,294 @@
+"""In-memory device liveness tracking.
+
+Heartbeats only update an in-memory last_seen. Each device has one entry in
+a heap of deadlines (last_seen + device_timeout). A background task sleeps
+until the earliest deadline and then marks the device offline, so offline
+detection no longer depends on some other device heartbeating. An entry
+that a later heartbeat made stale is pushed back to its new deadline when
+popped, so the heap never holds more than one entry per device. The next
+heartbeat from an offline device is a back-online event.
+
+Offline and back-online notifications go through the outbox the same way as
+before. offline_notified still records that the offline notification was
+sent, so a back-online message only follows one that went out.
+
+devices.last_seen is written in one batch every LIVENESS_FLUSH_SECONDS
+instead of being committed on every heartbeat. The dashboard's online count
+reads the in-memory value, so it isn't affected by the flush delay. The
+tracker is seeded from the devices table at startup. Demo devices never
+heartbeat and are not tracked.
+"""
+
+import asyncio
+import heapq
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import bindparam
+from sqlalchemy.orm import Session
+
+import models
+from database import SessionLocal
+from services.notification_dispatcher import notification_dispatcher
+from services.notifications import queue_device_offline_notification, queue_device_online_notification
+
+logger = logging.getLogger(__name__)
+
+LIVENESS_FLUSH_SECONDS = float(os.getenv("LIVENESS_FLUSH_SECONDS", "30"))
+
+DEFAULT_DEVICE_TIMEOUT_MINUTES = 5
+
+
+def _utc(ts: datetime) -> datetime:
+    return ts.replace(tzinfo=timezone.utc) if ts.tzinfo is None else ts
+
+
+class DeviceLivenessTracker:
+    def __init__(self, flush_seconds: float):
+        self.flush_seconds = flush_seconds
+        self._lock = threading.Lock()
+        self._timeout = timedelta(minutes=DEFAULT_DEVICE_TIMEOUT_MINUTES)
+        self._last_seen = {}       # device_id -> datetime of latest heartbeat
+        self._heap = []            # (deadline, device_id), at most one entry per device
+        self._scheduled = set()    # device ids with an entry in _heap
+        self._offline = set()
+        self._came_online = set()  # back-online events not yet handled by the task
+        self._dirty = {}           # device_id -> last_seen not yet written to the DB
+
+        self._loop = None
+        self._wake = asyncio.Event()
+        self._task = None
+
+        self.offline_total = 0
+        self.online_total = 0
+        self.flushed_total = 0
+        self.last_flush_ms = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def load(self, db: Session):
+        """Seed from the devices table; call once before start()."""
+        config = db.query(models.SystemConfig).first()
+        minutes = config.device_timeout if config and config.device_timeout else DEFAULT_DEVICE_TIMEOUT_MINUTES
+        rows = db.query(models.Device.device_id, models.Device.last_seen, models.Device.offline_notified).filter(
+            models.Device.is_demo == False,
+            models.Device.last_seen != None,
+        ).all()
+        with self._lock:
+            self._timeout = timedelta(minutes=minutes)
+            for device_id, last_seen, offline_notified in rows:
+                ts = _utc(last_seen)
+                if self._last_seen.get(device_id, ts) > ts:
+                    continue  # heartbeat arrived while loading
+                self._last_seen[device_id] = ts
+                if offline_notified:
+                    self._offline.add(device_id)
+            self._reschedule()
+
+    def _reschedule(self):
+        self._heap = [(ts + self._timeout, device_id) for device_id, ts in self._last_seen.items()
+                      if device_id not in self._offline]
+        heapq.heapify(self._heap)
+        self._scheduled = {device_id for _, device_id in self._heap}
+
+    def set_timeout(self, minutes: int):
+        """Apply a new device_timeout to every tracked device."""
+        with self._lock:
+            self._timeout = timedelta(minutes=minutes)
+            self._reschedule()
+        self.wake()
+
+    def touch(self, device_id: str, now: datetime = None):
+        """Record a heartbeat."""
+        now = now or datetime.now(timezone.utc)
+        came_online = False
+        with self._lock:
+            self._last_seen[device_id] = now
+            self._dirty[device_id] = now
+            if device_id not in self._scheduled:
+                heapq.heappush(self._heap, (now + self._timeout, device_id))
+                self._scheduled.add(device_id)
+            if device_id in self._offline:
+                self._offline.discard(device_id)
+                self._came_online.add(device_id)
+                came_online = True
+        if came_online:
+            self.wake()
+
+    def last_seen(self, device_id: str):
+        return self._last_seen.get(device_id)
+
+    def forget(self, device_id: str):
+        with self._lock:
+            self._last_seen.pop(device_id, None)
+            self._dirty.pop(device_id, None)
+            self._offline.discard(device_id)
+            self._came_online.discard(device_id)
+            # Its heap entry is dropped when popped
+
+    def _expire(self, now: datetime) -> list:
+        """Pop due deadlines; return device ids that just went offline."""
+        went_offline = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                _, device_id = heapq.heappop(self._heap)
+                self._scheduled.discard(device_id)
+                ts = self._last_seen.get(device_id)
+                if ts is None or device_id in self._offline:
+                    continue
+                deadline = ts + self._timeout
+                if deadline > now:
+                    heapq.heappush(self._heap, (deadline, device_id))
+                    self._scheduled.add(device_id)
+                else:
+                    self._offline.add(device_id)
+                    went_offline.append(device_id)
+        return went_offline
+
+    def _next_deadline(self):
+        with self._lock:
+            return self._heap[0][0] if self._heap else None
+
+    async def start(self):
+        if self.running:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._task = asyncio.create_task(self._run())
+        logger.info("Device liveness tracker started")
+
+    async def stop(self):
+        """Stop the task and write out pending last_seen values."""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        self._loop = None
+        await asyncio.to_thread(self.flush)
+
+    def wake(self):
+        """Ask the task to handle events now. Safe to call from any thread."""
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            self._wake.set()
+        else:
+            loop.call_soon_threadsafe(self._wake.set)
+
+    async def _run(self):
+        next_flush = time.monotonic() + self.flush_seconds
+        while True:
+            self._wake.clear()
+            went_offline = self._expire(datetime.now(timezone.utc))
+            with self._lock:
+                came_online, self._came_online = self._came_online, set()
+            if went_offline or came_online:
+                try:
+                    await asyncio.to_thread(self._notify, went_offline, came_online)
+                except Exception as e:
+                    logger.error(f"Failed to handle device liveness events: {e}")
+
+            if time.monotonic() >= next_flush:
+                try:
+                    await asyncio.to_thread(self.flush)
+                except Exception as e:
+                    logger.error(f"Failed to flush device last_seen: {e}")
+                next_flush = time.monotonic() + self.flush_seconds
+
+            delay = next_flush - time.monotonic()
+            deadline = self._next_deadline()
+            if deadline is not None:
+                delay = min(delay, (deadline - datetime.now(timezone.utc)).total_seconds())
+            if delay <= 0:
+                continue
+            try:
+                await asyncio.wait_for(self._wake.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+
+    def _notify(self, went_offline: list, came_online: set):
+        self.offline_total += len(went_offline)
+        self.online_total += len(came_online)
+        db = SessionLocal()
+        try:
+            config = db.query(models.SystemConfig).first()
+            enabled = config is not None and config.ntfy_enabled and config.ntfy_topic
+            queued = False
+            if went_offline:
+                logger.info(f"Devices offline: {', '.join(went_offline)}")
+                if enabled:
+                    devices = db.query(models.Device).filter(
+                        models.Device.device_id.in_(went_offline),
+                        models.Device.offline_notified == False,
+                    ).all()
+                    for device in devices:
+                        queue_device_offline_notification(db, config.ntfy_server_url, config.ntfy_topic, device.name, device.device_id)
+                        device.offline_notified = True
+                        queued = True
+            if came_online:
+                logger.info(f"Devices back online: {', '.join(came_online)}")
+                devices = db.query(models.Device).filter(
+                    models.Device.device_id.in_(came_online),
+                    models.Device.offline_notified == True,
+                ).all()
+                for device in devices:
+                    device.offline_notified = False
+                    if enabled:
+                        queue_device_online_notification(db, config.ntfy_server_url, config.ntfy_topic, device.name, device.device_id)
+                        queued = True
+            db.commit()
+            if queued:
+                notification_dispatcher.wake()
+        finally:
+            db.close()
+
+    def flush(self):
+        """Write coalesced last_seen values in one executemany."""
+        with self._lock:
+            dirty, self._dirty = self._dirty, {}
+        if not dirty:
+            return
+        started = time.perf_counter()
+        table = models.Device.__table__
+        stmt = table.update().where(table.c.device_id == bindparam("_device_id")).values(last_seen=bindparam("_last_seen"))
+        db = SessionLocal()
+        try:
+            db.execute(stmt, [{"_device_id": k, "_last_seen": v} for k, v in dirty.items()])
+            db.commit()
+        except Exception:
+            db.rollback()
+            with self._lock:
+                for device_id, ts in dirty.items():
+                    if device_id in self._last_seen:
+                        self._dirty.setdefault(device_id, ts)
+            raise
+        finally:
+            db.close()
+        self.flushed_total += len(dirty)
+        self.last_flush_ms = round((time.perf_counter() - started) * 1000.0, 2)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "running": self.running,
+                "tracked": len(self._last_seen),
+                "offline": len(self._offline),
+                "pending_flush": len(self._dirty),
+                "timeout_seconds": int(self._timeout.total_seconds()),
+                "offline_total": self.offline_total,
+                "online_total": self.online_total,
+                "flushed_total": self.flushed_total,
+                "last_flush_ms": self.last_flush_ms,
+            }
+
+
+device_liveness = DeviceLivenessTracker(LIVENESS_FLUSH_SECONDS)
@@ -0,0 +1,75 @@
+"""Sequence-number dedupe for readings retried by the firmware.
+
+Every upload carries the firmware's random boot_id and a per-boot frame
+counter seq; all readings of one frame share the seq, and a retried POST
+resends the same frame. The tracker keeps the highest committed seq per
+(device_id, boot_id), so a reading above that high-water mark is known to be
+new without touching the DB. Only readings at or below it (retries, or a
+replayed backlog) cost an indexed lookup on the ux_readings_device_seq
+unique index, which also guards each reading partition itself.
+
+The high-water mark for a boot is loaded with one MAX(seq) query the first
+time the process sees it. Like the sensor cache, this is per process and
+relies on the single uvicorn worker.
+"""
+
+import threading
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+import reading_partitions
+
+
+class SequenceTracker:
+    def __init__(self):
+        self._high_water = {}  # (device_id, boot_id) -> highest committed seq, or -1
+        self._lock = threading.Lock()
+        self.duplicates_total = 0
+
+    def _high_water_mark(self, db: Session, device_id: str, boot_id: int) -> int:
+        key = (device_id, boot_id)
+        mark = self._high_water.get(key)
+        if mark is None:
+            marks = [
+                db.execute(select(func.max(t.c.seq)).where(t.c.device_id == device_id, t.c.boot_id == boot_id)).scalar()
+                for t in reading_partitions.tables(db)
+            ]
+            mark = max((m for m in marks if m is not None), default=-1)
+            with self._lock:
+                self._high_water.setdefault(key, mark)
+        return mark
+
+    def find_existing(self, db: Session, device_id: str, boot_id: int, seq: int, sensor_db_id: int):
+        """Return the already-stored reading for this key, or None if the reading is new."""
+        if seq > self._high_water_mark(db, device_id, boot_id):
+            return None
+        return self.stored_reading(db, device_id, boot_id, seq, sensor_db_id)
+
+    def stored_reading(self, db: Session, device_id: str, boot_id: int, seq: int, sensor_db_id: int):
+        """Look the reading up on the unique index, whatever the high-water mark says."""
+        return reading_partitions.first_reading(db, lambda t: (
+            t.c.device_id == device_id,
+            t.c.boot_id == boot_id,
+            t.c.seq == seq,
+            t.c.sensor_id == sensor_db_id,
+        ))
+
+    def advance(self, marks: dict):
+        """Raise high-water marks after a commit; marks maps (device_id, boot_id) -> seq."""
+        with self._lock:
+            for key, seq in marks.items():
+                if seq > self._high_water.get(key, -1):
+                    self._high_water[key] = seq
+
+    def count_duplicates(self, n: int):
+        with self._lock:
+            self.duplicates_total += n
+
+    def forget_device(self, device_id: str):
+        with self._lock:
+            for key in [k for k in self._high_water if k[0] == device_id]:
+                del self._high_water[key]
+
+
+sequence_tracker = SequenceTracker()
@@ -0,0 +1,205 @@
+"""Write-behind ingest queue with group commit.
+
+With INGEST_MODE=queue, POST /readings and /readings/batch only validate and
+enqueue; a single writer task drains the queue and commits readings in groups
+of up to INGEST_BATCH_SIZE, or whatever arrived within INGEST_FLUSH_MS of the
+first pending reading. The queue is bounded by INGEST_QUEUE_SIZE readings:
+producers wait up to INGEST_ENQUEUE_TIMEOUT seconds for room, then the request
+is rejected so devices back off and retry.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+
+import crud
+from database import SessionLocal
+from services.ingest_dedupe import sequence_tracker
+
+logger = logging.getLogger(__name__)
+
+INGEST_MODE = os.getenv("INGEST_MODE", "sync")  # "sync" or "queue"
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "200"))
+INGEST_FLUSH_MS = int(os.getenv("INGEST_FLUSH_MS", "250"))
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "10000"))
+INGEST_ENQUEUE_TIMEOUT = float(os.getenv("INGEST_ENQUEUE_TIMEOUT", "2.0"))
+
+
+class IngestQueueFull(Exception):
+    pass
+
+
+class IngestQueueStopped(IngestQueueFull):
+    """The writer task isn't running, so nothing put now would be committed."""
+
+
+class IngestQueue:
+    def __init__(self, batch_size: int, flush_ms: int, max_depth: int, enqueue_timeout: float):
+        self.batch_size = batch_size
+        self.flush_ms = flush_ms
+        self.max_depth = max_depth
+        self.enqueue_timeout = enqueue_timeout
+
+        self._pending = deque()
+        self._depth = 0  # pending + in-flight readings
+        self._ready = asyncio.Event()
+        self._full = asyncio.Event()
+        self._space = asyncio.Event()
+        self._task = None
+        self._stopping = False
+
+        self.accepted_total = 0
+        self.flushed_total = 0
+        self.dropped_total = 0
+        self.rejected_total = 0
+        self.batches_total = 0
+        self.failed_batches_total = 0
+        self.last_batch_size = 0
+        self.last_flush_ms = None
+        self.max_flush_ms = None
+        self._flush_ms_total = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self):
+        if self.running:
+            return
+        self._stopping = False
+        self._task = asyncio.create_task(self._run())
+        self._task.add_done_callback(self._writer_done)
+        logger.info(f"Ingest queue started (batch={self.batch_size}, flush={self.flush_ms}ms, max={self.max_depth})")
+
+    async def stop(self):
+        """Stop accepting readings and flush everything still queued."""
+        if not self.running:
+            return
+        self._stopping = True
+        self._ready.set()
+        self._full.set()
+        await self._task
+        self._task = None
+        logger.info(f"Ingest queue stopped, {self.flushed_total} readings flushed in total")
+
+    def _writer_done(self, task: asyncio.Task):
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("Ingest queue writer stopped", exc_info=task.exception())
+
+    async def put(self, readings: list):
+        """Enqueue readings, waiting for room up to enqueue_timeout seconds."""
+        if self._stopping or not self.running:
+            raise IngestQueueStopped("Ingest queue is not running")
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.enqueue_timeout
+        while self._depth + len(readings) > self.max_depth:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                self.rejected_total += len(readings)
+                raise IngestQueueFull(f"Ingest queue full ({self._depth}/{self.max_depth})")
+            self._space.clear()
+            try:
+                await asyncio.wait_for(self._space.wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
+
+        self._pending.extend(readings)
+        self._depth += len(readings)
+        self.accepted_total += len(readings)
+        self._ready.set()
+        if len(self._pending) >= self.batch_size:
+            self._full.set()
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            if not self._pending:
+                if self._stopping:
+                    return
+                self._ready.clear()
+                await self._ready.wait()
+                continue
+
+            # Group commit: wait for a full batch or the flush deadline
+            deadline = loop.time() + self.flush_ms / 1000.0
+            while len(self._pending) < self.batch_size and not self._stopping:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                self._full.clear()
+                try:
+                    await asyncio.wait_for(self._full.wait(), remaining)
+                except asyncio.TimeoutError:
+                    break
+
+            batch = [self._pending.popleft() for _ in range(min(self.batch_size, len(self._pending)))]
+
+            started = time.perf_counter()
+            try:
+                flushed = await asyncio.to_thread(self._flush, batch)
+            except Exception as e:
+                # The batch was already acknowledged; count it as dropped and
+                # keep the writer alive rather than rejecting every later put
+                logger.exception(f"Dropping batch of {len(batch)} queued readings: {e}")
+                flushed = 0
+                self.failed_batches_total += 1
+            elapsed_ms = (time.perf_counter() - started) * 1000.0
+
+            self._depth -= len(batch)
+            self._space.set()
+            self.flushed_total += flushed
+            self.dropped_total += len(batch) - flushed
+            self.batches_total += 1
+            self.last_batch_size = len(batch)
+            self.last_flush_ms = round(elapsed_ms, 2)
+            self.max_flush_ms = max(self.max_flush_ms or 0.0, self.last_flush_ms)
+            self._flush_ms_total += elapsed_ms
+
+    def _flush(self, batch: list) -> int:
+        db = SessionLocal()
+        try:
+            try:
+                return len(crud.create_readings(db, batch))
+            except Exception as e:
+                # One bad reading (e.g. its device was deleted after it was
+                # accepted) must not sink the whole group; retry one by one.
+                db.rollback()
+                logger.warning(f"Group commit of {len(batch)} readings failed ({e}), retrying individually")
+            flushed = 0
+            for reading in batch:
+                try:
+                    crud.create_reading(db, reading)
+                    flushed += 1
+                except Exception as e:
+                    db.rollback()
+                    logger.error(f"Dropping queued reading {reading}: {e}")
+            return flushed
+        finally:
+            db.close()
+
+    def stats(self) -> dict:
+        return {
+            "mode": INGEST_MODE,
+            "running": self.running,
+            "depth": self._depth,
+            "pending": len(self._pending),
+            "capacity": self.max_depth,
+            "batch_size": self.batch_size,
+            "flush_interval_ms": self.flush_ms,
+            "accepted_total": self.accepted_total,
+            "flushed_total": self.flushed_total,
+            "dropped_total": self.dropped_total,
+            "rejected_total": self.rejected_total,
+            "duplicates_total": sequence_tracker.duplicates_total,
+            "batches_total": self.batches_total,
+            "failed_batches_total": self.failed_batches_total,
+            "last_batch_size": self.last_batch_size,
+            "last_flush_ms": self.last_flush_ms,
+            "avg_flush_ms": round(self._flush_ms_total / self.batches_total, 2) if self.batches_total else None,
+            "max_flush_ms": self.max_flush_ms,
+        }
+
+
+ingest_queue = IngestQueue(INGEST_BATCH_SIZE, INGEST_FLUSH_MS, INGEST_QUEUE_SIZE, INGEST_ENQUEUE_TIMEOUT)
@@ -0,0 +1,306 @@
+"""Background delivery of ntfy notifications from the notification_outbox table.
+
+Alerts and offline warnings only insert an outbox row in the caller's
+transaction, so request latency never depends on the ntfy server. A single
+dispatcher task picks up due rows, posts them through one pooled
+httpx.AsyncClient and deletes them once delivered. Failures are retried with
+exponential backoff (NOTIFY_BACKOFF_SECONDS doubling up to
+NOTIFY_BACKOFF_MAX_SECONDS); after NOTIFY_MAX_ATTEMPTS, or on a 4xx other than
+429, the row is marked failed and kept for inspection. Each (server, topic) is
+rate limited by a token bucket of NOTIFY_TOPIC_BURST messages refilled one
+every NOTIFY_TOPIC_INTERVAL seconds, which keeps an alert storm inside ntfy's
+per-visitor limits. Undelivered rows survive restarts. httpx is imported
+and the client created on the first delivery, which keeps both off startup.
+"""
+
+import asyncio
+import logging
+import os
+import random
+import time
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+import models
+from database import SessionLocal
+from services.notifications import build_payload
+
+logger = logging.getLogger(__name__)
+
+NOTIFY_POLL_SECONDS = float(os.getenv("NOTIFY_POLL_SECONDS", "30"))
+NOTIFY_TIMEOUT = float(os.getenv("NOTIFY_TIMEOUT", "10"))
+NOTIFY_MAX_ATTEMPTS = int(os.getenv("NOTIFY_MAX_ATTEMPTS", "8"))
+NOTIFY_BACKOFF_SECONDS = float(os.getenv("NOTIFY_BACKOFF_SECONDS", "5"))
+NOTIFY_BACKOFF_MAX_SECONDS = float(os.getenv("NOTIFY_BACKOFF_MAX_SECONDS", "900"))
+NOTIFY_TOPIC_BURST = int(os.getenv("NOTIFY_TOPIC_BURST", "5"))
+NOTIFY_TOPIC_INTERVAL = float(os.getenv("NOTIFY_TOPIC_INTERVAL", "5"))
+
+DISPATCH_BATCH_SIZE = 50
+
+
+class TopicRateLimiter:
+    """Token bucket per (server_url, topic)."""
+
+    def __init__(self, burst: int, interval: float):
+        self.burst = burst
+        self.interval = interval
+        self._buckets = {}  # key -> (tokens, last refill monotonic time)
+
+    def acquire(self, key, now: float = None) -> float:
+        """Take a token; return 0 if allowed, else seconds until one is available."""
+        now = time.monotonic() if now is None else now
+        tokens, last = self._buckets.get(key, (float(self.burst), now))
+        tokens = min(float(self.burst), tokens + (now - last) / self.interval)
+        if tokens >= 1.0:
+            self._buckets[key] = (tokens - 1.0, now)
+            return 0.0
+        self._buckets[key] = (tokens, now)
+        return (1.0 - tokens) * self.interval
+
+    def drain(self, key, now: float = None):
+        """Empty the bucket, e.g. after the server answered 429."""
+        self._buckets[key] = (0.0, time.monotonic() if now is None else now)
+
+
+class NotificationDispatcher:
+    def __init__(self, poll_seconds: float, timeout: float, max_attempts: int,
+                 backoff_seconds: float, backoff_max_seconds: float, limiter: TopicRateLimiter):
+        self.poll_seconds = poll_seconds
+        self.timeout = timeout
+        self.max_attempts = max_attempts
+        self.backoff_seconds = backoff_seconds
+        self.backoff_max_seconds = backoff_max_seconds
+        self.limiter = limiter
+
+        self._client = None
+        self._loop = None
+        self._wake = asyncio.Event()
+        self._task = None
+
+        self.sent_total = 0
+        self.retried_total = 0
+        self.failed_total = 0
+        self.deferred_total = 0
+        self.last_send_ms = None
+        self.last_error = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def _get_client(self) -> "httpx.AsyncClient":
+        if self._client is None:
+            import httpx
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=10, max_keepalive_connections=5),
+            )
+        return self._client
+
+    async def start(self):
+        if self.running:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._task = asyncio.create_task(self._run())
+        logger.info("Notification dispatcher started")
+
+    async def stop(self):
+        """Stop delivering; anything still in the outbox is sent after the next start."""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+        self._loop = None
+
+    def wake(self):
+        """Ask the dispatcher to look at the outbox now. Safe to call from any thread."""
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            self._wake.set()
+        else:
+            loop.call_soon_threadsafe(self._wake.set)
+
+    async def send_now(self, server_url: str, topic: str, title: str, message: str, priority: str = "default", tags: list[str] | None = None) -> bool:
+        """Deliver one message immediately, bypassing the outbox (used by the test endpoint)."""
+        ok, error, _ = await self._post(server_url, build_payload(topic, title, message, priority, tags))
+        if not ok:
+            logger.error(f"Failed to send ntfy notification: {error}")
+        return ok
+
+    async def _run(self):
+        while True:
+            self._wake.clear()
+            try:
+                delay = await self._dispatch_due()
+            except Exception as e:
+                logger.error(f"Notification dispatch failed: {e}")
+                delay = self.poll_seconds
+            if delay <= 0:
+                continue
+            try:
+                await asyncio.wait_for(self._wake.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _dispatch_due(self) -> float:
+        """Send every due outbox row; return how long to sleep before looking again."""
+        rows, next_due = await asyncio.to_thread(self._load_due, DISPATCH_BATCH_SIZE)
+        delays = [self.poll_seconds]
+        deferred = []
+        for row in rows:
+            key = (row["server_url"], row["topic"])
+            wait = self.limiter.acquire(key)
+            if wait > 0:
+                deferred.append((row, "deferred", wait, None))
+                delays.append(wait)
+                continue
+            payload = build_payload(row["topic"], row["title"], row["message"], row["priority"], row["tags"])
+            ok, error, retryable = await self._post(row["server_url"], payload)
+            if ok:
+                result = (row, "sent", None, None)
+            else:
+                if error and error.startswith("HTTP 429"):
+                    self.limiter.drain(key)
+                result = (row, "retry" if retryable else "failed", None, error)
+            # Record each delivery right away so a restart doesn't resend it
+            retry_in = await asyncio.to_thread(self._record, [result])
+            if retry_in is not None:
+                delays.append(retry_in)
+
+        if deferred:
+            await asyncio.to_thread(self._record, deferred)
+        if len(rows) == DISPATCH_BATCH_SIZE:
+            return 0
+        if next_due is not None:
+            delays.append(max(0.0, (next_due - datetime.now(timezone.utc)).total_seconds()))
+        return min(delays)
+
+    async def _post(self, server_url: str, payload: dict):
+        """Return (ok, error, retryable)."""
+        import httpx
+        started = time.perf_counter()
+        try:
+            resp = await self._get_client().post(server_url.rstrip("/"), json=payload)
+        except httpx.HTTPError as e:
+            return False, f"{type(e).__name__}: {e}", True
+        finally:
+            self.last_send_ms = round((time.perf_counter() - started) * 1000.0, 2)
+        if resp.status_code < 400:
+            return True, None, False
+        error = f"HTTP {resp.status_code}: {resp.text[:200]}"
+        return False, error, resp.status_code == 429 or resp.status_code >= 500
+
+    def _load_due(self, limit: int):
+        db = SessionLocal()
+        try:
+            now = datetime.now(timezone.utc)
+            rows = (db.query(models.NotificationOutbox)
+                    .filter(models.NotificationOutbox.status == models.NotificationStatus.pending,
+                            models.NotificationOutbox.next_attempt_at <= now)
+                    .order_by(models.NotificationOutbox.next_attempt_at, models.NotificationOutbox.id)
+                    .limit(limit)
+                    .all())
+            next_due = None
+            if len(rows) < limit:
+                next_due = db.query(func.min(models.NotificationOutbox.next_attempt_at)).filter(
+                    models.NotificationOutbox.status == models.NotificationStatus.pending,
+                    models.NotificationOutbox.next_attempt_at > now,
+                ).scalar()
+                if next_due is not None and next_due.tzinfo is None:
+                    next_due = next_due.replace(tzinfo=timezone.utc)
+            return [
+                {
+                    "id": r.id,
+                    "server_url": r.server_url,
+                    "topic": r.topic,
+                    "title": r.title,
+                    "message": r.message,
+                    "priority": r.priority,
+                    "tags": r.tags,
+                    "attempts": r.attempts or 0,
+                }
+                for r in rows
+            ], next_due
+        finally:
+            db.close()
+
+    def _backoff(self, attempts: int) -> float:
+        delay = min(self.backoff_max_seconds, self.backoff_seconds * (2 ** (attempts - 1)))
+        return delay * random.uniform(0.8, 1.2)
+
+    def _record(self, results: list):
+        """Apply delivery outcomes; return seconds until the earliest retry, if any."""
+        db = SessionLocal()
+        retry_in = None
+        try:
+            now = datetime.now(timezone.utc)
+            sent_ids = []
+            for row, outcome, wait, error in results:
+                if outcome == "sent":
+                    sent_ids.append(row["id"])
+                    continue
+                entry = db.get(models.NotificationOutbox, row["id"])
+                if entry is None:
+                    continue
+                if outcome == "deferred":
+                    entry.next_attempt_at = now + timedelta(seconds=wait)
+                    self.deferred_total += 1
+                    continue
+                entry.attempts = row["attempts"] + 1
+                entry.last_error = error
+                self.last_error = error
+                if outcome == "failed" or entry.attempts >= self.max_attempts:
+                    entry.status = models.NotificationStatus.failed
+                    self.failed_total += 1
+                    logger.error(f"Giving up on notification {row['id']} after {entry.attempts} attempts: {error}")
+                else:
+                    delay = self._backoff(entry.attempts)
+                    entry.next_attempt_at = now + timedelta(seconds=delay)
+                    retry_in = delay if retry_in is None else min(retry_in, delay)
+                    self.retried_total += 1
+                    logger.warning(f"Notification {row['id']} failed ({error}), retry {entry.attempts}/{self.max_attempts - 1}")
+            if sent_ids:
+                db.query(models.NotificationOutbox).filter(
+                    models.NotificationOutbox.id.in_(sent_ids)
+                ).delete(synchronize_session=False)
+                self.sent_total += len(sent_ids)
+            db.commit()
+            return retry_in
+        finally:
+            db.close()
+
+    def stats(self, db: Session) -> dict:
+        counts = dict(db.query(models.NotificationOutbox.status, func.count(models.NotificationOutbox.id))
+                      .group_by(models.NotificationOutbox.status).all())
+        return {
+            "running": self.running,
+            "pending": counts.get(models.NotificationStatus.pending, 0),
+            "failed": counts.get(models.NotificationStatus.failed, 0),
+            "sent_total": self.sent_total,
+            "retried_total": self.retried_total,
+            "failed_total": self.failed_total,
+            "deferred_total": self.deferred_total,
+            "last_send_ms": self.last_send_ms,
+            "last_error": self.last_error,
+        }
+
+
+notification_dispatcher = NotificationDispatcher(
+    NOTIFY_POLL_SECONDS,
+    NOTIFY_TIMEOUT,
+    NOTIFY_MAX_ATTEMPTS,
+    NOTIFY_BACKOFF_SECONDS,
+    NOTIFY_BACKOFF_MAX_SECONDS,
+    TopicRateLimiter(NOTIFY_TOPIC_BURST, NOTIFY_TOPIC_INTERVAL),
+)
@@ -1,29 +1,46 @@
+"""ntfy notification messages.
+
+Nothing here talks to the ntfy server: messages are added to the
+notification_outbox table in the caller's transaction and delivered by the
+background notification dispatcher (services/notification_dispatcher.py).
+"""
+
 import logging
-import httpx
+
+from sqlalchemy.orm import Session
+
+import models
 
 logger = logging.getLogger(__name__)
 
 
-def send_notification(server_url: str, topic: str, title: str, message: str, priority: str = "default", tags: list[str] | None = None) -> bool:
-    try:
-        with httpx.Client(timeout=10.0) as client:
-            payload = {
-                "topic": topic,
-                "title": title,
-                "message": message,
-                "priority": priority,
-            }
-            if tags:
-                payload["tags"] = tags
-            resp = client.post(f"{server_url.rstrip('/')}", json=payload)
-            resp.raise_for_status()
-            return True
-    except Exception as e:
-        logger.error(f"Failed to send ntfy notification: {e}")
-        return False
-
-
-def send_alert_notification(server_url: str, topic: str, alert_message: str, sensor_name: str | None, device_name: str | None) -> bool:
+def queue_notification(db: Session, server_url: str, topic: str, title: str, message: str, priority: str = "default", tags: list[str] | None = None) -> models.NotificationOutbox:
+    """Add a message to the outbox; it is sent once the caller commits."""
+    entry = models.NotificationOutbox(
+        server_url=server_url,
+        topic=topic,
+        title=title,
+        message=message,
+        priority=priority,
+        tags=tags or None,
+    )
+    db.add(entry)
+    return entry
+
+
+def build_payload(topic: str, title: str, message: str, priority: str = "default", tags: list[str] | None = None) -> dict:
+    payload = {
+        "topic": topic,
+        "title": title,
+        "message": message,
+        "priority": priority,
+    }
+    if tags:
+        payload["tags"] = tags
+    return payload
+
+
+def queue_alert_notification(db: Session, server_url: str, topic: str, alert_message: str, sensor_name: str | None, device_name: str | None) -> models.NotificationOutbox:
     sensor_label = sensor_name or "Unknown sensor"
     device_label = device_name or "Unknown device"
     title = f"{sensor_label} ({device_label})"
@@ -36,10 +53,16 @@ def send_alert_notification(server_url: str, topic: str, alert_message: str, sen
     elif "above maximum" in alert_message.lower():
         tags.append("droplet")
 
-    return send_notification(server_url, topic, title, alert_message, priority=priority, tags=tags)
+    return queue_notification(db, server_url, topic, title, alert_message, priority=priority, tags=tags)
 
 
-def send_device_offline_notification(server_url: str, topic: str, device_name: str, device_id: str) -> bool:
+def queue_device_offline_notification(db: Session, server_url: str, topic: str, device_name: str, device_id: str) -> models.NotificationOutbox:
     title = f"{device_name} went offline"
     message = f"Device '{device_name}' (ID: {device_id}) has not sent a heartbeat within the expected timeout. Check power and WiFi connectivity."
-    return send_notification(server_url, topic, title, message, priority="high", tags=["warning", "electric_plug"])
+    return queue_notification(db, server_url, topic, title, message, priority="high", tags=["warning", "electric_plug"])
+
+
+def queue_device_online_notification(db: Session, server_url: str, topic: str, device_name: str, device_id: str) -> models.NotificationOutbox:
+    title = f"{device_name} is back online"
+    message = f"Device '{device_name}' (ID: {device_id}) is sending heartbeats again."
+    return queue_notification(db, server_url, topic, title, message, tags=["white_check_mark", "electric_plug"])
@@ -0,0 +1,115 @@
+"""Process-wide cache of device/sensor identity for the ingest path.
+
+Readings arrive keyed by (device_id, sensor_id) and need the sensor's DB id,
+calibration, threshold and auto_log_watering flag. Those almost never change,
+so they are resolved once and kept in memory; crud invalidates entries when a
+sensor, its calibration or threshold, or its device is modified.
+
+The cache is per process. The backend runs a single uvicorn worker, so every
+write that could make an entry stale goes through this process. Every
+invalidation bumps a generation counter; an entry loaded while one ran is
+returned but not cached, so a load that raced an update can't outlive it.
+"""
+
+import threading
+from dataclasses import dataclass
+from typing import Optional
+
+from sqlalchemy.orm import Session, joinedload
+
+import models
+
+
+@dataclass(frozen=True)
+class CachedSensor:
+    id: int
+    device_id: str
+    sensor_id: int
+    calibration_dry: Optional[float]
+    calibration_wet: Optional[float]
+    min_moisture: Optional[float]
+    max_moisture: Optional[float]
+    auto_log_watering: bool
+    is_demo: bool
+
+    @classmethod
+    def from_model(cls, sensor: models.Sensor) -> "CachedSensor":
+        threshold = sensor.threshold
+        return cls(
+            id=sensor.id,
+            device_id=sensor.device_id,
+            sensor_id=sensor.sensor_id,
+            calibration_dry=sensor.calibration_dry,
+            calibration_wet=sensor.calibration_wet,
+            min_moisture=threshold.min_moisture if threshold else None,
+            max_moisture=threshold.max_moisture if threshold else None,
+            auto_log_watering=bool(sensor.auto_log_watering),
+            is_demo=bool(sensor.is_demo),
+        )
+
+
+class SensorCache:
+    def __init__(self):
+        self._sensors = {}  # (device_id, sensor_id) -> CachedSensor
+        self._devices = set()
+        self._lock = threading.Lock()
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def has_device(self, db: Session, device_id: str) -> bool:
+        if device_id in self._devices:
+            return True
+        exists = db.query(models.Device.id).filter(models.Device.device_id == device_id).first() is not None
+        if exists:
+            with self._lock:
+                self._devices.add(device_id)
+        return exists
+
+    def resolve(self, db: Session, device_id: str, sensor_id: int) -> Optional[CachedSensor]:
+        """Return the cached sensor, loading it from the DB on a miss."""
+        key = (device_id, sensor_id)
+        entry = self._sensors.get(key)
+        if entry is not None:
+            self.hits += 1
+            return entry
+        self.misses += 1
+        generation = self._generation
+        sensor = db.query(models.Sensor).options(
+            joinedload(models.Sensor.threshold)
+        ).filter(models.Sensor.device_id == device_id, models.Sensor.sensor_id == sensor_id).first()
+        if sensor is None:
+            return None
+        return self.put(sensor, generation)
+
+    def put(self, sensor: models.Sensor, generation: int = None) -> CachedSensor:
+        """Cache the sensor; with generation, only if nothing was invalidated since it was read."""
+        entry = CachedSensor.from_model(sensor)
+        with self._lock:
+            if generation is None or generation == self._generation:
+                self._sensors[(entry.device_id, entry.sensor_id)] = entry
+                self._devices.add(entry.device_id)
+        return entry
+
+    def invalidate_sensor(self, sensor_db_id: int):
+        with self._lock:
+            self._generation += 1
+            for key, entry in list(self._sensors.items()):
+                if entry.id == sensor_db_id:
+                    del self._sensors[key]
+
+    def invalidate_device(self, device_id: str):
+        with self._lock:
+            self._generation += 1
+            self._devices.discard(device_id)
+            for key in [k for k in self._sensors if k[0] == device_id]:
+                del self._sensors[key]
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._sensors.clear()
+            self._devices.clear()
+
+
+sensor_cache = SensorCache()
@@ -0,0 +1,58 @@
+"""Startup timing report.
+
+main.py marks each step of a cold start (imports, schema, startup hooks)
+as it finishes, and the report logs one line once the app is ready to
+serve. Maintenance that used to run before /ping answered (retention,
+sensor state backfill, demo cleanup) now runs as deferred background jobs
+right after startup; each one is added to the report when it finishes.
+GET /admin/startup returns the report.
+
+The clock starts when this module is imported, which main.py does before
+anything else, so "ready" covers the app's own imports but not the
+interpreter and uvicorn start-up before them.
+"""
+
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class StartupReport:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._started = time.perf_counter()
+        self._last = self._started
+        self.phases = []  # {"name", "ms", "detail"}, in order
+        self.deferred = []
+        self.ready_ms = None
+
+    def mark(self, name: str, detail: str = None):
+        """Record the step that ran since the previous mark."""
+        now = time.perf_counter()
+        with self._lock:
+            self.phases.append({"name": name, "ms": round((now - self._last) * 1000, 1), "detail": detail})
+            self._last = now
+
+    def ready(self):
+        self.mark("startup hooks")
+        self.ready_ms = round((self._last - self._started) * 1000, 1)
+        steps = ", ".join(f"{p['name']} {p['ms']:.0f} ms" for p in self.phases)
+        logger.info(f"Ready in {self.ready_ms:.0f} ms ({steps})")
+
+    def add_deferred(self, name: str, seconds: float, detail: str = None):
+        with self._lock:
+            self.deferred.append({"name": name, "ms": round(seconds * 1000, 1), "detail": detail})
+        logger.info(f"Deferred startup job {name} finished in {seconds * 1000:.0f} ms" + (f" ({detail})" if detail else ""))
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "ready_ms": self.ready_ms,
+                "phases": list(self.phases),
+                "deferred": list(self.deferred),
+            }
+
+
+startup_report = StartupReport()
@@ -0,0 +1,27 @@
+import os
+import sys
+import tempfile
+
+# The backend modules import each other by bare name and bind the database
+# URL at import time, so both are set up before any test module imports them.
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='plant-water-tests-'), 'test.db')}"
+
+import pytest
+
+import database
+
+
+@pytest.fixture(scope="session", autouse=True)
+def schema():
+    database.init_db()
+
+
+@pytest.fixture
+def db():
+    session = database.SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
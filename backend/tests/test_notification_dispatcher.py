@@ -0,0 +1,212 @@
+import asyncio
+import json
+import socket
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import crud
+import models
+import schemas
+from services.notification_dispatcher import NotificationDispatcher, TopicRateLimiter, notification_dispatcher
+from services.notifications import queue_notification
+
+
+class StubNtfy:
+    """ntfy stand-in on localhost that answers from a script of (status, delay) pairs.
+
+    Once the script runs out every request gets the last entry.
+    """
+
+    def __init__(self, script):
+        self.script = list(script)
+        self.requests = []  # (monotonic time, JSON body)
+        self._lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                with stub._lock:
+                    stub.requests.append((time.monotonic(), body))
+                    status, delay = stub.script.pop(0) if len(stub.script) > 1 else stub.script[0]
+                time.sleep(delay)
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.end_headers()
+                self.wfile.write(b"{}")
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def _closed_port_url() -> str:
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return f"http://127.0.0.1:{port}"
+
+
+def _dispatcher(burst: int = 100, interval: float = 0.01) -> NotificationDispatcher:
+    return NotificationDispatcher(
+        poll_seconds=0.05,
+        timeout=5,
+        max_attempts=5,
+        backoff_seconds=0.2,
+        backoff_max_seconds=1,
+        limiter=TopicRateLimiter(burst, interval),
+    )
+
+
+def _outbox(db):
+    db.expire_all()
+    return db.query(models.NotificationOutbox).order_by(models.NotificationOutbox.id).all()
+
+
+async def _wait_for(condition, timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("condition not met in time")
+        await asyncio.sleep(0.02)
+
+
+@pytest.fixture(autouse=True)
+def empty_outbox(db):
+    db.query(models.NotificationOutbox).delete()
+    db.commit()
+    yield
+    db.query(models.NotificationOutbox).delete()
+    db.commit()
+
+
+def test_server_error_is_retried_with_backoff_then_delivered(db):
+    with StubNtfy([(500, 0), (200, 0)]) as stub:
+        queue_notification(db, stub.url, "plants", "Dry", "Sensor is dry")
+        db.commit()
+        dispatcher = _dispatcher()
+
+        async def run():
+            await dispatcher.start()
+            try:
+                await _wait_for(lambda: dispatcher.sent_total == 1)
+            finally:
+                await dispatcher.stop()
+
+        asyncio.run(run())
+
+    assert len(stub.requests) == 2
+    assert stub.requests[1][1]["message"] == "Sensor is dry"
+    # First backoff is backoff_seconds with +/-20% jitter
+    assert stub.requests[1][0] - stub.requests[0][0] >= 0.2 * 0.8
+    assert dispatcher.retried_total == 1
+    assert dispatcher.failed_total == 0
+    assert _outbox(db) == []
+
+
+def test_client_error_is_marked_failed_without_retry(db):
+    with StubNtfy([(400, 0)]) as stub:
+        queue_notification(db, stub.url, "plants", "Dry", "Sensor is dry")
+        db.commit()
+        dispatcher = _dispatcher()
+
+        async def run():
+            await dispatcher.start()
+            try:
+                await _wait_for(lambda: dispatcher.failed_total == 1)
+                # Give a mistaken retry time to happen
+                await asyncio.sleep(0.5)
+            finally:
+                await dispatcher.stop()
+
+        asyncio.run(run())
+
+    assert len(stub.requests) == 1
+    assert dispatcher.retried_total == 0
+    [entry] = _outbox(db)
+    assert entry.status == models.NotificationStatus.failed
+    assert entry.attempts == 1
+    assert entry.last_error.startswith("HTTP 400")
+
+
+def test_topic_rate_limit_defers_messages_past_the_burst(db):
+    with StubNtfy([(200, 0)]) as stub:
+        for i in range(5):
+            queue_notification(db, stub.url, "plants", "Dry", f"message {i}")
+        queue_notification(db, stub.url, "other", "Dry", "other topic")
+        db.commit()
+        dispatcher = _dispatcher(burst=2, interval=60)
+
+        async def run():
+            try:
+                await dispatcher._dispatch_due()
+            finally:
+                await dispatcher.stop()
+
+        asyncio.run(run())
+
+    sent = [(body["topic"], body["message"]) for _, body in stub.requests]
+    assert sent == [("plants", "message 0"), ("plants", "message 1"), ("other", "other topic")]
+    assert dispatcher.deferred_total == 3
+
+    pending = _outbox(db)
+    assert [entry.message for entry in pending] == ["message 2", "message 3", "message 4"]
+    soon = datetime.now(timezone.utc) + timedelta(seconds=30)
+    for entry in pending:
+        assert entry.status == models.NotificationStatus.pending
+        assert entry.next_attempt_at.replace(tzinfo=timezone.utc) > soon
+
+
+@pytest.mark.parametrize("server", ["slow", "unreachable"])
+def test_ingest_commits_without_waiting_on_ntfy(db, server):
+    device_id = f"ntfy-{server}"
+    crud.create_device(db, schemas.DeviceCreate(device_id=device_id, name=device_id))
+    sensor = crud.create_sensor(db, schemas.SensorCreate(device_id=device_id, sensor_id=1, name="basil"))
+    crud.set_threshold(db, sensor.id, schemas.ThresholdCreate(min_moisture=30, max_moisture=80))
+    reading = schemas.ReadingCreate(device_id=device_id, sensor_id=1, moisture=10)
+
+    with StubNtfy([(200, 3)]) as stub:
+        url = stub.url if server == "slow" else _closed_port_url()
+        crud.update_system_config(db, schemas.SystemConfigUpdate(ntfy_enabled=True, ntfy_server_url=url, ntfy_topic="plants"))
+
+        async def run():
+            await notification_dispatcher.start()
+            try:
+                started = time.perf_counter()
+                await asyncio.to_thread(crud.create_readings, db, [reading])
+                elapsed = time.perf_counter() - started
+                if server == "slow":
+                    # The dispatcher is now stuck on the slow POST
+                    await _wait_for(lambda: len(stub.requests) == 1)
+                    started = time.perf_counter()
+                    await asyncio.to_thread(crud.create_readings, db, [reading])
+                    elapsed = max(elapsed, time.perf_counter() - started)
+                return elapsed
+            finally:
+                await notification_dispatcher.stop()
+                crud.update_system_config(db, schemas.SystemConfigUpdate(ntfy_enabled=False))
+
+        elapsed = asyncio.run(run())
+
+    assert elapsed < 1.0
+    assert db.query(models.Alert).filter(models.Alert.sensor_id == sensor.id).count() == 1
+    [entry] = _outbox(db)
+    assert entry.server_url == url
+    assert entry.status == models.NotificationStatus.pending
@@ -0,0 +1,54 @@
+# apply_backup.py
+"""Rebuild a database file from a full backup and the incrementals after it.
+
+Backups come from GET /admin/backup: the full one is a gzipped database
+file (*.db.gz), each incremental (*.pwab.gz, from ?since=<X-Backup-Id>)
+holds the pages changed since the backup before it. Give them in the order
+they were taken; the incrementals' base ids are checked against each other.
+Afterwards the result is checked with PRAGMA integrity_check.
+
+    python utils/apply_backup.py restored.db full.db.gz [incremental.pwab.gz ...]
+"""
+
+import argparse
+import gzip
+import os
+import shutil
+import sqlite3
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.backup import apply_incremental  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("output", help="database file to write (must not exist)")
+    parser.add_argument("full", help="full backup, *.db.gz")
+    parser.add_argument("incrementals", nargs="*", help="incremental backups, *.pwab.gz, oldest first")
+    args = parser.parse_args()
+
+    if os.path.exists(args.output):
+        parser.error(f"{args.output} already exists")
+    with gzip.open(args.full, "rb") as src, open(args.output, "wb") as dest:
+        shutil.copyfileobj(src, dest, 1 << 20)
+    print(f"{args.full}: {os.path.getsize(args.output) / 1e6:.1f} MB")
+
+    backup_id = None
+    for path in args.incrementals:
+        backup_id = apply_incremental(args.output, path, expected_base=backup_id)
+        print(f"{path}: applied, now at backup {backup_id}")
+
+    conn = sqlite3.connect(args.output)
+    try:
+        result = conn.execute("PRAGMA integrity_check").fetchone()[0]
+    finally:
+        conn.close()
+    print(f"integrity_check: {result}")
+    if result != "ok":
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
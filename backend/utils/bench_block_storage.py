@@ -0,0 +1,166 @@
+# bench_block_storage.py
+"""Compare the monthly readings partitions against reading_blocks storage.
+
+Both stores get the same synthetic history: --sensors sensors reporting every
+--interval seconds for --days days, with millisecond timestamp jitter and
+moisture in tenths of a percent as the firmware sends it. Each store has its
+own database file, vacuumed after loading. The output is bytes per point
+(whole file, indexes included) and the time to range-scan random
+--window-hour windows of one sensor.
+
+    python utils/bench_block_storage.py [--sensors 6] [--days 30] [--queries 200]
+"""
+
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+# Add the parent directory to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import text
+from sqlalchemy.orm import sessionmaker
+
+import models
+import reading_blocks
+import reading_partitions
+from database import create_db_engine
+
+
+def make_history(sensors: int, days: int, interval: int, start: datetime) -> dict:
+    """{sensor_id: [BlockPoint, ...]}, oldest first."""
+    history = {}
+    count = days * 86400 // interval
+    for sensor_id in range(1, sensors + 1):
+        moisture = random.uniform(40, 80)
+        points = []
+        for i in range(count):
+            ts = start + timedelta(seconds=i * interval, milliseconds=random.randint(-250, 250))
+            # Slow drying, an occasional watering, and sensor noise
+            moisture = 85.0 if random.random() < 1 / 20000 else max(5.0, moisture - random.uniform(0, 0.002))
+            raw_adc = int(3200 - (moisture + random.gauss(0, 0.3)) * 18)
+            points.append(reading_blocks.BlockPoint(
+                reading_blocks._from_ms(reading_blocks._to_ms(ts)),
+                round((3200 - raw_adc) / 18.0, 1),
+                float(raw_adc),
+            ))
+        history[sensor_id] = points
+    return history
+
+
+def file_size(db_engine) -> int:
+    with db_engine.connect() as conn:
+        conn.execute(text("VACUUM"))
+        page_count = conn.execute(text("PRAGMA page_count")).scalar()
+        page_size = conn.execute(text("PRAGMA page_size")).scalar()
+    return page_count * page_size
+
+
+def load_rows(Session, history: dict) -> float:
+    started = time.perf_counter()
+    db = Session()
+    try:
+        for sensor_id, points in history.items():
+            reading_partitions.insert_readings(db, [
+                {"device_id": f"bench-{sensor_id:02d}", "sensor_id": sensor_id, "timestamp": p.timestamp,
+                 "moisture": p.moisture, "raw_adc": p.raw_adc, "boot_id": 1, "seq": seq, "is_demo": False}
+                for seq, p in enumerate(points)
+            ])
+        db.commit()
+    finally:
+        db.close()
+    return time.perf_counter() - started
+
+
+def load_blocks(Session, history: dict) -> float:
+    started = time.perf_counter()
+    db = Session()
+    try:
+        for sensor_id, points in history.items():
+            reading_blocks.write_points(db, sensor_id, points)
+        db.commit()
+    finally:
+        db.close()
+    return time.perf_counter() - started
+
+
+def scan_rows(db, sensor_id: int, start: datetime, end: datetime) -> int:
+    return len(reading_partitions.select_readings(
+        db, lambda t: (t.c.sensor_id == sensor_id,), start_time=start, end_time=end,
+        columns=("timestamp", "moisture", "raw_adc")))
+
+
+def scan_blocks(db, sensor_id: int, start: datetime, end: datetime) -> int:
+    return sum(1 for _ in reading_blocks.scan(db, sensor_id, start, end))
+
+
+def time_scans(Session, scan, windows: list) -> tuple:
+    db = Session()
+    try:
+        points = 0
+        started = time.perf_counter()
+        for sensor_id, start, end in windows:
+            points += scan(db, sensor_id, start, end)
+        return time.perf_counter() - started, points
+    finally:
+        db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sensors", type=int, default=6)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--interval", type=int, default=10, help="seconds between readings")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--window", type=float, default=24, help="hours per range scan")
+    parser.add_argument("--dir", default=None, help="directory for the database files (default: a temp dir)")
+    args = parser.parse_args()
+
+    random.seed(0)
+    start = datetime(2026, 1, 1)
+    history = make_history(args.sensors, args.days, args.interval, start)
+    total = sum(len(points) for points in history.values())
+    span = timedelta(days=args.days) - timedelta(hours=args.window)
+    windows = []
+    for _ in range(args.queries):
+        window_start = start + span * random.random()
+        windows.append((random.randint(1, args.sensors), window_start, window_start + timedelta(hours=args.window)))
+
+    workdir = args.dir or tempfile.mkdtemp(prefix="bench_blocks_")
+    results = []
+    try:
+        for name, load, scan in (("rows", load_rows, scan_rows), ("blocks", load_blocks, scan_blocks)):
+            db_engine = create_db_engine(f"sqlite:///{os.path.join(workdir, name + '.db')}")
+            Session = sessionmaker(autocommit=False, autoflush=False, bind=db_engine)
+            # select_readings also looks for sealed months; an empty table costs a page
+            for table in (models.ReadingBlock.__table__, models.SealedReadingMonth.__table__):
+                table.create(db_engine)
+            load_s = load(Session, history)
+            size = file_size(db_engine)
+            time_scans(Session, scan, windows[:1])  # warm the page cache
+            scan_s, scanned = time_scans(Session, scan, windows)
+            db_engine.dispose()
+            results.append({"name": name, "load_s": load_s, "size": size, "scan_s": scan_s, "scanned": scanned})
+    finally:
+        if args.dir is None:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"{args.sensors} sensors x {args.days} days every {args.interval}s = {total} points; "
+          f"{args.queries} scans of {args.window:g}h, block size {reading_blocks.BLOCK_SECONDS // 60} min")
+    print(f"{'store':<7} {'bytes/pt':>9} {'file MB':>8} {'load s':>7} {'ms/scan':>8} {'Mpts/s':>7}")
+    for r in results:
+        print(f"{r['name']:<7} {r['size'] / total:>9.2f} {r['size'] / 1e6:>8.1f} {r['load_s']:>7.1f} "
+              f"{r['scan_s'] / args.queries * 1000:>8.2f} {r['scanned'] / r['scan_s'] / 1e6:>7.2f}")
+    rows, blocks = results
+    if rows["scanned"] != blocks["scanned"]:
+        print(f"warning: scans returned {rows['scanned']} rows but {blocks['scanned']} block points")
+    print(f"blocks use {blocks['size'] / rows['size']:.2f}x the space, scans take {blocks['scan_s'] / rows['scan_s']:.2f}x the time")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+# bench_concurrency.py
+"""Measure device ingest latency while heavy dashboard and export requests run.
+
+Loads the app in-process against a fresh database seeded with --history days
+of readings and drives it through httpx's ASGI transport, so everything
+shares one event loop, as under uvicorn. A device posts a six-reading
+/readings/batch every --ingest-ms. The run has two phases: ingest alone, then
+ingest alongside --heavy clients looping over /dashboard/summary and
+/readings/export. Each phase reports ingest latency percentiles. A route
+that blocks the event loop shows up directly in the second phase's p99.
+
+    python utils/bench_concurrency.py [--seconds 10] [--heavy 4] [--history 30]
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+# Add the parent directory to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+PINS = [32, 33, 34, 35, 36, 39]
+
+
+def seed(history_days: int, interval: int) -> list:
+    import crud
+    import models
+    import reading_partitions
+    from database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        now = datetime.now(timezone.utc)
+        db.add(models.Device(device_id="bench-00", name="bench-00", last_seen=now))
+        sensor_ids, rows = [], []
+        for pin in PINS:
+            sensor = models.Sensor(device_id="bench-00", sensor_id=pin)
+            db.add(sensor)
+            db.flush()
+            sensor_ids.append(sensor.id)
+            t = now - timedelta(days=history_days)
+            while t < now:
+                rows.append({"device_id": "bench-00", "sensor_id": sensor.id, "moisture": random.uniform(20, 80),
+                             "raw_adc": random.randint(1200, 3200), "timestamp": t})
+                t += timedelta(seconds=interval)
+        reading_partitions.insert_readings(db, rows)
+        db.commit()
+        crud.rebuild_sensor_state(db)
+        crud.refresh_rollups(db)
+        return sensor_ids
+    finally:
+        db.close()
+
+
+def percentiles(latencies: list) -> dict:
+    lat = sorted(latencies)
+    pct = lambda p: lat[min(len(lat) - 1, int(p / 100.0 * len(lat)))] if lat else float("nan")
+    return {"n": len(lat), "p50": statistics.median(lat) if lat else float("nan"), "p95": pct(95), "p99": pct(99),
+            "max": lat[-1] if lat else float("nan")}
+
+
+async def run(args, sensor_ids: list):
+    import httpx
+    import main
+    from auth import create_access_token
+
+    if hasattr(main, "size_db_threads"):
+        await main.size_db_threads()
+    admin = {"Authorization": f"Bearer {create_access_token('admin')}"}
+    device = {"X-Device-Key": os.environ["DEVICE_API_KEY"]}
+    transport = httpx.ASGITransport(app=main.app)
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+        async def ingest(stop: asyncio.Event, latencies: list):
+            while not stop.is_set():
+                body = {"readings": [{"device_id": "bench-00", "sensor_id": pin, "moisture": random.uniform(20, 80),
+                                      "raw_adc": random.randint(1200, 3200)} for pin in PINS]}
+                started = time.perf_counter()
+                r = await client.post("/readings/batch", json=body, headers=device)
+                latencies.append((time.perf_counter() - started) * 1000.0)
+                if r.status_code not in (200, 202):
+                    raise RuntimeError(f"ingest failed: {r.status_code} {r.text}")
+                await asyncio.sleep(args.ingest_ms / 1000.0)
+
+        async def heavy(stop: asyncio.Event, done: list):
+            while not stop.is_set():
+                if random.random() < 0.5:
+                    r = await client.get("/dashboard/summary", headers=admin)
+                else:
+                    r = await client.get(f"/readings/export?sensor_id={random.choice(sensor_ids)}", headers=admin)
+                if r.status_code != 200:
+                    raise RuntimeError(f"heavy request failed: {r.status_code}")
+                done[0] += 1
+
+        results = []
+        for phase, heavy_clients in (("ingest only", 0), (f"+{args.heavy} heavy", args.heavy)):
+            stop = asyncio.Event()
+            latencies, done = [], [0]
+            tasks = [asyncio.create_task(ingest(stop, latencies))]
+            tasks += [asyncio.create_task(heavy(stop, done)) for _ in range(heavy_clients)]
+            await asyncio.sleep(args.seconds)
+            stop.set()
+            await asyncio.gather(*tasks)
+            results.append((phase, percentiles(latencies), done[0] / args.seconds))
+        return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--heavy", type=int, default=4, help="concurrent dashboard/export clients")
+    parser.add_argument("--ingest-ms", type=float, default=50, help="pause between ingest batches")
+    parser.add_argument("--history", type=int, default=30, help="days of seeded readings")
+    parser.add_argument("--interval", type=int, default=60, help="seconds between seeded readings")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_concurrency_")
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    os.environ["READING_ARCHIVE_PATH"] = os.path.join(workdir, "archive")
+    os.environ["INGEST_MODE"] = "sync"
+    for key in ("ADMIN_PASSWORD", "DEPLOY_API_KEY", "DEVICE_API_KEY"):
+        os.environ.setdefault(key, "bench")
+    try:
+        import main as _app  # creates the schema
+        random.seed(0)
+        sensor_ids = seed(args.history, args.interval)
+        results = asyncio.run(run(args, sensor_ids))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"{args.history} days x {len(PINS)} sensors seeded every {args.interval}s, {args.seconds:g}s per phase, "
+          f"ingest every {args.ingest_ms:g} ms")
+    print(f"{'phase':<12} {'batches':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8} {'heavy/s':>8}")
+    for phase, p, heavy_rate in results:
+        print(f"{phase:<12} {p['n']:>8} {p['p50']:>8.1f} {p['p95']:>8.1f} {p['p99']:>8.1f} {p['max']:>8.1f} {heavy_rate:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+# bench_ingest_formats.py
+"""Compare the JSON batch and binary frame ingest formats.
+
+Reports payload size per frame and server-side parse time: JSON decoding plus
+pydantic validation into ReadingBatchCreate (what POST /readings/batch does)
+against wire_format.decode_frame (what POST /readings/binary does). Nothing
+touches the database.
+
+    python utils/bench_ingest_formats.py [--frames 20000] [--sensors 6]
+"""
+
+import argparse
+import json
+import random
+import sys
+import os
+import time
+
+# Add the parent directory to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import schemas
+import wire_format
+
+
+def make_cycle(sensor_count: int):
+    pins = [32, 33, 34, 35, 36, 39]
+    readings = []
+    for i in range(sensor_count):
+        raw = random.randint(1200, 3200)
+        moisture = round(max(0.0, min(100.0, (3200 - raw) / 18.0)), 1)
+        readings.append((pins[i % len(pins)], moisture, raw))
+    return readings
+
+
+def json_payload(device_id: str, boot_id: int, seq: int, readings) -> bytes:
+    # Same shape the firmware sends to /readings/batch
+    frame = [
+        {"device_id": device_id, "sensor_id": sensor_id, "moisture": moisture, "raw_adc": raw_adc,
+         "boot_id": boot_id, "seq": seq}
+        for sensor_id, moisture, raw_adc in readings
+    ]
+    return json.dumps({"readings": frame}).encode()
+
+
+def parse_json(body: bytes):
+    return schemas.ReadingBatchCreate.model_validate(json.loads(body)).readings
+
+
+def parse_binary(body: bytes):
+    return wire_format.decode_frame(body).readings
+
+
+def bench(parse, bodies) -> float:
+    started = time.perf_counter()
+    for body in bodies:
+        parse(body)
+    return (time.perf_counter() - started) / len(bodies) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--frames", type=int, default=20000)
+    parser.add_argument("--sensors", type=int, default=6)
+    parser.add_argument("--device-id", default="esp32-a1b2")
+    args = parser.parse_args()
+
+    random.seed(0)
+    cycles = [make_cycle(args.sensors) for _ in range(args.frames)]
+    boot_id = random.getrandbits(32)
+    json_bodies = [json_payload(args.device_id, boot_id, seq, c) for seq, c in enumerate(cycles)]
+    binary_bodies = [wire_format.encode_frame(args.device_id, boot_id, seq, c) for seq, c in enumerate(cycles)]
+
+    # Both formats must decode to the same readings
+    for j, b in zip(json_bodies[:100], binary_bodies[:100]):
+        assert [r.model_dump() for r in parse_json(j)] == [r._asdict() for r in parse_binary(b)]
+
+    for parse, bodies in ((parse_json, json_bodies), (parse_binary, binary_bodies)):
+        bench(parse, bodies[:1000])  # warm-up
+
+    json_us = bench(parse_json, json_bodies)
+    binary_us = bench(parse_binary, binary_bodies)
+    json_size = sum(len(b) for b in json_bodies) / len(json_bodies)
+    binary_size = sum(len(b) for b in binary_bodies) / len(binary_bodies)
+
+    print(f"{args.frames} frames x {args.sensors} sensors, device_id={args.device_id!r}")
+    print(f"{'format':<8} {'bytes/frame':>12} {'parse us/frame':>15}")
+    print(f"{'json':<8} {json_size:>12.1f} {json_us:>15.2f}")
+    print(f"{'binary':<8} {binary_size:>12.1f} {binary_us:>15.2f}")
+    print(f"binary is {json_size / binary_size:.1f}x smaller and parses {json_us / binary_us:.1f}x faster")
+
+
+if __name__ == "__main__":
+    main()
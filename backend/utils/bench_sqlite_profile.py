@@ -0,0 +1,174 @@
+# bench_sqlite_profile.py
+"""Compare SQLite's default settings against the database.py pragma profile.
+
+Each profile gets a fresh database file seeded with devices, sensors and
+--history days of readings. Writer threads then ingest multi-sensor frames
+through crud.create_readings (one commit per frame, like INGEST_MODE=sync)
+while reader threads build the dashboard summary. The output is ingest
+throughput and dashboard latency percentiles for both profiles.
+
+    python utils/bench_sqlite_profile.py [--seconds 10] [--writers 2] [--readers 4]
+"""
+
+import argparse
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+# Add the parent directory to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import crud
+import models
+import reading_partitions
+import schemas
+from database import Base, SQLITE_PRAGMAS, create_db_engine
+from services.alert_rules import alert_engine
+from services.sensor_cache import sensor_cache
+
+PINS = [32, 33, 34, 35, 36, 39]
+
+
+def seed(Session, devices: int, sensors: int, history_days: int):
+    db = Session()
+    try:
+        db.add(models.SystemConfig())
+        now = datetime.now(timezone.utc)
+        rows = []
+        for d in range(devices):
+            device_id = f"bench-{d:02d}"
+            db.add(models.Device(device_id=device_id, name=device_id, last_seen=now))
+            for pin in PINS[:sensors]:
+                sensor = models.Sensor(device_id=device_id, sensor_id=pin)
+                db.add(sensor)
+                db.flush()
+                t = now - timedelta(days=history_days)
+                while t < now:
+                    rows.append({"device_id": device_id, "sensor_id": sensor.id, "moisture": random.uniform(20, 80),
+                                 "raw_adc": random.randint(1200, 3200), "timestamp": t})
+                    t += timedelta(minutes=5)
+        reading_partitions.insert_readings(db, rows)
+        db.commit()
+        crud.rebuild_sensor_state(db)
+        return len(rows)
+    finally:
+        db.close()
+
+
+def run_profile(name: str, db_engine, args) -> dict:
+    Session = sessionmaker(autocommit=False, autoflush=False, bind=db_engine)
+    Base.metadata.create_all(bind=db_engine)
+    random.seed(0)
+    seeded = seed(Session, args.devices, args.sensors, args.history)
+    sensor_cache.clear()
+    alert_engine.invalidate()
+
+    stop = threading.Event()
+    frames = [0] * args.writers
+    latencies = [[] for _ in range(args.readers)]
+    errors = []
+
+    def writer(i: int):
+        db = Session()
+        try:
+            while not stop.is_set():
+                device_id = f"bench-{random.randrange(args.devices):02d}"
+                batch = [schemas.ReadingCreate(device_id=device_id, sensor_id=pin, moisture=random.uniform(20, 80),
+                                               raw_adc=random.randint(1200, 3200))
+                         for pin in PINS[:args.sensors]]
+                crud.create_readings(db, batch)
+                frames[i] += 1
+        except Exception as e:
+            errors.append(f"writer: {e}")
+        finally:
+            db.close()
+
+    def reader(i: int):
+        try:
+            while not stop.is_set():
+                db = Session()
+                started = time.perf_counter()
+                try:
+                    crud.get_dashboard_summary(db)
+                finally:
+                    db.close()
+                latencies[i].append((time.perf_counter() - started) * 1000.0)
+        except Exception as e:
+            errors.append(f"reader: {e}")
+
+    threads = [threading.Thread(target=writer, args=(i,)) for i in range(args.writers)]
+    threads += [threading.Thread(target=reader, args=(i,)) for i in range(args.readers)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    time.sleep(args.seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+    db_engine.dispose()
+
+    lat = sorted(x for l in latencies for x in l)
+    pct = lambda p: lat[min(len(lat) - 1, int(p / 100.0 * len(lat)))] if lat else float("nan")
+    return {
+        "name": name,
+        "seeded": seeded,
+        "frames_per_s": sum(frames) / elapsed,
+        "dashboards_per_s": len(lat) / elapsed,
+        "p50": statistics.median(lat) if lat else float("nan"),
+        "p95": pct(95),
+        "p99": pct(99),
+        "errors": errors,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--writers", type=int, default=2)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--devices", type=int, default=4)
+    parser.add_argument("--sensors", type=int, default=6)
+    parser.add_argument("--history", type=int, default=7, help="days of seeded readings")
+    parser.add_argument("--dir", default=None, help="directory for the database files (default: a temp dir)")
+    args = parser.parse_args()
+
+    workdir = args.dir or tempfile.mkdtemp(prefix="bench_sqlite_")
+    results = []
+    try:
+        # SQLite defaults, as database.py created the engine before the profile
+        url = f"sqlite:///{os.path.join(workdir, 'default.db')}"
+        results.append(run_profile("default", create_engine(url, connect_args={"check_same_thread": False}), args))
+        url = f"sqlite:///{os.path.join(workdir, 'tuned.db')}"
+        results.append(run_profile("tuned", create_db_engine(url), args))
+    finally:
+        if args.dir is None:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"{args.seconds:g}s, {args.writers} writers x {args.sensors} readings/frame, {args.readers} dashboard readers, "
+          f"{results[0]['seeded']} seeded readings")
+    print("tuned pragmas: " + ", ".join(f"{k}={v}" for k, v in SQLITE_PRAGMAS.items()))
+    print(f"{'profile':<8} {'frames/s':>9} {'dash/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    for r in results:
+        print(f"{r['name']:<8} {r['frames_per_s']:>9.1f} {r['dashboards_per_s']:>8.1f} {r['p50']:>8.2f} "
+              f"{r['p95']:>8.2f} {r['p99']:>8.2f} {len(r['errors']):>7}")
+        for e in r["errors"][:3]:
+            print(f"  {e}")
+    base, tuned = results
+    if base["frames_per_s"] and tuned["frames_per_s"]:
+        print(f"ingest throughput {tuned['frames_per_s'] / base['frames_per_s']:.2f}x")
+    if args.readers and base["dashboards_per_s"] and tuned["dashboards_per_s"]:
+        print(f"dashboard p95 latency {tuned['p95'] / base['p95']:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
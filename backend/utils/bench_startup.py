@@ -0,0 +1,175 @@
+# bench_startup.py
+"""Measure how long the backend takes to answer /ping on a large database.
+
+Builds (or reuses, with --db) a database holding --gb gigabytes of readings
+from --sensors sensors, all inside the raw retention window, so startup has
+no retention to apply. Then it starts uvicorn --runs times against it and
+reports the time from spawning the process to the first successful /ping.
+When the app exposes GET /admin/startup, the app's own ready time and
+per-step timings are printed too.
+
+--app-dir points at another checkout's backend/ directory to compare
+versions on the same file (run them on a copy: older versions seed demo
+data into it).
+
+    python utils/bench_startup.py [--gb 1] [--db /path/keep.db] [--runs 3] [--app-dir ../other/backend]
+"""
+
+import argparse
+import json
+import os
+import random
+import shutil
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from datetime import datetime, timedelta, timezone
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ENV = {"ADMIN_PASSWORD": "bench", "DEPLOY_API_KEY": "bench", "DEVICE_API_KEY": "bench", "JWT_SECRET_KEY": "bench-startup"}
+BYTES_PER_READING = 140  # partition row plus its two indexes, measured with bench_block_storage.py
+
+
+def build_db(path: str, gb: float, sensors: int):
+    """Create the schema with the app's own init_db, then bulk-load readings with sqlite3."""
+    code = (
+        "import sys; sys.path.insert(0, %r)\n"
+        "from database import init_db, upgrade_db; init_db(); upgrade_db()\n" % BACKEND_DIR
+    )
+    subprocess.run([sys.executable, "-c", code], env={**os.environ, **ENV, "DATABASE_URL": f"sqlite:///{path}"},
+                   cwd=BACKEND_DIR, check=True)
+    sys.path.insert(0, BACKEND_DIR)
+    import reading_partitions
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import Session
+
+    total = int(gb * 1e9 / BYTES_PER_READING)
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    # Every reading stays inside the default 90-day raw retention
+    interval = timedelta(days=60) / (total // sensors)
+    start = now - timedelta(days=60)
+
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=OFF")
+    for s in range(1, sensors + 1):
+        conn.execute("INSERT INTO devices (device_id, name, offline_notified, config_version, is_demo) VALUES (?, ?, 0, 1, 0)",
+                     (f"bench-{s:02d}", f"bench-{s:02d}"))
+        conn.execute("INSERT INTO sensors (device_id, sensor_id, auto_log_watering, report_mode, is_demo) VALUES (?, 32, 0, 'interval', 0)",
+                     (f"bench-{s:02d}",))
+    conn.commit()
+
+    engine = create_engine(f"sqlite:///{path}")
+    started = time.perf_counter()
+    t = start
+    batch_ts = []
+    moisture = 60.0
+    while t < now:
+        batch_ts.append(t)
+        t += interval
+        if len(batch_ts) < 20000 and t < now:
+            continue
+        by_key = {}
+        for ts in batch_ts:
+            by_key.setdefault(reading_partitions.month_key(ts), []).append(ts)
+        for key, stamps in by_key.items():
+            with Session(engine) as db:
+                table = reading_partitions.ensure_partition(db, key)
+                db.commit()
+            rows = []
+            for ts in stamps:
+                moisture = min(90.0, max(10.0, moisture + random.uniform(-0.05, 0.05)))
+                iso = ts.isoformat(sep=" ")
+                for s in range(1, sensors + 1):
+                    rows.append((f"bench-{s:02d}", s, iso, round(moisture, 1), 2000.0, 0))
+            conn.executemany(f"INSERT INTO {table.name} (device_id, sensor_id, timestamp, moisture, raw_adc, is_demo) "
+                             f"VALUES (?, ?, ?, ?, ?, ?)", rows)
+            conn.commit()  # before the next ensure_partition, which writes through the engine
+        batch_ts = []
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    conn.close()
+    engine.dispose()
+    print(f"built {os.path.getsize(path) / 1e9:.2f} GB in {time.perf_counter() - started:.0f} s")
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def admin_token(app_dir: str) -> str:
+    code = "import sys; sys.path.insert(0, %r); import auth; print(auth.create_access_token('admin'))" % app_dir
+    out = subprocess.run([sys.executable, "-c", code], env={**os.environ, **ENV}, cwd=app_dir,
+                         capture_output=True, text=True, check=True)
+    return out.stdout.strip().splitlines()[-1]
+
+
+def start_once(app_dir: str, db_path: str, token: str) -> dict:
+    port = free_port()
+    env = {**os.environ, **ENV, "DATABASE_URL": f"sqlite:///{db_path}", "READING_ARCHIVE_PATH": ""}
+    started = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+                            cwd=app_dir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while True:
+            if proc.poll() is not None:
+                raise RuntimeError(f"server exited with {proc.returncode}")
+            try:
+                urllib.request.urlopen(f"http://127.0.0.1:{port}/ping", timeout=1)
+                break
+            except (urllib.error.URLError, ConnectionError):
+                time.sleep(0.01)
+        result = {"ping_s": time.perf_counter() - started, "report": None}
+        request = urllib.request.Request(f"http://127.0.0.1:{port}/admin/startup", headers={"Authorization": f"Bearer {token}"})
+        try:
+            result["report"] = json.load(urllib.request.urlopen(request, timeout=5))
+        except urllib.error.HTTPError:
+            pass  # versions without the startup report
+        return result
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--gb", type=float, default=1.0, help="approximate size of the readings to generate")
+    parser.add_argument("--sensors", type=int, default=12)
+    parser.add_argument("--db", default=None, help="database file to build or reuse (default: a temp file)")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--app-dir", default=BACKEND_DIR, help="backend directory to start (default: this one)")
+    args = parser.parse_args()
+
+    workdir = None
+    db_path = args.db
+    if db_path is None:
+        workdir = tempfile.mkdtemp(prefix="bench_startup_")
+        db_path = os.path.join(workdir, "startup.db")
+    try:
+        if not os.path.exists(db_path):
+            random.seed(0)
+            build_db(db_path, args.gb, args.sensors)
+        app_dir = os.path.abspath(args.app_dir)
+        token = admin_token(app_dir)
+        print(f"{app_dir} on {db_path} ({os.path.getsize(db_path) / 1e9:.2f} GB)")
+        for run in range(1, args.runs + 1):
+            result = start_once(app_dir, db_path, token)
+            line = f"run {run}: first /ping after {result['ping_s'] * 1000:.0f} ms"
+            report = result["report"]
+            if report:
+                steps = ", ".join(f"{p['name']} {p['ms']:.0f}" for p in report["phases"])
+                line += f"; app ready in {report['ready_ms']:.0f} ms ({steps})"
+            print(line)
+    finally:
+        if workdir is not None:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
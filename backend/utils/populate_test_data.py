@@ -9,6 +9,7 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from sqlalchemy.orm import Session
 from database import SessionLocal, engine
 import models
+import reading_partitions
 import schemas
 from datetime import datetime, timedelta, timezone
 import random
@@ -90,15 +91,13 @@ def create_reading(db: Session, reading: schemas.ReadingCreate):
     if not db_sensor:
         raise ValueError("Sensor not found")
 
-    db_reading = models.Reading(
-        device_id=reading.device_id,
-        sensor_id=db_sensor.id,
-        moisture=reading.moisture,
-        timestamp=datetime.now(timezone.utc)
-    )
-    db.add(db_reading)
-    db.flush()
-    return db_reading
+    return reading_partitions.insert_reading(db, {
+        "device_id": reading.device_id,
+        "sensor_id": db_sensor.id,
+        "moisture": reading.moisture,
+        "timestamp": datetime.now(timezone.utc),
+        "is_demo": False,
+    })
 
 def create_alert(db: Session, alert: schemas.AlertCreate):
     db_alert = models.Alert(
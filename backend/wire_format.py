@@ -0,0 +1,167 @@
+# wire_format.py
+"""Compact binary reading frames sent by the ESP32 firmware to POST /readings/binary.
+
+All integers are little-endian. Version 3:
+
+    offset  size  field
+    0       2     magic b"PW"
+    2       1     version (3)
+    3       1     flags (reserved, 0)
+    4       4     boot_id - random per firmware boot
+    8       4     seq - frame counter since boot, wraps at 2**32
+    12      4     timestamp - Unix seconds when the frame was read, 0 if the
+                  device clock isn't NTP-synced yet (server time is used)
+    16      1     n = length of device_id
+    17      n     device_id, UTF-8
+    17+n    1     count of sensor entries
+    18+n    6*c   entries: sensor_id u16, moisture u16 (tenths of a percent),
+                  raw_adc u16 (0xFFFF = not sent)
+
+Frames are self-delimiting, so a request body may hold several of them back
+to back; that's how the firmware drains its offline buffer. Version 2 frames
+(no timestamp) and version 1 frames (no timestamp, no boot_id, so they can't
+be deduplicated) are still accepted. A six-sensor v3 frame is 64 bytes for a
+10-character device id, against about 720 bytes for the equivalent
+/readings/batch JSON.
+"""
+
+import struct
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import NamedTuple, Optional
+
+MAGIC = b"PW"
+VERSION = 3
+RAW_ADC_NONE = 0xFFFF
+MAX_DEVICE_ID_LEN = 64
+MAX_ENTRIES = 255
+MAX_FRAMES_PER_BODY = 256
+
+_PREFIX = struct.Struct("<2sBB")
+_HEADERS = {
+    1: struct.Struct("<IB"),     # seq, dev_len
+    2: struct.Struct("<IIB"),    # boot_id, seq, dev_len
+    3: struct.Struct("<IIIB"),   # boot_id, seq, timestamp, dev_len
+}
+_COUNT = struct.Struct("<B")
+_ENTRY = struct.Struct("<HHH")
+
+MAX_BODY_SIZE = 64 * 1024
+
+
+class FrameError(ValueError):
+    pass
+
+
+class FrameReading(NamedTuple):
+    # Same attributes as schemas.ReadingCreate, which is all crud.create_readings
+    # and the ingest queue use; a tuple is several times cheaper to build than a
+    # pydantic model and the frame layout already guarantees the types.
+    device_id: str
+    sensor_id: int
+    moisture: float
+    raw_adc: Optional[float]
+    boot_id: Optional[int] = None
+    seq: Optional[int] = None
+    timestamp: Optional[datetime] = None
+
+
+@dataclass
+class ReadingFrame:
+    device_id: str
+    boot_id: Optional[int]
+    seq: int
+    timestamp: Optional[datetime]
+    readings: list  # list[FrameReading]
+
+
+def encode_frame(device_id: str, boot_id: int, seq: int, readings, timestamp: int = 0) -> bytes:
+    """Encode [(sensor_id, moisture, raw_adc), ...]; mirrors the firmware encoder."""
+    dev = device_id.encode()
+    parts = [
+        _PREFIX.pack(MAGIC, VERSION, 0),
+        _HEADERS[VERSION].pack(boot_id & 0xFFFFFFFF, seq & 0xFFFFFFFF, timestamp, len(dev)),
+        dev,
+        _COUNT.pack(len(readings)),
+    ]
+    for sensor_id, moisture, raw_adc in readings:
+        parts.append(_ENTRY.pack(
+            sensor_id,
+            int(round(moisture * 10)),
+            RAW_ADC_NONE if raw_adc is None else int(raw_adc),
+        ))
+    return b"".join(parts)
+
+
+def decode_frame(data: bytes) -> ReadingFrame:
+    """Decode a body holding exactly one frame."""
+    frame, end = _decode_at(data, 0)
+    if end != len(data):
+        raise FrameError(f"Frame length does not match {len(frame.readings)} entries")
+    return frame
+
+
+def decode_frames(data: bytes) -> list:
+    """Decode a body of one or more concatenated frames."""
+    if len(data) > MAX_BODY_SIZE:
+        raise FrameError("Body too large")
+    frames = []
+    offset = 0
+    while offset < len(data):
+        if len(frames) >= MAX_FRAMES_PER_BODY:
+            raise FrameError(f"More than {MAX_FRAMES_PER_BODY} frames in one body")
+        frame, offset = _decode_at(data, offset)
+        frames.append(frame)
+    if not frames:
+        raise FrameError("Frame too short")
+    return frames
+
+
+def _decode_at(data: bytes, offset: int):
+    if len(data) < offset + _PREFIX.size:
+        raise FrameError("Frame too short")
+    magic, version, _flags = _PREFIX.unpack_from(data, offset)
+    if magic != MAGIC:
+        raise FrameError("Bad frame magic")
+    header = _HEADERS.get(version)
+    if header is None:
+        raise FrameError(f"Unsupported frame version {version}")
+    offset += _PREFIX.size
+    if len(data) < offset + header.size:
+        raise FrameError("Frame too short")
+    fields = header.unpack_from(data, offset)
+    offset += header.size
+    boot_id, ts = None, 0
+    if version == 1:
+        seq, dev_len = fields
+    elif version == 2:
+        boot_id, seq, dev_len = fields
+    else:
+        boot_id, seq, ts, dev_len = fields
+    if dev_len == 0 or dev_len > MAX_DEVICE_ID_LEN:
+        raise FrameError("Bad device_id length")
+
+    try:
+        device_id = data[offset:offset + dev_len].decode()
+    except UnicodeDecodeError:
+        raise FrameError("device_id is not valid UTF-8")
+    offset += dev_len
+    if len(data) < offset + _COUNT.size:
+        raise FrameError("Frame too short")
+    (count,) = _COUNT.unpack_from(data, offset)
+    offset += _COUNT.size
+    if count == 0:
+        raise FrameError("Frame has no readings")
+    end = offset + count * _ENTRY.size
+    if len(data) < end:
+        raise FrameError(f"Frame length does not match {count} entries")
+
+    timestamp = datetime.fromtimestamp(ts, timezone.utc) if ts else None
+    # Without a boot_id the seq can't identify a retry, so don't stamp it
+    reading_seq = seq if boot_id is not None else None
+    readings = [
+        FrameReading(device_id, sensor_id, moisture / 10.0, None if raw_adc == RAW_ADC_NONE else float(raw_adc),
+                     boot_id, reading_seq, timestamp)
+        for sensor_id, moisture, raw_adc in _ENTRY.iter_unpack(data[offset:end])
+    ]
+    return ReadingFrame(device_id=device_id, boot_id=boot_id, seq=seq, timestamp=timestamp, readings=readings), end
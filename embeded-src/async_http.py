@@ -0,0 +1,94 @@
+"""Minimal HTTP client on asyncio streams.
+
+urequests blocks the whole interpreter until the server answers, which would
+stall sampling and the update server behind a slow backend. This client
+yields to the other tasks while connecting, sending and waiting. It covers
+what the firmware needs: GET/POST with a bytes or JSON body over http:// or
+https://. Requests are HTTP/1.0, so the server closes the connection after
+the response and never uses chunked encoding.
+"""
+
+import asyncio
+import json as jsonlib
+
+
+class Response:
+    """The subset of urequests.Response the firmware uses."""
+
+    def __init__(self, status_code, headers, content):
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+
+    @property
+    def text(self):
+        return self.content.decode()
+
+    def json(self):
+        return jsonlib.loads(self.content)
+
+    def close(self):
+        pass  # the body is already read and the socket closed
+
+
+def _split_url(url):
+    proto, _, rest = url.partition("://")
+    host, _, path = rest.partition("/")
+    port = 443 if proto == "https" else 80
+    if ":" in host:
+        host, port = host.rsplit(":", 1)
+        port = int(port)
+    return proto, host, port, "/" + path
+
+
+async def _request(method, url, headers, body):
+    proto, host, port, path = _split_url(url)
+    reader, writer = await asyncio.open_connection(host, port, ssl=True if proto == "https" else None)
+    try:
+        lines = [f"{method} {path} HTTP/1.0", f"Host: {host}"]
+        for k, v in headers.items():
+            lines.append(f"{k}: {v}")
+        if body is not None:
+            lines.append(f"Content-Length: {len(body)}")
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode())
+        if body:
+            writer.write(body)
+        await writer.drain()
+
+        parts = (await reader.readline()).split(None, 2)
+        if len(parts) < 2:
+            raise OSError("Bad HTTP status line")
+        status = int(parts[1])
+        resp_headers = {}
+        while True:
+            line = await reader.readline()
+            if not line or line == b"\r\n":
+                break
+            k, _, v = line.decode().partition(":")
+            resp_headers[k.strip().lower()] = v.strip()
+
+        chunks = []
+        while True:
+            chunk = await reader.read(512)
+            if not chunk:
+                break
+            chunks.append(chunk)
+        content = b"".join(chunks)
+        length = resp_headers.get("content-length")
+        if length is not None:
+            content = content[:int(length)]
+        return Response(status, resp_headers, content)
+    finally:
+        writer.close()
+        await writer.wait_closed()
+
+
+async def request(method, url, headers=None, data=None, json=None, timeout=10):
+    headers = dict(headers or {})
+    body = data
+    if json is not None:
+        body = jsonlib.dumps(json)
+        headers.setdefault("Content-Type", "application/json")
+    if isinstance(body, str):
+        body = body.encode()
+    return await asyncio.wait_for(_request(method, url, headers, body), timeout)
@@ -1,21 +1,72 @@
 import network  # type: ignore
 import ubinascii  # type: ignore
-import urequests  # type: ignore
 import machine  # type: ignore
+import asyncio
 import time
 import random
 import os
+import struct
+
+import async_http
 
 
 sta_if = network.WLAN(network.STA_IF)
 
 # Server-synced config cache (updated via heartbeat responses)
 server_config = {
+    "config_version": None,  # sent with each heartbeat; the server replies "unchanged" if it still matches
     "reading_interval": None,
-    "sensors": {},  # sensor_id -> {name, calibration_dry, calibration_wet, threshold_min, threshold_max}
+    "sensors": {},  # sensor_id -> {name, calibration_dry, calibration_wet, threshold_min, threshold_max,
+                    #               report_mode, report_deadband, report_max_silence}
 }
 
+# Report-on-change: sensor_id -> (moisture, ticks_ms) of the last value the
+# server accepted or that was written to the offline buffer
+last_reported = {}
+
 HEARTBEAT_INTERVAL = 300  # seconds
+WIFI_CHECK_INTERVAL = 5   # seconds between connection checks
+DISPLAY_REFRESH_MS = 5000  # display pages rotate every 5s
+
+# Binary reading frame, see backend/wire_format.py
+FRAME_MAGIC = b"PW"
+FRAME_VERSION = 3
+FRAME_RAW_NONE = 0xFFFF
+
+# Every frame is stamped with (BOOT_ID, seq); a retried POST resends the same
+# stamp so the backend stores it only once.
+BOOT_ID = struct.unpack("<I", os.urandom(4))[0]
+frame_seq = 0
+
+# Frames carry Unix time once the clock is NTP-synced. MicroPython's epoch is
+# 2000-01-01 on older ESP32 ports.
+UNIX_EPOCH_OFFSET = 946684800 if time.gmtime(0)[0] == 2000 else 0
+NTP_RESYNC_INTERVAL = 6 * 3600  # seconds
+NTP_RETRY_INTERVAL = 60         # seconds, while not synced yet
+time_synced = False
+last_ntp_attempt = None
+
+# Frames that couldn't be uploaded wait here (see offline_buffer.py)
+offline_buffer = None
+
+# Binary frames read before the first NTP sync, as (ticks_ms, frame, marks).
+# They stay in RAM until the clock is set and are then stamped with the wall
+# time they were read at, so a device that boots offline still backfills real
+# timestamps. A reboot before the sync loses them: ticks_ms restarts too.
+unstamped_frames = []
+MAX_UNSTAMPED_FRAMES = 240
+FRAME_TIMESTAMP_OFFSET = 12  # byte offset of the timestamp in a frame
+OFFLINE_DRAIN_SEGMENTS = 4  # segments uploaded per upload pass
+
+# Sampling hands finished frames to the upload task through this queue, so a
+# slow or unreachable server never delays the next reading.
+upload_queue = []
+upload_event = asyncio.Event()
+MAX_QUEUED_FRAMES = 32
+
+# Latest values for the OLED, refreshed by the display task
+display_readings = []
+display_event = asyncio.Event()
 
 
 def get_mac():
@@ -86,11 +137,56 @@ def connect_wifi():
         captive_portal.run_portal()
 
 
-def ensure_wifi():
-    if not sta_if.isconnected():
-        print('WiFi disconnected, reconnecting...')
-        connect_wifi()
-    return sta_if.isconnected()
+def sync_time():
+    """Set the RTC from NTP; readings are only timestamped after this succeeds."""
+    global time_synced, last_ntp_attempt
+    last_ntp_attempt = time.time()
+    try:
+        import ntptime  # type: ignore
+        ntptime.settime()
+        time_synced = True
+        last_ntp_attempt = time.time()
+        print("Clock synced via NTP")
+    except Exception as e:
+        print(f"NTP sync failed: {e}")
+
+
+def maybe_sync_time():
+    if last_ntp_attempt is None:
+        sync_time()
+        return
+    interval = NTP_RESYNC_INTERVAL if time_synced else NTP_RETRY_INTERVAL
+    if time.time() - last_ntp_attempt >= interval:
+        sync_time()
+
+
+def unix_time():
+    """Current Unix time, or 0 if the clock hasn't been synced (server time is used)."""
+    if not time_synced:
+        return 0
+    return time.time() + UNIX_EPOCH_OFFSET
+
+
+async def reconnect_wifi():
+    """Reconnect without blocking the other tasks.
+
+    Unlike connect_wifi() at boot this never falls back to the captive portal;
+    readings keep going to the offline buffer until the network is back.
+    """
+    import config
+    print('WiFi disconnected, reconnecting...')
+    sta_if.active(True)
+    try:
+        sta_if.connect(config.WIFI_SSID, config.WIFI_PASSWORD)
+    except OSError as e:
+        print(f"WiFi connect error: {e}")
+        return False
+    for _ in range(20):
+        if sta_if.isconnected():
+            print('WiFi reconnected')
+            return True
+        await asyncio.sleep_ms(500)
+    return False
 
 
 def get_device_headers():
@@ -102,7 +198,7 @@ def get_device_headers():
     return {}
 
 
-def http_request(method, url, max_retries=3, **kwargs):
+async def http_request(method, url, max_retries=3, **kwargs):
     # Inject device auth headers if not already provided
     headers = kwargs.pop("headers", {}) or {}
     auth_headers = get_device_headers()
@@ -112,31 +208,27 @@ def http_request(method, url, max_retries=3, **kwargs):
     if headers:
         kwargs["headers"] = headers
 
+    if method not in ("GET", "POST"):
+        raise ValueError(f"Unsupported method: {method}")
     for attempt in range(max_retries):
         try:
-            if method == "GET":
-                response = urequests.get(url, **kwargs)
-            elif method == "POST":
-                response = urequests.post(url, **kwargs)
-            else:
-                raise ValueError(f"Unsupported method: {method}")
-            return response
+            return await async_http.request(method, url, **kwargs)
         except Exception as e:
             print(f"HTTP {method} {url} attempt {attempt + 1} failed: {e}")
             if attempt < max_retries - 1:
                 delay = (2 ** attempt) + random.uniform(0, 1)
                 print(f"Retrying in {delay:.1f}s...")
-                time.sleep(delay)
+                await asyncio.sleep(delay)
             else:
                 print(f"All {max_retries} attempts failed for {method} {url}")
                 raise
 
 
-def ping_server():
+async def ping_server():
     import config
     try:
         print(f"Attempting to ping server at {config.SERVER_URL}/ping")
-        response = http_request("GET", config.SERVER_URL + "/ping", timeout=10)
+        response = await http_request("GET", config.SERVER_URL + "/ping", timeout=10)
         print(f"Received response with status code: {response.status_code}")
         if response.status_code == 200:
             print("Server is reachable")
@@ -151,7 +243,7 @@ def ping_server():
         return False
 
 
-def register_with_server():
+async def register_with_server():
     import config
     mac = get_mac()
     ip = get_ip()
@@ -164,7 +256,7 @@ def register_with_server():
         "deploy_token": getattr(config, 'DEPLOY_TOKEN', None),
     }
     try:
-        response = http_request("POST", config.SERVER_URL + "/devices/register_device", json=data)
+        response = await http_request("POST", config.SERVER_URL + "/devices/register_device", json=data)
         if response.status_code == 200:
             device_info = response.json()
             print("Device registered successfully. Device ID:", device_info.get('device_id'))
@@ -202,31 +294,38 @@ def setup_sensors():
     return sensors
 
 
-def read_moisture(adc, samples=10):
-    """Read moisture % from ADC, averaged over multiple samples.
+async def read_raw_adc(sensors, samples=10):
+    """Average `samples` ADC reads per sensor, 10ms apart.
 
-    Returns (percentage, raw_average).
-    Calibration values ADC_DRY / ADC_WET come from config.
+    All sensors are sampled in the same pass, so a cycle takes ~100ms however
+    many sensors are wired, and other tasks run between samples.
     """
-    import config
-    total = 0
+    totals = [0] * len(sensors)
     for _ in range(samples):
-        total += adc.read()
-        time.sleep_ms(10)
-    raw = total // samples
+        for i, s in enumerate(sensors):
+            totals[i] += s["adc"].read()
+        await asyncio.sleep_ms(10)
+    return [total // samples for total in totals]
+
 
+def moisture_from_raw(raw):
+    """Convert a raw ADC average to moisture %.
+
+    Calibration values ADC_DRY / ADC_WET come from config.
+    """
+    import config
     dry_val = getattr(config, 'ADC_DRY', 0)
     wet_val = getattr(config, 'ADC_WET', 1500)
 
     if dry_val == wet_val:
-        return 0.0, raw
+        return 0.0
 
     pct = ((dry_val - raw) / (dry_val - wet_val)) * 100.0
     pct = max(0.0, min(100.0, pct))
-    return round(pct, 1), raw
+    return round(pct, 1)
 
 
-def register_sensor(device_id, sensor_name, sensor_id):
+async def register_sensor(device_id, sensor_name, sensor_id):
     import config
     data = {
         "device_id": device_id,
@@ -234,7 +333,7 @@ def register_sensor(device_id, sensor_name, sensor_id):
         "sensor_id": sensor_id
     }
     try:
-        response = http_request("POST", config.SERVER_URL + "/sensors/", json=data)
+        response = await http_request("POST", config.SERVER_URL + "/sensors/", json=data)
         if response.status_code == 200:
             sensor_info = response.json()
             print(f"Sensor {sensor_name} registered successfully. Sensor ID:", sensor_info.get('id'))
@@ -249,32 +348,190 @@ def register_sensor(device_id, sensor_name, sensor_id):
         return None
 
 
-def send_moisture_reading(device_id, sensor_id, moisture, raw_adc=None):
+def encode_reading_frame(device_id, boot_id, seq, timestamp, readings):
+    """Pack readings into a binary frame (backend/wire_format.py)."""
+    dev = device_id.encode()
+    buf = bytearray(struct.pack("<2sBBIIIB", FRAME_MAGIC, FRAME_VERSION, 0, boot_id, seq & 0xFFFFFFFF, timestamp, len(dev)))
+    buf.extend(dev)
+    buf.append(len(readings))
+    for sensor_id, moisture, raw_adc in readings:
+        raw = FRAME_RAW_NONE if raw_adc is None else int(raw_adc)
+        buf.extend(struct.pack("<HHH", sensor_id, int(moisture * 10 + 0.5), raw))
+    return bytes(buf)
+
+
+async def post_frames(body, max_retries=3):
+    """POST one or more concatenated frames.
+
+    Returns "ok", "retry" (network/server trouble, keep the frames) or
+    "drop" (the server rejected them and always will). Any 4xx but 408 and
+    429 is a drop: an unknown device (404) or a rejected key (401/403) won't
+    accept the same frames later, and retrying them would block the offline
+    buffer behind its head segment forever.
+    """
     import config
-    data = {
-        "device_id": device_id,
-        "sensor_id": sensor_id,
-        "moisture": moisture
-    }
-    if raw_adc is not None:
-        data["raw_adc"] = raw_adc
     try:
-        response = http_request("POST", config.SERVER_URL + "/readings", json=data)
-        print(f"Moisture reading sent for sensor {sensor_id}. Server response:", response.text)
-        response.close()
+        response = await http_request("POST", config.SERVER_URL + "/readings/binary", max_retries=max_retries, data=body,
+                                headers={"Content-Type": "application/octet-stream"})
     except Exception as e:
-        print(f"Error sending moisture reading for sensor {sensor_id}:", str(e))
+        print(f"Error sending readings: {e}")
+        return "retry"
+    status = response.status_code
+    response.close()
+    if status < 300:
+        return "ok"
+    print(f"Server rejected readings. Status code: {status}")
+    if 400 <= status < 500 and status not in (408, 429):
+        return "drop"
+    return "retry"
+
+
+async def drain_offline_buffer():
+    """Upload buffered frames oldest first, one flash segment per POST."""
+    for _ in range(OFFLINE_DRAIN_SEGMENTS):
+        body = offline_buffer.oldest()
+        if body is None:
+            if not offline_buffer.pending():
+                return
+            continue
+        result = await post_frames(body, max_retries=1)
+        if result == "retry":
+            return
+        offline_buffer.drop_oldest()
+        segments, size = offline_buffer.stats()
+        print(f"Uploaded {len(body)} buffered bytes, {segments} segment(s) / {size} bytes left")
+
+
+def queue_readings(device_id, readings, marks):
+    """Stamp one cycle's readings and hand them to the upload task.
+
+    readings = [(sensor_id, moisture, raw_adc), ...]
+    marks = [(sensor_id, calibrated moisture, ticks_ms), ...] for last_reported,
+    applied once the frame is safely uploaded or buffered.
+    The frame is built here so its seq and timestamp reflect when the sensors
+    were read, not when the upload got through.
+    """
+    global frame_seq
+    if not readings:
+        return
+    frame_seq = (frame_seq + 1) & 0xFFFFFFFF
+    if offline_buffer is not None:
+        frame = encode_reading_frame(device_id, BOOT_ID, frame_seq, unix_time(), readings)
+        if not time_synced:
+            unstamped_frames.append((time.ticks_ms(), frame, marks))
+            if len(unstamped_frames) > MAX_UNSTAMPED_FRAMES:
+                unstamped_frames.pop(0)
+                print("Unsynced frame backlog full, dropped oldest frame")
+            return
+        stamp_unsynced_frames()
+        upload_queue.append((frame, marks))
+    else:
+        upload_queue.append(((frame_seq, readings), marks))
+    if len(upload_queue) > MAX_QUEUED_FRAMES:
+        upload_queue.pop(0)
+        print("Upload queue full, dropped oldest frame")
+    upload_event.set()
+
 
+def stamp_unsynced_frames():
+    """Once NTP has synced, give frames read before it their wall time and buffer them.
 
-def send_heartbeat(device_id):
+    They go to the offline buffer rather than the upload queue, which is far
+    smaller, and so stay ahead of every frame read after the sync.
+    """
+    if not time_synced or not unstamped_frames:
+        return
+    now = unix_time()
+    now_ms = time.ticks_ms()
+    for read_ms, frame, marks in unstamped_frames:
+        frame = bytearray(frame)
+        struct.pack_into("<I", frame, FRAME_TIMESTAMP_OFFSET, int(now) - time.ticks_diff(now_ms, read_ms) // 1000)
+        offline_buffer.append(bytes(frame))
+        mark_reported(marks)
+    print(f"Stamped {len(unstamped_frames)} frame(s) read before NTP sync")
+    del unstamped_frames[:]
+    upload_event.set()
+
+
+def mark_reported(marks):
+    """Record values the server has (or will get from the offline buffer)."""
+    for sensor_id, moisture, now_ms in marks:
+        last = last_reported.get(sensor_id)
+        # An older frame finishing late mustn't replace a newer mark
+        if last is None or time.ticks_diff(now_ms, last[1]) >= 0:
+            last_reported[sensor_id] = (moisture, now_ms)
+
+
+async def send_moisture_readings(device_id, frames):
+    """Upload frames queued by the sampling task.
+
+    Binary frames go to /readings/binary in a single body; frames that can't
+    be sent (offline, server down) are kept in the offline buffer and uploaded
+    in bulk once the server is reachable. With config.USE_BINARY_FRAMES False
+    each frame goes to /readings/batch as JSON and is not buffered.
+    """
+    import config
+    online = sta_if.isconnected()
+
+    if offline_buffer is not None:
+        # Queue behind older unsent frames so the server sees them in order
+        if not online or offline_buffer.pending():
+            for body, marks in frames:
+                offline_buffer.append(body)
+                mark_reported(marks)
+        else:
+            result = await post_frames(b"".join(body for body, _ in frames))
+            if result == "ok":
+                for _, marks in frames:
+                    mark_reported(marks)
+                print(f"Sent {len(frames)} frame(s)")
+            elif result == "retry":
+                for body, marks in frames:
+                    offline_buffer.append(body)
+                    mark_reported(marks)
+                print(f"Buffered {len(frames)} frame(s) for later upload")
+                online = False  # don't hit the server again until the next cycle
+        if online and offline_buffer.pending():
+            await drain_offline_buffer()
+        return
+
+    if not online:
+        return
+    # Nothing buffers JSON frames, so a value only counts as reported once the
+    # server has accepted it; until then on_change sensors keep sending it
+    for (seq, readings), marks in frames:
+        frame = []
+        for sensor_id, moisture, raw_adc in readings:
+            data = {
+                "device_id": device_id,
+                "sensor_id": sensor_id,
+                "moisture": moisture,
+                "boot_id": BOOT_ID,
+                "seq": seq
+            }
+            if raw_adc is not None:
+                data["raw_adc"] = raw_adc
+            frame.append(data)
+        try:
+            response = await http_request("POST", config.SERVER_URL + "/readings/batch", json={"readings": frame})
+            print(f"Sent {len(readings)} reading(s). Server status: {response.status_code}")
+            if response.status_code < 300:
+                mark_reported(marks)
+            response.close()
+        except Exception as e:
+            print(f"Error sending {len(readings)} moisture reading(s):", str(e))
+
+
+async def send_heartbeat(device_id):
     import config
     data = {
         "firmware_version": get_firmware_version(),
         "ip_address": get_ip(),
-        "mac_address": get_mac()
+        "mac_address": get_mac(),
+        "config_version": server_config["config_version"]
     }
     try:
-        response = http_request("POST", config.SERVER_URL + f"/devices/{device_id}/heartbeat", json=data)
+        response = await http_request("POST", config.SERVER_URL + f"/devices/{device_id}/heartbeat", json=data)
         if response.status_code == 200:
             print("Heartbeat sent successfully")
             try:
@@ -292,7 +549,7 @@ def send_heartbeat(device_id):
 
 def apply_server_config(heartbeat_data, registered_sensors):
     global server_config
-    if not heartbeat_data:
+    if not heartbeat_data or heartbeat_data.get("unchanged"):
         return
     if "reading_interval" in heartbeat_data:
         server_config["reading_interval"] = heartbeat_data["reading_interval"]
@@ -306,11 +563,36 @@ def apply_server_config(heartbeat_data, registered_sensors):
                 "calibration_wet": sc.get("calibration_wet"),
                 "threshold_min": sc.get("threshold_min"),
                 "threshold_max": sc.get("threshold_max"),
+                "report_mode": sc.get("report_mode", "interval"),
+                "report_deadband": sc.get("report_deadband"),
+                "report_max_silence": sc.get("report_max_silence"),
             }
             # Update sensor name in registered_sensors list
             for s in registered_sensors:
                 if s["sensor_id"] == sid and sc.get("name"):
                     s["server_name"] = sc["name"]
+    # Recorded last so a config that failed to apply is fetched again
+    server_config["config_version"] = heartbeat_data.get("config_version")
+
+
+def should_report(sensor_id, moisture, now_ms):
+    """Whether this cycle's reading should be uploaded.
+
+    Sensors in the server's "on_change" report mode upload only when moisture
+    has moved at least report_deadband since the last upload, or when
+    report_max_silence seconds have passed without one. Sampling continues at
+    reading_interval either way, so a change is still reported promptly.
+    """
+    sc = server_config["sensors"].get(sensor_id)
+    if not sc or sc.get("report_mode") != "on_change":
+        return True
+    last = last_reported.get(sensor_id)
+    if last is None:
+        return True
+    last_moisture, last_ms = last
+    if abs(moisture - last_moisture) >= (sc.get("report_deadband") or 1.0):
+        return True
+    return time.ticks_diff(now_ms, last_ms) >= (sc.get("report_max_silence") or 3600) * 1000
 
 
 def get_reading_interval():
@@ -320,14 +602,143 @@ def get_reading_interval():
     return getattr(config, 'READING_INTERVAL', 10)
 
 
-def main():
+async def sampling_task(device_id, registered_sensors):
+    """Read every sensor on a fixed schedule, whatever the network is doing."""
+    global display_readings
+    next_due = time.ticks_ms()
+    while True:
+        try:
+            raws = await read_raw_adc(registered_sensors)
+            now_ms = time.ticks_ms()
+            readings_data = []
+            frame = []
+            marks = []
+            for s, raw in zip(registered_sensors, raws):
+                moisture = moisture_from_raw(raw)
+                print(f"GPIO{s['pin']}: {moisture}% (raw ADC: {raw})")
+
+                # Compute display moisture using server calibration if available
+                sc = server_config["sensors"].get(s["sensor_id"])
+                display_moisture = moisture
+                if sc and raw is not None and sc.get("calibration_dry") is not None and sc.get("calibration_wet") is not None:
+                    dry = sc["calibration_dry"]
+                    wet = sc["calibration_wet"]
+                    if dry != wet:
+                        display_moisture = max(0.0, min(100.0, round(((dry - raw) / (dry - wet)) * 100.0, 1)))
+
+                # The deadband applies to the calibrated value the server will store
+                if should_report(s["sensor_id"], display_moisture, now_ms):
+                    frame.append((s["sensor_id"], moisture, raw))
+                    marks.append((s["sensor_id"], display_moisture, now_ms))
+
+                # Determine alert state using synced thresholds
+                alert = False
+                if sc:
+                    if sc.get("threshold_min") is not None and display_moisture < sc["threshold_min"]:
+                        alert = True
+                    if sc.get("threshold_max") is not None and display_moisture > sc["threshold_max"]:
+                        alert = True
+
+                display_name = s.get("server_name") or s["name"]
+                readings_data.append({
+                    "name": display_name,
+                    "moisture": display_moisture,
+                    "alert": alert,
+                    "pin": s["pin"],
+                })
+
+            queue_readings(device_id, frame, marks)
+            display_readings = readings_data
+            display_event.set()
+        except Exception as e:
+            print(f"Sampling error: {e}")
+
+        # Schedule from the previous due time rather than from now so the
+        # cadence doesn't drift by the time spent sampling
+        next_due = time.ticks_add(next_due, int(get_reading_interval() * 1000))
+        delay = time.ticks_diff(next_due, time.ticks_ms())
+        if delay < 0:
+            # Fell behind (e.g. the interval was shortened); restart the schedule
+            next_due = time.ticks_ms()
+            delay = 0
+        await asyncio.sleep_ms(delay)
+
+
+async def upload_task(device_id):
+    while True:
+        await upload_event.wait()
+        upload_event.clear()
+        while upload_queue:
+            frames = upload_queue[:]
+            del upload_queue[:]
+            try:
+                await send_moisture_readings(device_id, frames)
+            except Exception as e:
+                print(f"Upload error: {e}")
+
+
+async def heartbeat_task(device_id, registered_sensors):
+    while True:
+        await asyncio.sleep(HEARTBEAT_INTERVAL)
+        if not sta_if.isconnected():
+            continue
+        try:
+            hb_data = await send_heartbeat(device_id)
+            apply_server_config(hb_data, registered_sensors)
+        except Exception as e:
+            print(f"Heartbeat error: {e}")
+
+
+async def wifi_task():
+    while True:
+        try:
+            if not sta_if.isconnected():
+                await reconnect_wifi()
+            if sta_if.isconnected():
+                maybe_sync_time()  # blocks for at most ntptime's 1s timeout
+                stamp_unsynced_frames()
+        except Exception as e:
+            print(f"WiFi task error: {e}")
+        await asyncio.sleep(WIFI_CHECK_INTERVAL)
+
+
+async def display_task(display, device_name):
+    """Redraw on new readings, and every DISPLAY_REFRESH_MS to rotate pages."""
+    while True:
+        try:
+            await asyncio.wait_for_ms(display_event.wait(), DISPLAY_REFRESH_MS)
+        except asyncio.TimeoutError:
+            pass
+        display_event.clear()
+        if display_readings:
+            try:
+                display.show_readings_enhanced(display_readings, device_name)
+            except Exception as e:
+                print(f"Display error: {e}")
+
+
+async def main():
+    global offline_buffer
     import config
     connect_wifi()
     if not sta_if.isconnected():
         print("WiFi connection failed. Exiting.")
         return
 
-    # Start update server for push deploys
+    sync_time()
+    if getattr(config, 'USE_BINARY_FRAMES', True):
+        try:
+            from offline_buffer import OfflineBuffer
+            buffer_kb = getattr(config, 'OFFLINE_BUFFER_KB', 256)
+            offline_buffer = OfflineBuffer(max_segments=buffer_kb // 4, segment_bytes=4096)
+            segments, size = offline_buffer.stats()
+            if segments:
+                print(f"Offline buffer holds {size} bytes in {segments} segment(s) from before reboot")
+        except Exception as e:
+            print(f"Offline buffer not available: {e}")
+
+    # Start update server for push deploys; it serves requests in the
+    # background from here on, including during registration below
     update_srv = None
     try:
         from update_server import UpdateServer
@@ -335,20 +746,20 @@ def main():
         deploy_port = getattr(config, 'DEPLOY_PORT', 8266)
         if deploy_token and deploy_token != "changeme":
             update_srv = UpdateServer(deploy_token, deploy_port)
-            update_srv.start()
+            await update_srv.start()
         else:
             print("WARNING: DEPLOY_TOKEN not set or is default, update server disabled")
     except Exception as e:
         print(f"Could not start update server: {e}")
 
     print("WiFi connected. Waiting 5 seconds before pinging server...")
-    time.sleep(5)
+    await asyncio.sleep(5)
 
-    if not ping_server():
+    if not await ping_server():
         print("Server is not reachable. Exiting.")
         return
 
-    device_id = register_with_server()
+    device_id = await register_with_server()
     if not device_id:
         print("Failed to register device. Exiting.")
         return
@@ -362,7 +773,7 @@ def main():
     # Register each sensor with the backend
     registered_sensors = []
     for s in sensors:
-        sensor_id = register_sensor(device_id, s["name"], s["pin"])
+        sensor_id = await register_sensor(device_id, s["name"], s["pin"])
         if sensor_id:
             registered_sensors.append({
                 "sensor_id": s["pin"],
@@ -388,76 +799,28 @@ def main():
     except Exception as e:
         print(f"Display not available: {e}")
 
-    # Initial config sync via heartbeat before main loop
-    heartbeat_data = send_heartbeat(device_id)
+    # Initial config sync via heartbeat before the tasks start
+    heartbeat_data = await send_heartbeat(device_id)
     apply_server_config(heartbeat_data, registered_sensors)
 
-    last_reading_time = 0
-    last_heartbeat_time = time.time()
-
-    while True:
-        # Check for incoming deploy requests (non-blocking)
-        if update_srv:
-            update_srv.check()
-
-        if not ensure_wifi():
-            time.sleep(5)
-            continue
-
-        current_time = time.time()
-
-        # Send readings at dynamic interval
-        if current_time - last_reading_time >= get_reading_interval():
-            readings_data = []
-            for s in registered_sensors:
-                moisture, raw = read_moisture(s["adc"])
-                print(f"GPIO{s['pin']}: {moisture}% (raw ADC: {raw})")
-                send_moisture_reading(device_id, s["sensor_id"], moisture, raw_adc=raw)
-
-                # Compute display moisture using server calibration if available
-                sc = server_config["sensors"].get(s["sensor_id"])
-                display_moisture = moisture
-                if sc and raw is not None and sc.get("calibration_dry") is not None and sc.get("calibration_wet") is not None:
-                    dry = sc["calibration_dry"]
-                    wet = sc["calibration_wet"]
-                    if dry != wet:
-                        display_moisture = max(0.0, min(100.0, round(((dry - raw) / (dry - wet)) * 100.0, 1)))
-
-                # Determine alert state using synced thresholds
-                alert = False
-                if sc:
-                    if sc.get("threshold_min") is not None and display_moisture < sc["threshold_min"]:
-                        alert = True
-                    if sc.get("threshold_max") is not None and display_moisture > sc["threshold_max"]:
-                        alert = True
-
-                display_name = s.get("server_name") or s["name"]
-                readings_data.append({
-                    "name": display_name,
-                    "moisture": display_moisture,
-                    "alert": alert,
-                    "pin": s["pin"],
-                })
-
-            if display:
-                display.show_readings_enhanced(readings_data, config.DEVICE_NAME)
-
-            last_reading_time = current_time
-
-        # Heartbeat at dedicated interval
-        if current_time - last_heartbeat_time >= HEARTBEAT_INTERVAL:
-            hb_data = send_heartbeat(device_id)
-            apply_server_config(hb_data, registered_sensors)
-            last_heartbeat_time = current_time
-
-        time.sleep(1)
+    # Sampling, uploads, heartbeats, WiFi upkeep and the display each run as
+    # their own task, so a slow server or a push deploy never delays a reading
+    tasks = [
+        sampling_task(device_id, registered_sensors),
+        upload_task(device_id),
+        heartbeat_task(device_id, registered_sensors),
+        wifi_task(),
+    ]
+    if display:
+        tasks.append(display_task(display, config.DEVICE_NAME))
+    await asyncio.gather(*tasks)
 
 
 if __name__ == "__main__":
     try:
         check_factory_reset()
         if is_configured():
-            main()
+            asyncio.run(main())
         else:
             print("Device not configured. Starting captive portal...")
             import captive_portal
@@ -0,0 +1,70 @@
+import os
+
+
+class OfflineBuffer:
+    """Bounded on-flash ring buffer of encoded reading frames.
+
+    Frames that couldn't be uploaded are appended to segment files
+    (rb/<n>.bin) of at most segment_bytes each. Appending never rewrites data
+    already on flash, and a segment is deleted as a whole once the server has
+    accepted it, so wear stays low. When max_segments is reached the oldest
+    segment is dropped to make room.
+
+    Frames are self-delimiting, so a segment is uploaded as-is in a single
+    POST /readings/binary body.
+    """
+
+    DIR = "rb"
+
+    def __init__(self, max_segments=64, segment_bytes=4096):
+        self.max_segments = max(1, max_segments)
+        self.segment_bytes = segment_bytes
+        try:
+            os.mkdir(self.DIR)
+        except OSError:
+            pass  # already exists
+        self.segments = sorted(int(name[:-4]) for name in os.listdir(self.DIR) if name.endswith(".bin"))
+        self.dropped = 0
+
+    def _path(self, segment):
+        return f"{self.DIR}/{segment}.bin"
+
+    def _size(self, segment):
+        try:
+            return os.stat(self._path(segment))[6]
+        except OSError:
+            return 0
+
+    def pending(self):
+        return len(self.segments) > 0
+
+    def append(self, frame):
+        if not self.segments or self._size(self.segments[-1]) + len(frame) > self.segment_bytes:
+            self.segments.append(self.segments[-1] + 1 if self.segments else 0)
+            while len(self.segments) > self.max_segments:
+                self.drop_oldest()
+                self.dropped += 1
+        with open(self._path(self.segments[-1]), "ab") as f:
+            f.write(frame)
+
+    def oldest(self):
+        """Return the oldest segment's frames as one bytes body, or None."""
+        if not self.segments:
+            return None
+        try:
+            with open(self._path(self.segments[0]), "rb") as f:
+                return f.read()
+        except OSError:
+            self.segments.pop(0)
+            return None
+
+    def drop_oldest(self):
+        if not self.segments:
+            return
+        try:
+            os.remove(self._path(self.segments.pop(0)))
+        except OSError:
+            pass
+
+    def stats(self):
+        return len(self.segments), sum(self._size(s) for s in self.segments)
@@ -1,11 +1,12 @@
-import socket
+import asyncio
 import os
 import machine  # type: ignore
 import uhashlib  # type: ignore
 import ubinascii  # type: ignore
-import time
 import json
 
+RECV_TIMEOUT = 10  # seconds without data before a client is dropped
+
 
 def sha256_file(filepath):
     h = uhashlib.sha256()
@@ -27,45 +28,45 @@ def file_exists(path):
 
 
 class UpdateServer:
+    """Push-deploy endpoint (/push, /apply) served as an asyncio task.
+
+    Each request is handled as soon as it arrives, concurrently with sampling
+    and uploads, instead of waiting for the main loop to poll the socket.
+    """
+
     def __init__(self, deploy_token, port=8266):
         self.deploy_token = deploy_token
         self.port = port
-        self.sock = None
-
-    def start(self):
-        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        self.sock.bind(("0.0.0.0", self.port))
-        self.sock.listen(1)
-        self.sock.setblocking(False)
+        self.server = None
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._serve, "0.0.0.0", self.port)
         print(f"Update server listening on port {self.port}")
 
-    def check(self):
-        if not self.sock:
-            return
-        try:
-            cl, addr = self.sock.accept()
-        except OSError:
-            return
+    async def _serve(self, reader, writer):
         try:
-            cl.settimeout(10)
-            self._handle_request(cl)
+            await self._handle_request(reader, writer)
         except Exception as e:
             print(f"Update server error: {e}")
             try:
-                cl.send(b"HTTP/1.1 500 Internal Server Error\r\nConnection: close\r\n\r\n")
+                writer.write(b"HTTP/1.1 500 Internal Server Error\r\nConnection: close\r\n\r\n")
+                await writer.drain()
             except Exception:
                 pass
         finally:
             try:
-                cl.close()
+                writer.close()
+                await writer.wait_closed()
             except Exception:
                 pass
 
-    def _parse_headers(self, cl):
+    async def _recv(self, reader):
+        return await asyncio.wait_for(reader.read(512), RECV_TIMEOUT)
+
+    async def _parse_headers(self, reader):
         raw = b""
         while b"\r\n\r\n" not in raw:
-            chunk = cl.recv(512)
+            chunk = await self._recv(reader)
             if not chunk:
                 break
             raw += chunk
@@ -79,40 +80,41 @@ class UpdateServer:
                 headers[k.strip().lower()] = v.strip()
         return method, path, headers, body_start
 
-    def _send_response(self, cl, status, body=""):
-        cl.send(f"HTTP/1.1 {status}\r\nConnection: close\r\nContent-Length: {len(body)}\r\n\r\n{body}".encode())
+    async def _send_response(self, writer, status, body=""):
+        writer.write(f"HTTP/1.1 {status}\r\nConnection: close\r\nContent-Length: {len(body)}\r\n\r\n{body}".encode())
+        await writer.drain()
 
-    def _handle_request(self, cl):
-        method, path, headers, body_start = self._parse_headers(cl)
+    async def _handle_request(self, reader, writer):
+        method, path, headers, body_start = await self._parse_headers(reader)
 
         if method != "POST":
-            self._send_response(cl, "405 Method Not Allowed")
+            await self._send_response(writer, "405 Method Not Allowed")
             return
 
         token = headers.get("x-deploy-token", "")
         if token != self.deploy_token:
-            self._send_response(cl, "401 Unauthorized", "Bad token")
+            await self._send_response(writer, "401 Unauthorized", "Bad token")
             return
 
         if path == "/push":
-            self._handle_push(cl, headers, body_start)
+            await self._handle_push(reader, writer, headers, body_start)
         elif path == "/apply":
-            self._handle_apply(cl, headers, body_start)
+            await self._handle_apply(reader, writer, headers, body_start)
         else:
-            self._send_response(cl, "404 Not Found")
+            await self._send_response(writer, "404 Not Found")
 
-    def _handle_push(self, cl, headers, body_start):
+    async def _handle_push(self, reader, writer, headers, body_start):
         filename = headers.get("x-filename", "")
         expected_checksum = headers.get("x-checksum", "")
         content_length = int(headers.get("content-length", "0"))
 
         if not filename or not expected_checksum:
-            self._send_response(cl, "400 Bad Request", "Missing filename or checksum header")
+            await self._send_response(writer, "400 Bad Request", "Missing filename or checksum header")
             return
 
         # Protect config.py from being overwritten
         if filename == "config.py":
-            self._send_response(cl, "403 Forbidden", "config.py is protected")
+            await self._send_response(writer, "403 Forbidden", "config.py is protected")
             return
 
         temp_name = filename + ".new"
@@ -123,7 +125,7 @@ class UpdateServer:
                 if body_start:
                     f.write(body_start)
                 while received < content_length:
-                    chunk = cl.recv(512)
+                    chunk = await self._recv(reader)
                     if not chunk:
                         break
                     f.write(chunk)
@@ -132,25 +134,25 @@ class UpdateServer:
             actual_checksum = sha256_file(temp_name)
             if actual_checksum != expected_checksum:
                 os.remove(temp_name)
-                self._send_response(cl, "422 Unprocessable Entity",
-                                    f"Checksum mismatch: expected {expected_checksum}, got {actual_checksum}")
+                await self._send_response(writer, "422 Unprocessable Entity",
+                                          f"Checksum mismatch: expected {expected_checksum}, got {actual_checksum}")
                 return
 
             print(f"Staged {filename} ({received} bytes)")
-            self._send_response(cl, "200 OK", "Staged")
+            await self._send_response(writer, "200 OK", "Staged")
 
         except Exception as e:
             try:
                 os.remove(temp_name)
             except OSError:
                 pass
-            self._send_response(cl, "500 Internal Server Error", str(e))
+            await self._send_response(writer, "500 Internal Server Error", str(e))
 
-    def _handle_apply(self, cl, headers, body_start):
+    async def _handle_apply(self, reader, writer, headers, body_start):
         content_length = int(headers.get("content-length", "0"))
         body = body_start
         while len(body) < content_length:
-            chunk = cl.recv(512)
+            chunk = await self._recv(reader)
             if not chunk:
                 break
             body += chunk
@@ -158,20 +160,20 @@ class UpdateServer:
         try:
             payload = json.loads(body.decode())
         except Exception:
-            self._send_response(cl, "400 Bad Request", "Invalid JSON")
+            await self._send_response(writer, "400 Bad Request", "Invalid JSON")
             return
 
         commit = payload.get("commit", "unknown")
         files = payload.get("files", [])
 
         if not files:
-            self._send_response(cl, "400 Bad Request", "No files listed")
+            await self._send_response(writer, "400 Bad Request", "No files listed")
             return
 
         # Verify all .new files exist
         for filename in files:
             if not file_exists(filename + ".new"):
-                self._send_response(cl, "400 Bad Request", f"Missing staged file: {filename}.new")
+                await self._send_response(writer, "400 Bad Request", f"Missing staged file: {filename}.new")
                 return
 
         # Backup originals, swap in new files
@@ -198,9 +200,9 @@ class UpdateServer:
                     pass
 
             print(f"Deploy applied: {commit} ({len(files)} files)")
-            self._send_response(cl, "200 OK", "Applied, rebooting")
+            await self._send_response(writer, "200 OK", "Applied, rebooting")
 
-            time.sleep(1)
+            await asyncio.sleep(1)
             machine.reset()
 
         except Exception as e:
@@ -220,4 +222,4 @@ class UpdateServer:
                     os.remove(filename + ".new")
                 except OSError:
                     pass
-            self._send_response(cl, "500 Internal Server Error", str(e))
+            await self._send_response(writer, "500 Internal Server Error", str(e))
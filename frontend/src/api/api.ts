@@ -1,5 +1,5 @@
 import axios from 'axios';
-import { Device, Sensor, Reading, Alert, Threshold, SensorUpdate, CalibrationData, LatestRawReading, Zone, DashboardSummary, SystemConfig, SystemConfigUpdate, WateringLog, WateringLogCreate, AggregatedReadingsResponse, DryingRateResponse, DatabaseStats, HeartbeatLogEntry, SensorHealthIndicator, CompareReadingsResponse } from '../types';
+import { Device, Sensor, Reading, Alert, Threshold, SensorUpdate, CalibrationData, LatestRawReading, Zone, DashboardSummary, SystemConfig, SystemConfigUpdate, WateringLog, WateringLogCreate, AggregatedReadingsResponse, DryingRateResponse, DatabaseStats, HeartbeatInterval, DeviceUptime, SensorHealthIndicator, CompareReadingsResponse } from '../types';
 import { refreshTokenApi } from './auth';
 
 const API_URL = import.meta.env.VITE_API_URL || 'http://localhost:8000';
@@ -258,11 +258,16 @@ export const getDevice = async (deviceId: string): Promise<Device> => {
   return response.data;
 };
 
-export const getHeartbeatHistory = async (deviceId: string, limit: number = 50): Promise<HeartbeatLogEntry[]> => {
+export const getHeartbeatHistory = async (deviceId: string, limit: number = 50): Promise<HeartbeatInterval[]> => {
   const response = await api.get(`/devices/${deviceId}/heartbeats`, { params: { limit } });
   return response.data;
 };
 
+export const getDeviceUptime = async (deviceId: string, days: number = 30): Promise<DeviceUptime> => {
+  const response = await api.get(`/devices/${deviceId}/uptime`, { params: { days } });
+  return response.data;
+};
+
 // Sensor health
 
 export const getSensorHealth = async (sensorId: number): Promise<SensorHealthIndicator> => {
@@ -302,7 +307,7 @@ export const downloadBackup = async (): Promise<void> => {
   });
   const disposition = response.headers['content-disposition'];
   const filenameMatch = disposition?.match(/filename="?(.+?)"?$/);
-  const filename = filenameMatch?.[1] || 'plant_water_array_backup.db';
+  const filename = filenameMatch?.[1] || 'plant_water_array_backup.db.gz';
   const url = URL.createObjectURL(response.data);
   const link = document.createElement('a');
   link.href = url;
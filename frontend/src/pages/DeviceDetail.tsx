@@ -1,9 +1,10 @@
 import React, { useState, useEffect, useCallback } from 'react';
 import { useParams, Link } from 'react-router-dom';
-import { Device, HeartbeatLogEntry, SensorHealthIndicator } from '../types';
+import { Device, DeviceUptime, HeartbeatInterval, SensorHealthIndicator } from '../types';
 import {
   getDevice,
   getHeartbeatHistory,
+  getDeviceUptime,
   getSensors,
   getSensorsHealthBatch,
   getDashboardSummary,
@@ -45,22 +46,10 @@ function getStatus(lastSeen?: string): { label: string; dotClass: string } {
     : { label: 'Offline', dotClass: 'status-dot--offline' };
 }
 
-function computeUptime(heartbeats: HeartbeatLogEntry[]): string {
-  if (heartbeats.length < 2) return 'N/A';
-  const sorted = [...heartbeats].sort((a, b) => new Date(a.timestamp).getTime() - new Date(b.timestamp).getTime());
-  let totalGapMs = 0;
-  let gapCount = 0;
-  for (let i = 1; i < sorted.length; i++) {
-    const gap = new Date(sorted[i].timestamp).getTime() - new Date(sorted[i - 1].timestamp).getTime();
-    if (gap > 10 * 60 * 1000) {
-      totalGapMs += gap;
-      gapCount++;
-    }
-  }
-  const spanMs = new Date(sorted[sorted.length - 1].timestamp).getTime() - new Date(sorted[0].timestamp).getTime();
-  if (spanMs <= 0) return 'N/A';
-  const uptimePct = Math.max(0, Math.min(100, ((spanMs - totalGapMs) / spanMs) * 100));
-  return `${uptimePct.toFixed(1)}% (${gapCount} gap${gapCount !== 1 ? 's' : ''})`;
+function formatUptime(uptime: DeviceUptime | null): string {
+  if (!uptime || uptime.uptime_percent === null) return 'N/A';
+  const n = uptime.outages;
+  return `${uptime.uptime_percent.toFixed(1)}% (${n} gap${n !== 1 ? 's' : ''})`;
 }
 
 const DeviceDetail: React.FC = () => {
@@ -68,7 +57,8 @@ const DeviceDetail: React.FC = () => {
   const { deviceId } = useParams<{ deviceId: string }>();
   const [device, setDevice] = useState<Device | null>(null);
   const [sensors, setSensors] = useState<Sensor[]>([]);
-  const [heartbeats, setHeartbeats] = useState<HeartbeatLogEntry[]>([]);
+  const [heartbeats, setHeartbeats] = useState<HeartbeatInterval[]>([]);
+  const [uptime, setUptime] = useState<DeviceUptime | null>(null);
   const [healthMap, setHealthMap] = useState<Record<number, SensorHealthIndicator>>({});
   const [moistureMap, setMoistureMap] = useState<Record<number, number | null>>({});
   const [loading, setLoading] = useState(true);
@@ -76,16 +66,18 @@ const DeviceDetail: React.FC = () => {
   const loadData = useCallback(async () => {
     if (!deviceId) return;
     try {
-      const [dev, sensorList, hbs, healthBatch, summary] = await Promise.all([
+      const [dev, sensorList, hbs, up, healthBatch, summary] = await Promise.all([
         getDevice(deviceId),
         getSensors(deviceId),
         getHeartbeatHistory(deviceId),
+        getDeviceUptime(deviceId),
         getSensorsHealthBatch(),
         getDashboardSummary(),
       ]);
       setDevice(dev);
       setSensors(sensorList);
       setHeartbeats(hbs);
+      setUptime(up);
 
       const hm: Record<number, SensorHealthIndicator> = {};
       for (const h of healthBatch) hm[h.sensor_db_id] = h;
@@ -190,8 +182,15 @@ const DeviceDetail: React.FC = () => {
 
   const heartbeatColumns = [
     {
-      Header: 'Timestamp',
-      accessor: 'timestamp',
+      Header: 'From',
+      accessor: 'start_time',
+      Cell: ({ value }: { value: string }) => (
+        <span className="text-sm font-mono text-text-secondary">{formatTimestamp(value)}</span>
+      ),
+    },
+    {
+      Header: 'To',
+      accessor: 'end_time',
       Cell: ({ value }: { value: string }) => (
         <span className="text-sm font-mono text-text-secondary">{formatTimestamp(value)}</span>
       ),
@@ -208,6 +207,11 @@ const DeviceDetail: React.FC = () => {
       Cell: ({ value }: { value: string | null }) =>
         value ? <span className="badge bg-canvas-200 text-text-muted border border-surface-border font-mono">{value}</span> : <span className="text-text-muted">--</span>,
     },
+    {
+      Header: 'Heartbeats',
+      accessor: 'heartbeat_count',
+      Cell: ({ value }: { value: number }) => <span className="data-value text-sm">{value}</span>,
+    },
   ];
 
   return (
@@ -265,8 +269,8 @@ const DeviceDetail: React.FC = () => {
             </span>
           </div>
           <div>
-            <div className="text-text-muted text-xs mb-1">Uptime (from heartbeats)</div>
-            <span className="data-value text-xs">{computeUptime(heartbeats)}</span>
+            <div className="text-text-muted text-xs mb-1">Uptime (30 days)</div>
+            <span className="data-value text-xs">{formatUptime(uptime)}</span>
           </div>
         </div>
       </div>
@@ -352,7 +352,7 @@ const PlantDetail: React.FC = () => {
                 </thead>
                 <tbody>
                   {readings.slice(-20).reverse().map((r) => (
-                    <tr key={r.id} className="border-b border-surface-border/50">
+                    <tr key={r.id ?? r.timestamp} className="border-b border-surface-border/50">
                       <td className="py-1.5 pr-4 text-text-secondary">{formatTimeAgo(r.timestamp)}</td>
                       <td className="text-right py-1.5 pr-4 text-accent">{r.moisture.toFixed(1)}%</td>
                       <td className="text-right py-1.5 text-soil">{r.raw_adc !== null && r.raw_adc !== undefined ? r.raw_adc : '--'}</td>
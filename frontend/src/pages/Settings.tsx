@@ -20,6 +20,7 @@ const Settings: React.FC = () => {
 
   // Retention config state
   const [retentionDraft, setRetentionDraft] = useState('90');
+  const [fineRetentionDraft, setFineRetentionDraft] = useState('365');
   const [retentionSaving, setRetentionSaving] = useState(false);
   const [retentionMsg, setRetentionMsg] = useState<{ type: 'success' | 'error'; text: string } | null>(null);
 
@@ -72,6 +73,7 @@ const Settings: React.FC = () => {
         weather_longitude: c.weather_longitude != null ? String(c.weather_longitude) : '',
       });
       setRetentionDraft(String(c.retention_days));
+      setFineRetentionDraft(String(c.rollup_5m_retention_days));
     } catch {
       setConfigMsg({ type: 'error', text: 'Failed to load system config' });
     }
@@ -203,20 +205,28 @@ const Settings: React.FC = () => {
     }
   };
 
-  const retentionDirty = config !== null && String(config.retention_days) !== retentionDraft;
+  const retentionDirty = config !== null && (
+    String(config.retention_days) !== retentionDraft || String(config.rollup_5m_retention_days) !== fineRetentionDraft
+  );
 
   const handleSaveRetention = async () => {
     const days = parseInt(retentionDraft);
+    const fineDays = parseInt(fineRetentionDraft);
     if (isNaN(days) || days < 7 || days > 365) {
       setRetentionMsg({ type: 'error', text: 'Retention must be 7-365 days' });
       return;
     }
+    if (isNaN(fineDays) || fineDays < days || fineDays > 3650) {
+      setRetentionMsg({ type: 'error', text: '5-minute retention must be between raw retention and 3650 days' });
+      return;
+    }
     setRetentionSaving(true);
     setRetentionMsg(null);
     try {
-      const updated = await updateSystemConfig({ retention_days: days });
+      const updated = await updateSystemConfig({ retention_days: days, rollup_5m_retention_days: fineDays });
       setConfig(updated);
       setRetentionDraft(String(updated.retention_days));
+      setFineRetentionDraft(String(updated.rollup_5m_retention_days));
       setRetentionMsg({ type: 'success', text: 'Retention setting saved' });
     } catch {
       setRetentionMsg({ type: 'error', text: 'Failed to save retention setting' });
@@ -563,7 +573,7 @@ const Settings: React.FC = () => {
           <div className="flex items-center justify-between py-3 border-b border-surface-border">
             <div>
               <div className="text-sm text-text font-medium">Download Backup</div>
-              <div className="text-xs text-text-muted mt-0.5">Safe copy of the database while the system is running</div>
+              <div className="text-xs text-text-muted mt-0.5">Gzip-compressed copy of the database, taken while the system is running</div>
             </div>
             <div className="flex items-center gap-3">
               {backupMsg && (
@@ -574,7 +584,7 @@ const Settings: React.FC = () => {
                 disabled={backupDownloading}
                 className="btn-primary text-sm disabled:opacity-40"
               >
-                {backupDownloading ? 'Downloading...' : 'Download .db'}
+                {backupDownloading ? 'Downloading...' : 'Download .db.gz'}
               </button>
             </div>
           </div>
@@ -583,7 +593,7 @@ const Settings: React.FC = () => {
           <div className="flex items-center justify-between py-3 border-b border-surface-border">
             <div>
               <div className="text-sm text-text font-medium">Auto-Cleanup Retention</div>
-              <div className="text-xs text-text-muted mt-0.5">Readings older than this are deleted on server startup (7-365 days)</div>
+              <div className="text-xs text-text-muted mt-0.5">Raw readings older than this are deleted; charts fall back to aggregates (7-365 days)</div>
             </div>
             <input
               type="number"
@@ -593,6 +603,19 @@ const Settings: React.FC = () => {
               min="7" max="365"
             />
           </div>
+          <div className="flex items-center justify-between py-3 border-b border-surface-border">
+            <div>
+              <div className="text-sm text-text font-medium">5-Minute Aggregate Retention</div>
+              <div className="text-xs text-text-muted mt-0.5">5-minute averages are kept this long; hourly and daily averages are kept forever</div>
+            </div>
+            <input
+              type="number"
+              value={fineRetentionDraft}
+              onChange={(e) => { setFineRetentionDraft(e.target.value); setRetentionMsg(null); }}
+              className="input !w-24 text-right"
+              min="7" max="3650"
+            />
+          </div>
           <div className="flex items-center justify-end">
             <div className="flex items-center gap-3">
               {retentionMsg && (
@@ -40,11 +40,12 @@ export interface Threshold {
 }
 
 export interface Reading {
-  id: number;
+  id: number | null;
   sensor_id: number;
   moisture: number;
   timestamp: string;
   raw_adc?: number | null;
+  bucket_seconds?: number | null;
 }
 
 export interface Alert {
@@ -118,6 +119,7 @@ export interface SystemConfig {
   weather_latitude: number | null;
   weather_longitude: number | null;
   retention_days: number;
+  rollup_5m_retention_days: number;
 }
 
 export interface SystemConfigUpdate {
@@ -130,6 +132,7 @@ export interface SystemConfigUpdate {
   weather_latitude?: number | null;
   weather_longitude?: number | null;
   retention_days?: number;
+  rollup_5m_retention_days?: number;
 }
 
 export interface DatabaseStats {
@@ -170,12 +173,24 @@ export interface AggregatedReadingsResponse {
   data: AggregatedReadingPoint[];
 }
 
-export interface HeartbeatLogEntry {
-  id: number;
+export interface HeartbeatInterval {
   device_id: string;
-  timestamp: string;
+  start_time: string;
+  end_time: string;
   ip_address: string | null;
   firmware_version: string | null;
+  heartbeat_count: number;
+}
+
+export interface DeviceUptime {
+  device_id: string;
+  days: number;
+  since: string | null;
+  uptime_seconds: number;
+  downtime_seconds: number;
+  uptime_percent: number | null;
+  outages: number;
+  longest_outage_seconds: number;
 }
 
 export interface SensorHealthIndicator {
@@ -218,5 +233,6 @@ export interface CompareReadingsResponse {
   sensor_count: number;
   hours: number;
   aggregated: boolean;
+  bucket_seconds: number | null;
   sensors: SensorCompareData[];
 }